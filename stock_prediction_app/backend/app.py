@@ -1,22 +1,122 @@
-from flask import Flask, request, jsonify, session
+from flask import Flask, request, jsonify, session, stream_with_context
 from flask_cors import CORS
-from werkzeug.security import generate_password_hash, check_password_hash
-import sqlite3
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+import math
 import os
 import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from ml_models import StockPredictor
+from events import broadcaster, publish_prediction
+from price_store import store as price_store
+from resampling import RESOLUTIONS
+import ingestion
+import forecast_table
+from forecast_table import ForecastTable, STANDARD_HORIZONS, DB_PATH
+from result_cache import ResultCache, prediction_key, MISS
+from forecast_bands import band_options
+import instrumentation
+from instrumentation import timer, timings, profiles
+import metrics
+import model_registry
+import training_pool
+from rate_limit import RateLimiter, ConcurrencyLimiter, Rejected
+from auth_service import AuthService
+from session_store import create_store, ServerSessionInterface
 
 app = Flask(__name__)
-app.secret_key = 'your-secret-key-here'
+# Signs the session cookie; set STOCK_APP_SECRET_KEY to a random value in production
+app.secret_key = os.environ.get('STOCK_APP_SECRET_KEY', 'your-secret-key-here')
+# Data-only replicas run with LSTM disabled so TensorFlow is never imported
+app.config['LSTM_ENABLED'] = os.environ.get('STOCK_APP_NO_LSTM', '0') != '1'
 CORS(app)
+# Route timings for every request; profiles for requests that ask for one
+instrumentation.init_app(app, lambda: session.get('is_admin'))
+metrics.init_app(app)
+
+# Server-side sessions: the cookie only carries a signed id. The default
+# SQLite store is shared by every worker process and by asgi_app
+session_store = create_store(
+    os.environ.get('STOCK_APP_SESSION_STORE', 'sqlite'),
+    db_path=os.environ.get('STOCK_APP_SESSION_DB', DB_PATH),
+    redis_url=os.environ.get('STOCK_APP_SESSION_REDIS_URL'),
+    ttl=float(os.environ.get('STOCK_APP_SESSION_TTL', '86400')))
+app.session_interface = ServerSessionInterface(session_store)
+
+# Precomputed standard forecasts, kept fresh by forecast_table's scheduler
+forecasts = ForecastTable()
+
+# Recent on-demand predictions, keyed by request and data version
+prediction_cache = ResultCache(
+    max_entries=int(os.environ.get('STOCK_APP_RESULT_CACHE_SIZE', '256')),
+    ttl=float(os.environ.get('STOCK_APP_RESULT_CACHE_TTL', '600')))
+
+# Per-user budget for /api/predict, so one client cannot queue up training
+# for everyone (STOCK_APP_PREDICT_RATE=0 turns it off)
+predict_limiter = RateLimiter(
+    'predict',
+    rate=float(os.environ.get('STOCK_APP_PREDICT_RATE', '1.0')),
+    burst=float(os.environ.get('STOCK_APP_PREDICT_BURST', '20')),
+    db_path=os.environ.get('STOCK_APP_RATE_LIMIT_DB'))
+
+# Model fits running at once in this process; by default half the cores,
+# leaving the rest for the cheap routes
+training_limiter = ConcurrencyLimiter(
+    'training',
+    limit=int(os.environ.get('STOCK_APP_TRAINING_SLOTS', str(max(1, (os.cpu_count() or 1) // 2)))),
+    policy=os.environ.get('STOCK_APP_TRAINING_POLICY', 'queue'),
+    max_queue=int(os.environ.get('STOCK_APP_TRAINING_QUEUE', '16')),
+    max_wait=float(os.environ.get('STOCK_APP_TRAINING_WAIT', '30')))
+
+# Password hashing on its own small pool; the method string sets algorithm
+# and cost (e.g. 'pbkdf2:sha256:600000'), and older hashes are upgraded at login
+auth = AuthService(
+    method=os.environ.get('STOCK_APP_PASSWORD_METHOD', 'scrypt'),
+    threads=int(os.environ.get('STOCK_APP_HASH_THREADS', str(max(1, (os.cpu_count() or 1) // 2)))),
+    max_pending=int(os.environ.get('STOCK_APP_HASH_QUEUE', '64')),
+    cache_ttl=float(os.environ.get('STOCK_APP_AUTH_CACHE_TTL', '300')))
+
+def connect_db():
+    """SQLite connection whose statement latencies are exported to /metrics"""
+    return metrics.connect(DB_PATH)
+
+# Read by /metrics at scrape time
+metrics.describe('cache_lookups_total', 'counter', 'Cache lookups by cache and result')
+metrics.describe('predictions_total', 'counter', 'Predictions served by model and source')
+metrics.describe('queue_depth', 'gauge', 'Items waiting in background work queues')
+metrics.describe('admission_rejected_total', 'counter', 'Requests turned away by admission control')
+metrics.describe('training_slots', 'gauge', 'Model fits running and waiting for a slot')
+metrics.describe('auth_operations_total', 'counter', 'Password hashes, checks, cached checks and rehashes')
+
+def collect_metrics():
+    cache = prediction_cache.stats()
+    for result in ('hits', 'misses', 'coalesced'):
+        yield 'cache_lookups_total', (('cache', 'prediction_result'), ('result', result)), cache[result]
+    yield 'cache_lookups_total', (('cache', 'price_frame'), ('result', 'hits')), price_store.frame_hits
+    yield 'cache_lookups_total', (('cache', 'price_frame'), ('result', 'misses')), price_store.frame_misses
+    yield 'cache_lookups_total', (('cache', 'session'), ('result', 'hits')), session_store.hits
+    yield 'cache_lookups_total', (('cache', 'session'), ('result', 'misses')), session_store.misses
+    for result, count in model_registry.lookups.items():
+        yield 'cache_lookups_total', (('cache', 'model_registry'), ('result', result)), count
+    if ingestion.pipeline is not None:
+        yield 'queue_depth', (('queue', 'ingestion'),), ingestion.pipeline.queue.qsize()
+    if forecast_table.scheduler is not None:
+        yield 'queue_depth', (('queue', 'forecast_jobs'),), forecast_table.scheduler.pending
+    yield 'admission_rejected_total', (('limiter', 'predict_rate'),), predict_limiter.limited
+    yield 'admission_rejected_total', (('limiter', 'training'),), training_limiter.rejected
+    yield 'training_slots', (('state', 'active'),), training_limiter.active
+    yield 'training_slots', (('state', 'waiting'),), training_limiter.waiting
+    yield 'admission_rejected_total', (('limiter', 'auth'),), auth.rejected
+    yield 'admission_rejected_total', (('limiter', 'stream'),), broadcaster.rejected
+    for operation in ('hashes', 'verifications', 'cache_hits', 'rehashes'):
+        yield 'auth_operations_total', (('operation', operation),), getattr(auth, operation)
+
+metrics.register_collector(collect_metrics)
 
 # Database initialization
 def init_db():
-    conn = sqlite3.connect('stock_app.db')
+    conn = connect_db()
     cursor = conn.cursor()
     
     # Users table
@@ -47,8 +147,21 @@ def init_db():
         )
     ''')
     
+    # Indexes for paging through history
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_predictions_user_date
+        ON predictions (user_id, prediction_date)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_predictions_date
+        ON predictions (prediction_date)
+    ''')
+    
+    # Forecasts table
+    forecasts.ensure_schema(conn)
+    
     # Create default admin user
-    admin_password = generate_password_hash('admin123')
+    admin_password = auth.hash_password('admin123')
     cursor.execute('''
         INSERT OR IGNORE INTO users (username, email, password_hash, is_admin)
         VALUES (?, ?, ?, ?)
@@ -68,7 +181,13 @@ def register():
     if not username or not email or not password:
         return jsonify({'error': 'Missing required fields'}), 400
     
-    conn = sqlite3.connect('stock_app.db')
+    # Hash before opening the connection, since this may wait for the pool
+    try:
+        password_hash = auth.hash_password(password)
+    except Rejected as e:
+        return retry_later(str(e), e.retry_after, 503)
+    
+    conn = connect_db()
     cursor = conn.cursor()
     
     # Check if user exists
@@ -78,7 +197,6 @@ def register():
         return jsonify({'error': 'User already exists'}), 400
     
     # Create user
-    password_hash = generate_password_hash(password)
     cursor.execute('''
         INSERT INTO users (username, email, password_hash)
         VALUES (?, ?, ?)
@@ -96,20 +214,39 @@ def login():
     password = data.get('password')
     is_admin = data.get('is_admin', False)
     
-    conn = sqlite3.connect('stock_app.db')
+    conn = connect_db()
     cursor = conn.cursor()
     
-    cursor.execute('SELECT id, username, password_hash, is_admin FROM users WHERE username = ?', (username,))
+    cursor.execute('SELECT id, username, password_hash, is_admin, email, created_at FROM users '
+                   'WHERE username = ?', (username,))
     user = cursor.fetchone()
     conn.close()
     
-    if user and check_password_hash(user[2], password):
+    try:
+        valid, new_hash = auth.verify_password(user[2], password) if user else (False, None)
+    except Rejected as e:
+        return retry_later(str(e), e.retry_after, 503)
+    
+    if valid:
+        if new_hash:
+            # Stored with older hashing parameters; unless it changed meanwhile
+            conn = connect_db()
+            conn.execute('UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?',
+                         (new_hash, user[0], user[2]))
+            conn.commit()
+            conn.close()
+        
         if is_admin and not user[3]:
             return jsonify({'error': 'Access denied: Not an admin'}), 403
         
+        # Fresh session id, so one issued before login is worthless
+        session.clear()
+        session.regenerate()
         session['user_id'] = user[0]
         session['username'] = user[1]
         session['is_admin'] = user[3]
+        # Profile kept with the session, so /api/profile needs no query
+        session['profile'] = {'email': user[4], 'created_at': user[5]}
         
         return jsonify({
             'message': 'Login successful',
@@ -127,6 +264,15 @@ def logout():
     session.clear()
     return jsonify({'message': 'Logout successful'}), 200
 
+@app.route('/api/profile', methods=['GET'])
+def get_profile():
+    """The signed-in user, from the session"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    return jsonify(dict(session.get('profile', {}), id=session['user_id'],
+                        username=session['username'], is_admin=session['is_admin']))
+
 @app.route('/api/change-password', methods=['POST'])
 def change_password():
     if 'user_id' not in session:
@@ -136,21 +282,32 @@ def change_password():
     current_password = data.get('current_password')
     new_password = data.get('new_password')
     
-    conn = sqlite3.connect('stock_app.db')
+    conn = connect_db()
     cursor = conn.cursor()
     
     cursor.execute('SELECT password_hash FROM users WHERE id = ?', (session['user_id'],))
     user = cursor.fetchone()
+    conn.close()
     
-    if user and check_password_hash(user[0], current_password):
-        new_password_hash = generate_password_hash(new_password)
-        cursor.execute('UPDATE users SET password_hash = ? WHERE id = ?', 
-                      (new_password_hash, session['user_id']))
+    try:
+        valid = user and auth.verify_password(user[0], current_password)[0]
+        new_password_hash = auth.hash_password(new_password) if valid else None
+    except Rejected as e:
+        return retry_later(str(e), e.retry_after, 503)
+    
+    if valid:
+        conn = connect_db()
+        conn.execute('UPDATE users SET password_hash = ? WHERE id = ?', 
+                     (new_password_hash, session['user_id']))
         conn.commit()
         conn.close()
+        
+        # Sign out every other session (a stolen one included) and give this
+        # one a new id
+        session_store.delete_user(session['user_id'], keep=session.sid)
+        session.regenerate()
         return jsonify({'message': 'Password changed successfully'}), 200
     
-    conn.close()
     return jsonify({'error': 'Invalid current password'}), 400
 
 # Stock data routes
@@ -160,24 +317,68 @@ def get_companies():
 
 @app.route('/api/stock-data/<company>', methods=['GET'])
 def get_stock_data(company):
+    """Price history with daily returns, RSI and summary statistics
+
+    Optional query parameter resolution (minute, hour, day or week) returns
+    bars aggregated to that size.
+    """
+    resolution = request.args.get('resolution')
+    if resolution is not None and resolution not in RESOLUTIONS:
+        return jsonify({'error': f'Unknown resolution: {resolution}'}), 400
+    
     try:
-        filename = f'../data/{company.lower()}_stock_data.csv'
-        df = pd.read_csv(filename)
-        df['Date'] = pd.to_datetime(df['Date'])
-        
-        # Calculate daily returns and RSI
-        df['Daily_Return'] = df['Close'].pct_change()
-        df['RSI'] = calculate_rsi(df['Close'])
+        # Validators come from the price store, so unchanged data is answered
+        # with 304 Not Modified before any records are built
+        series = price_store.series(company)
+        etag = series.etag
+        last_modified = datetime.fromtimestamp(int(series.modified), tz=timezone.utc)
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains(etag)
+        else:
+            not_modified = (request.if_modified_since is not None
+                            and request.if_modified_since >= last_modified)
+        if not_modified:
+            response = app.response_class(status=304)
+        else:
+            response = jsonify(stock_data_payload(company, resolution))
         
-        return jsonify({
-            'data': df.to_dict('records'),
-            'statistics': {
-                'avg_close': float(df['Close'].mean()),
-                'avg_volume': float(df['Volume'].mean()),
-                'volatility': float(df['Daily_Return'].std()),
-                'latest_price': float(df['Close'].iloc[-1])
-            }
-        })
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.cache_control.no_cache = True
+        return response
+    except ValueError as e:
+        # Resolution finer than the stored bars
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def stock_data_payload(company, resolution=None):
+    """Body of /api/stock-data: bars with daily returns and RSI, and statistics"""
+    df = price_store.frame(company, resolution)
+    
+    # Calculate daily returns and RSI
+    df['Daily_Return'] = df['Close'].pct_change()
+    df['RSI'] = calculate_rsi(df['Close'])
+    
+    return {
+        'data': df.to_dict('records'),
+        'statistics': {
+            'avg_close': float(df['Close'].mean()),
+            'avg_volume': float(df['Volume'].mean()),
+            'volatility': float(df['Daily_Return'].std()),
+            'latest_price': float(df['Close'].iloc[-1])
+        }
+    }
+
+@app.route('/api/indicators/<company>', methods=['GET'])
+def get_indicators(company):
+    """Moving averages, RSI, Bollinger Bands and daily returns per bar"""
+    try:
+        predictor = StockPredictor()
+        return jsonify({'company': company.upper(),
+                        'data': predictor.get_technical_indicators(company)})
+    except FileNotFoundError:
+        return jsonify({'error': f'No data for {company}'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -189,6 +390,56 @@ def calculate_rsi(prices, window=14):
     rsi = 100 - (100 / (1 + rs))
     return rsi
 
+def answer_prediction(company, model_type, days_ahead, resolution=None, bands=None):
+    """Prediction result with its forecast source; may train a model"""
+    # Standard requests are answered from the precomputed table while the
+    # data they were computed from is still current (it has no bands)
+    result, freshness, computed_at = None, 'not_precomputed', None
+    if resolution is None and days_ahead in STANDARD_HORIZONS and not bands:
+        result, freshness, computed_at = forecasts.lookup(company, model_type, days_ahead)
+    
+    source = 'precomputed'
+    if result is None:
+        # Identical requests against the same data share one computation
+        etag = price_store.series(company).etag
+        key = prediction_key(company, model_type, days_ahead, resolution, etag, bands)
+        
+        def train():
+            # Only actual fits take a training slot; hits and waiters don't
+            with training_limiter.slot():
+                return training_pool.predict(company, model_type, days_ahead, resolution, etag,
+                                             bands)
+        
+        result, status = prediction_cache.get_or_compute(key, train)
+        source = 'on_demand' if status == MISS else 'cached'
+    metrics.counters.inc('predictions_total', (('model_type', model_type), ('source', source)))
+    
+    return dict(result, forecast={
+        'source': source,
+        'freshness': freshness,
+        'computed_at': computed_at
+    })
+
+def save_prediction(conn, user_id, company, model_type, days_ahead, resolution, result):
+    """Record a prediction in the user's history"""
+    # days_ahead counts bars of the requested resolution
+    step = timedelta(seconds=RESOLUTIONS[resolution]) if resolution else timedelta(days=1)
+    target_date = datetime.now() + step * days_ahead
+    conn.execute('''
+        INSERT INTO predictions (user_id, company, predicted_price, target_date, model_used, rmse)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (user_id, company, result['predicted_price'], target_date.date(), 
+          model_type, result.get('rmse')))
+    conn.commit()
+
+def retry_later(message, seconds, status):
+    """Error response with a Retry-After header of whole seconds"""
+    retry_after = max(1, math.ceil(seconds))
+    response = jsonify({'error': message, 'retry_after': retry_after})
+    response.status_code = status
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
 # Prediction routes
 @app.route('/api/predict', methods=['POST'])
 def predict_stock():
@@ -199,74 +450,190 @@ def predict_stock():
     company = data.get('company')
     model_type = data.get('model_type', 'LSTM')
     days_ahead = data.get('days_ahead', 5)
+    resolution = data.get('resolution')
+    
+    if resolution is not None and resolution not in RESOLUTIONS:
+        return jsonify({'error': f'Unknown resolution: {resolution}'}), 400
+    
+    if model_type == 'LSTM' and not app.config['LSTM_ENABLED']:
+        return jsonify({'error': 'LSTM predictions are disabled on this server'}), 503
+    
+    # Optional percentile bands from simulated paths
+    bands = None
+    if data.get('bands'):
+        try:
+            bands = band_options(data['bands'], model_type)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    
+    wait = predict_limiter.acquire(session['user_id'])
+    if wait:
+        return retry_later('Too many predictions; please slow down', wait, 429)
     
     try:
-        predictor = StockPredictor()
-        result = predictor.predict(company, model_type, days_ahead)
+        result = answer_prediction(company, model_type, days_ahead, resolution, bands)
         
         # Save prediction to database
-        conn = sqlite3.connect('stock_app.db')
-        cursor = conn.cursor()
+        with timer('db.insert_prediction'):
+            conn = connect_db()
+            save_prediction(conn, session['user_id'], company, model_type, days_ahead,
+                            resolution, result)
+            conn.close()
         
-        target_date = datetime.now() + timedelta(days=days_ahead)
-        cursor.execute('''
-            INSERT INTO predictions (user_id, company, predicted_price, target_date, model_used, rmse)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (session['user_id'], company, result['predicted_price'], target_date.date(), 
-              model_type, result.get('rmse')))
-        
-        conn.commit()
-        conn.close()
+        # Let the user's open streams for this company know the job finished
+        publish_prediction(result, session['user_id'])
         
         return jsonify(result), 200
+    except Rejected as e:
+        return retry_later(str(e), e.retry_after, 503)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/predictions/history', methods=['GET'])
-def get_prediction_history():
+# Live updates
+@app.route('/api/stream', methods=['GET'])
+def stream_events():
+    """Server-Sent Events: new bars, indicator values and finished predictions
+
+    Query parameter companies is a comma-separated list; all companies are
+    streamed when it is omitted.
+    """
     if 'user_id' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
     
-    conn = sqlite3.connect('stock_app.db')
-    cursor = conn.cursor()
-    
-    if session.get('is_admin'):
+    companies = [c for c in request.args.get('companies', '').split(',') if c.strip()]
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    try:
+        subscription = broadcaster.subscribe([c.strip() for c in companies],
+                                             int(last_event_id) if last_event_id.isdigit() else None,
+                                             session['user_id'], bool(session.get('is_admin')))
+    except Rejected as e:
+        return retry_later(str(e), e.retry_after, 503)
+    
+    response = app.response_class(stream_with_context(broadcaster.stream(subscription)),
+                                  mimetype='text/event-stream')
+    response.cache_control.no_cache = True
+    # Stop reverse proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# Sortable history columns, mapped to SQL expressions
+HISTORY_SORT_COLUMNS = {
+    'prediction_date': 'p.prediction_date',
+    'company': 'p.company',
+    'model_used': 'p.model_used',
+    'predicted_price': 'p.predicted_price',
+    'target_date': 'p.target_date',
+    'rmse': 'p.rmse',
+    'username': 'u.username'
+}
+MAX_HISTORY_PAGE_SIZE = 500
+
+def history_query(args, user_id, is_admin):
+    """SQL for a history request's filters, sort and page
+
+    Raises ValueError with the message for the client on bad parameters.
+    """
+    # Filters
+    conditions, params = [], []
+    if not is_admin:
+        # Regular users see only their predictions
+        conditions.append('p.user_id = ?')
+        params.append(user_id)
+    for field in ('company', 'model_used'):
+        value = args.get(field)
+        if value:
+            conditions.append(f'p.{field} = ?')
+            params.append(value)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    
+    # Sorting, with id as a tie-breaker so pages are stable
+    sort = args.get('sort', 'prediction_date')
+    if sort not in HISTORY_SORT_COLUMNS or (sort == 'username' and not is_admin):
+        raise ValueError(f'Cannot sort by {sort}')
+    order = 'ASC' if args.get('order', 'desc').lower() == 'asc' else 'DESC'
+    order_by = f'ORDER BY {HISTORY_SORT_COLUMNS[sort]} {order}, p.id {order}'
+    
+    if is_admin:
         # Admin can see all predictions
-        cursor.execute('''
-            SELECT p.*, u.username 
-            FROM predictions p 
-            JOIN users u ON p.user_id = u.id 
-            ORDER BY p.prediction_date DESC
-        ''')
+        source = 'FROM predictions p JOIN users u ON p.user_id = u.id'
+        select = f'SELECT p.*, u.username {source}'
         columns = ['id', 'user_id', 'company', 'predicted_price', 'actual_price', 
                   'prediction_date', 'target_date', 'model_used', 'rmse', 'username']
     else:
-        # Regular users see only their predictions
-        cursor.execute('''
-            SELECT * FROM predictions 
-            WHERE user_id = ? 
-            ORDER BY prediction_date DESC
-        ''', (session['user_id'],))
+        source = 'FROM predictions p'
+        select = f'SELECT p.* {source}'
         columns = ['id', 'user_id', 'company', 'predicted_price', 'actual_price', 
                   'prediction_date', 'target_date', 'model_used', 'rmse']
     
+    query = {'sql': f'{select} {where} {order_by}', 'params': params, 'columns': columns,
+             'paged': 'limit' in args}
+    if query['paged']:
+        try:
+            limit = min(max(int(args['limit']), 1), MAX_HISTORY_PAGE_SIZE)
+            offset = max(int(args.get('offset', 0)), 0)
+        except ValueError:
+            raise ValueError('limit and offset must be integers')
+        query.update(count_sql=f'SELECT COUNT(*) {source} {where}', limit=limit, offset=offset)
+    return query
+
+def fetch_history(conn, query):
+    """Run a history_query; returns the response body"""
+    cursor = conn.cursor()
+    
+    if query['paged']:
+        cursor.execute(query['count_sql'], query['params'])
+        total = cursor.fetchone()[0]
+        cursor.execute(f"{query['sql']} LIMIT ? OFFSET ?",
+                       query['params'] + [query['limit'], query['offset']])
+    else:
+        cursor.execute(query['sql'], query['params'])
+    
     predictions = cursor.fetchall()
-    conn.close()
     
     result = []
     for pred in predictions:
-        pred_dict = dict(zip(columns, pred))
+        pred_dict = dict(zip(query['columns'], pred))
         result.append(pred_dict)
     
+    if query['paged']:
+        return {'items': result, 'total': total, 'offset': query['offset'],
+                'limit': query['limit']}
+    return result
+
+@app.route('/api/predictions/history', methods=['GET'])
+def get_prediction_history():
+    """Prediction history, optionally filtered, sorted and paged
+
+    Query parameters: company, model_used (filters), sort, order (asc/desc),
+    limit and offset. Without limit the full list is returned as before;
+    with limit the response is {'items', 'total', 'offset', 'limit'}.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    try:
+        query = history_query(request.args, session['user_id'], session.get('is_admin'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    conn = connect_db()
+    result = fetch_history(conn, query)
+    conn.close()
+    
     return jsonify(result)
 
 # Admin routes
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus text exposition of every process's metrics"""
+    return app.response_class(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 @app.route('/api/admin/users', methods=['GET'])
 def get_all_users():
     if not session.get('is_admin'):
         return jsonify({'error': 'Admin access required'}), 403
     
-    conn = sqlite3.connect('stock_app.db')
+    conn = connect_db()
     cursor = conn.cursor()
     
     cursor.execute('SELECT id, username, email, is_admin, created_at FROM users')
@@ -290,7 +657,7 @@ def get_admin_statistics():
     if not session.get('is_admin'):
         return jsonify({'error': 'Admin access required'}), 403
     
-    conn = sqlite3.connect('stock_app.db')
+    conn = connect_db()
     cursor = conn.cursor()
     
     # Get user count
@@ -313,6 +680,123 @@ def get_admin_statistics():
         'predictions_by_company': company_predictions
     })
 
+@app.route('/api/admin/ingestion', methods=['GET'])
+def get_ingestion_statistics():
+    """Throughput and lag of the running ingestion pipeline"""
+    if not session.get('is_admin'):
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    if ingestion.pipeline is None:
+        return jsonify({'running': False})
+    
+    return jsonify(dict(ingestion.pipeline.stats(), running=True))
+
+@app.route('/api/admin/forecasts', methods=['GET'])
+def get_forecast_status():
+    """Freshness of the precomputed forecasts and the scheduler state"""
+    if not session.get('is_admin'):
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    scheduler = forecast_table.scheduler
+    return jsonify({
+        'entries': forecasts.status(),
+        'scheduler': scheduler.stats() if scheduler is not None else None
+    })
+
+@app.route('/api/admin/forecasts/refresh', methods=['POST'])
+def refresh_forecasts():
+    """Recompute stale forecasts now instead of at the next check"""
+    if not session.get('is_admin'):
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    if forecast_table.scheduler is None:
+        return jsonify({'error': 'Forecast precomputation is not enabled on this server'}), 409
+    
+    forecast_table.scheduler.refresh_now()
+    return jsonify({'message': 'Refresh started'}), 202
+
+@app.route('/api/admin/cache-stats', methods=['GET'])
+def get_cache_statistics():
+    """Hit rate and size of the prediction result cache"""
+    if not session.get('is_admin'):
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    return jsonify(prediction_cache.stats())
+
+@app.route('/api/admin/limits', methods=['GET'])
+def get_limit_statistics():
+    """State of the per-user predict budget, the training slots and password hashing"""
+    if not session.get('is_admin'):
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    return jsonify({'predict_rate': predict_limiter.stats(),
+                    'training': training_limiter.stats(),
+                    'auth': auth.stats(),
+                    'streams': broadcaster.stats()})
+
+@app.route('/api/admin/timings', methods=['GET'])
+def get_timings():
+    """Latency histograms for every route and instrumented stage"""
+    if not session.get('is_admin'):
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    return jsonify({
+        'routes': timings.snapshot('route.'),
+        'stages': {name: summary for name, summary in timings.snapshot().items()
+                   if not name.startswith('route.')}
+    })
+
+@app.route('/api/admin/timings/reset', methods=['POST'])
+def reset_timings():
+    if not session.get('is_admin'):
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    timings.reset()
+    return jsonify({'message': 'Timings reset'})
+
+@app.route('/api/admin/profiling', methods=['GET', 'POST'])
+def profiling_settings():
+    """Turn sampled request profiling on or off
+
+    POST {"enabled": true, "sample_rate": 0.1} profiles one request in ten.
+    A single request can always be profiled with the X-Profile: 1 header.
+    """
+    if not session.get('is_admin'):
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    if request.method == 'POST':
+        data = request.get_json() or {}
+        sample_rate = data.get('sample_rate', profiles.sample_rate)
+        if not isinstance(sample_rate, (int, float)) or not 0 < sample_rate <= 1:
+            return jsonify({'error': 'sample_rate must be in (0, 1]'}), 400
+        profiles.enabled = bool(data.get('enabled', profiles.enabled))
+        profiles.sample_rate = float(sample_rate)
+    
+    return jsonify({'enabled': profiles.enabled, 'sample_rate': profiles.sample_rate,
+                    'profiles': profiles.list()})
+
+PROFILE_SORT_KEYS = ('cumulative', 'tottime', 'ncalls')
+
+@app.route('/api/admin/profiles/<int:profile_id>', methods=['GET'])
+def download_profile(profile_id):
+    """A captured profile as a .prof file, or as text with ?format=text"""
+    if not session.get('is_admin'):
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    entry = profiles.get(profile_id)
+    if entry is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    
+    if request.args.get('format') == 'text':
+        sort = request.args.get('sort', 'cumulative')
+        if sort not in PROFILE_SORT_KEYS:
+            return jsonify({'error': f'sort must be one of {", ".join(PROFILE_SORT_KEYS)}'}), 400
+        return app.response_class(profiles.text(entry, sort), mimetype='text/plain')
+    
+    response = app.response_class(profiles.dump(entry), mimetype='application/octet-stream')
+    response.headers['Content-Disposition'] = f'attachment; filename=profile-{profile_id}.prof'
+    return response
+
 if __name__ == '__main__':
     init_db()
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,588 @@
+"""
+Async (ASGI) variant of the API, on Quart.
+
+Serves the same /api/* routes, JSON bodies and session cookies as app.py,
+and shares its database, price store, forecast table and result cache, so
+clients can use either. The event loop itself never blocks:
+
+- SQLite runs on a few database threads, each keeping one connection.
+- pandas/NumPy work and model calls run on a CPU pool, password hashing
+  on the auth service's own bounded pool.
+- The CPU-heavy routes (predict, indicators and full stock-data bodies)
+  first take a slot from a bounded gate. When its queue is full they
+  answer 503 with Retry-After rather than piling up.
+
+Run it with an ASGI server, e.g. from the backend directory:
+    hypercorn asgi_app:app --bind 0.0.0.0:5000
+The profiling endpoints stay on the Flask app: cProfile follows one thread,
+and a coroutine hops between them.
+"""
+
+import asyncio
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from functools import partial
+
+from quart import Quart, g, request, jsonify, session
+from quart.sessions import SessionInterface
+
+import app as flask_app_module
+import forecast_table
+import ingestion
+import metrics
+from app import (answer_prediction, save_prediction, stock_data_payload, history_query,
+                 fetch_history, connect_db, init_db, forecasts, prediction_cache,
+                 predict_limiter, training_limiter, auth, session_store)
+from events import broadcaster, publish_prediction
+from forecast_bands import band_options
+from instrumentation import timings
+from ml_models import StockPredictor
+from price_store import store as price_store
+from rate_limit import Rejected
+from resampling import RESOLUTIONS
+from session_store import NOT_CACHED
+
+DB_THREADS = int(os.environ.get('STOCK_APP_ASYNC_DB_THREADS', '4'))
+# ThreadPoolExecutor's own default: a few more threads than cores, since
+# NumPy releases the GIL and a prediction may be waiting on the training pool
+CPU_THREADS = int(os.environ.get('STOCK_APP_ASYNC_CPU_THREADS',
+                                 str(min(32, (os.cpu_count() or 1) + 4))))
+# CPU-heavy requests allowed to wait for a slot before new ones get a 503
+CPU_QUEUE = int(os.environ.get('STOCK_APP_ASYNC_CPU_QUEUE', '64'))
+
+app = Quart(__name__)
+# Same key and session store as the Flask app, so either one accepts the
+# other's session cookie (across processes with a shared store)
+app.secret_key = flask_app_module.app.secret_key
+app.config['LSTM_ENABLED'] = flask_app_module.app.config['LSTM_ENABLED']
+# /api/stream stays open until the client leaves
+app.config['RESPONSE_TIMEOUT'] = None
+
+
+class Database:
+    """SQLite calls on a few threads, each holding its own connection"""
+
+    def __init__(self, threads):
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='sqlite')
+        self._local = threading.local()
+
+    def _call(self, fn, args):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = connect_db()
+        return fn(conn, *args)
+
+    async def run(self, fn, *args):
+        """fn(connection, *args) on a database thread"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._call,
+                                                                fn, args)
+
+    async def fetchall(self, sql, params=()):
+        return await self.run(lambda conn: conn.execute(sql, params).fetchall())
+
+    async def fetchone(self, sql, params=()):
+        return await self.run(lambda conn: conn.execute(sql, params).fetchone())
+
+
+class Overloaded(Exception):
+    pass
+
+
+class Gate:
+    """At most slots CPU-heavy requests run at once and queue more may wait"""
+
+    def __init__(self, slots, queue):
+        self.slots = slots
+        self.queue = queue
+        self.waiting = 0
+        self.running = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(slots)
+
+    async def __aenter__(self):
+        if self._semaphore.locked() and self.waiting >= self.queue:
+            self.rejected += 1
+            raise Overloaded()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+
+    async def __aexit__(self, *exc_info):
+        self.running -= 1
+        self._semaphore.release()
+
+    def stats(self):
+        return {'slots': self.slots, 'queue': self.queue, 'running': self.running,
+                'waiting': self.waiting, 'rejected': self.rejected}
+
+
+class AsyncSessionInterface(SessionInterface):
+    """The Flask app's server-side sessions, for Quart
+
+    Sessions in the local cache are read inline; reads and writes that reach
+    a shared backend run on a thread.
+    """
+
+    def __init__(self, interface):
+        self.interface = interface
+
+    async def open_session(self, app, request):
+        sid = self.interface.read_sid(app, request)
+        found = session_store.load(sid, local_only=True) if sid else None
+        if found is NOT_CACHED:
+            found = await asyncio.to_thread(session_store.load, sid)
+        return self.interface.make_session(sid, found)
+
+    async def save_session(self, app, session, response):
+        if self.interface.needs_save(session) and session_store.backend is not None:
+            await asyncio.to_thread(self.interface.save_session, app, session, response)
+        else:
+            self.interface.save_session(app, session, response)
+
+
+db = Database(DB_THREADS)
+cpu_pool = ThreadPoolExecutor(max_workers=CPU_THREADS, thread_name_prefix='cpu')
+cpu_gate = Gate(CPU_THREADS, CPU_QUEUE)
+app.session_interface = AsyncSessionInterface(flask_app_module.app.session_interface)
+
+
+async def run_cpu(fn, *args, **kwargs):
+    """fn on the CPU pool, off the event loop"""
+    return await asyncio.get_running_loop().run_in_executor(cpu_pool, partial(fn, *args, **kwargs))
+
+
+async def json_response(payload):
+    """jsonify, with large bodies serialised on the CPU pool"""
+    return await run_cpu(app.json.response, payload)
+
+
+metrics.describe('cpu_gate', 'gauge', 'CPU-heavy requests running and waiting in the async app')
+
+def collect_metrics():
+    yield 'cpu_gate', (('state', 'running'),), cpu_gate.running
+    yield 'cpu_gate', (('state', 'waiting'),), cpu_gate.waiting
+
+metrics.register_collector(collect_metrics)
+
+@app.before_serving
+async def prepare():
+    await db.run(lambda conn: None)
+    await run_cpu(init_db)
+
+@app.before_request
+async def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+async def record_request(response):
+    # Same route timings and request counts as the Flask app
+    seconds = time.perf_counter() - g.get('request_started', time.perf_counter())
+    rule = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    timings.record(f'route.{request.method} {rule}', seconds)
+    response.headers['Server-Timing'] = f'total;dur={seconds * 1000:.2f}'
+    if metrics.METRICS_DIR is not None:
+        metrics.start()
+    metrics.counters.inc('requests_total', (('method', request.method), ('route', rule),
+                                            ('status', str(response.status_code))))
+    return response
+
+def retry_later(message, seconds, status):
+    """Error response with a Retry-After header of whole seconds"""
+    retry_after = max(1, math.ceil(seconds))
+    response = jsonify({'error': message, 'retry_after': retry_after})
+    response.status_code = status
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+@app.errorhandler(Overloaded)
+async def overloaded(error):
+    return retry_later('Server busy, please retry shortly', 1, 503)
+
+# Authentication routes
+@app.route('/api/register', methods=['POST'])
+async def register():
+    data = await request.get_json()
+    username = data.get('username')
+    email = data.get('email')
+    password = data.get('password')
+
+    if not username or not email or not password:
+        return jsonify({'error': 'Missing required fields'}), 400
+
+    try:
+        password_hash = await asyncio.wrap_future(auth.submit_hash(password))
+    except Rejected as e:
+        return retry_later(str(e), e.retry_after, 503)
+
+    def create_user(conn):
+        # Check if user exists
+        if conn.execute('SELECT id FROM users WHERE username = ? OR email = ?',
+                        (username, email)).fetchone():
+            return False
+        conn.execute('''
+            INSERT INTO users (username, email, password_hash)
+            VALUES (?, ?, ?)
+        ''', (username, email, password_hash))
+        conn.commit()
+        return True
+
+    if not await db.run(create_user):
+        return jsonify({'error': 'User already exists'}), 400
+    return jsonify({'message': 'User registered successfully'}), 201
+
+@app.route('/api/login', methods=['POST'])
+async def login():
+    data = await request.get_json()
+    username = data.get('username')
+    password = data.get('password')
+    is_admin = data.get('is_admin', False)
+
+    user = await db.fetchone('SELECT id, username, password_hash, is_admin, email, created_at '
+                             'FROM users WHERE username = ?', (username,))
+
+    try:
+        valid, new_hash = (await asyncio.wrap_future(auth.submit_verify(user[2], password))
+                           if user else (False, None))
+    except Rejected as e:
+        return retry_later(str(e), e.retry_after, 503)
+
+    if valid:
+        if new_hash:
+            # Stored with older hashing parameters; unless it changed meanwhile
+            def rehash(conn):
+                conn.execute('UPDATE users SET password_hash = ? WHERE id = ? '
+                             'AND password_hash = ?', (new_hash, user[0], user[2]))
+                conn.commit()
+
+            await db.run(rehash)
+
+        if is_admin and not user[3]:
+            return jsonify({'error': 'Access denied: Not an admin'}), 403
+
+        # Fresh session id, so one issued before login is worthless
+        session.clear()
+        session.regenerate()
+        session['user_id'] = user[0]
+        session['username'] = user[1]
+        session['is_admin'] = user[3]
+        session['profile'] = {'email': user[4], 'created_at': user[5]}
+
+        return jsonify({
+            'message': 'Login successful',
+            'user': {
+                'id': user[0],
+                'username': user[1],
+                'is_admin': user[3]
+            }
+        }), 200
+
+    return jsonify({'error': 'Invalid credentials'}), 401
+
+@app.route('/api/logout', methods=['POST'])
+async def logout():
+    session.clear()
+    return jsonify({'message': 'Logout successful'}), 200
+
+@app.route('/api/profile', methods=['GET'])
+async def get_profile():
+    """The signed-in user, from the session"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    return jsonify(dict(session.get('profile', {}), id=session['user_id'],
+                        username=session['username'], is_admin=session['is_admin']))
+
+@app.route('/api/change-password', methods=['POST'])
+async def change_password():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    data = await request.get_json()
+    current_password = data.get('current_password')
+    new_password = data.get('new_password')
+    user_id = session['user_id']
+
+    user = await db.fetchone('SELECT password_hash FROM users WHERE id = ?', (user_id,))
+    try:
+        valid = user and (await asyncio.wrap_future(
+            auth.submit_verify(user[0], current_password)))[0]
+        new_password_hash = (await asyncio.wrap_future(auth.submit_hash(new_password))
+                             if valid else None)
+    except Rejected as e:
+        return retry_later(str(e), e.retry_after, 503)
+
+    if valid:
+        def update(conn):
+            conn.execute('UPDATE users SET password_hash = ? WHERE id = ?',
+                         (new_password_hash, user_id))
+            conn.commit()
+
+        await db.run(update)
+
+        # Sign out every other session (a stolen one included) and give this
+        # one a new id
+        await asyncio.to_thread(session_store.delete_user, user_id, session.sid)
+        session.regenerate()
+        return jsonify({'message': 'Password changed successfully'}), 200
+
+    return jsonify({'error': 'Invalid current password'}), 400
+
+# Stock data routes
+@app.route('/api/companies', methods=['GET'])
+async def get_companies():
+    return jsonify(['TCS', 'WIPRO', 'INFOSYS'])
+
+@app.route('/api/stock-data/<company>', methods=['GET'])
+async def get_stock_data(company):
+    """Price history with daily returns, RSI and summary statistics"""
+    resolution = request.args.get('resolution')
+    if resolution is not None and resolution not in RESOLUTIONS:
+        return jsonify({'error': f'Unknown resolution: {resolution}'}), 400
+
+    try:
+        # The first request for a company reads its CSV
+        series = await run_cpu(price_store.series, company)
+        etag = series.etag
+        last_modified = datetime.fromtimestamp(int(series.modified), tz=timezone.utc)
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains(etag)
+        else:
+            not_modified = (request.if_modified_since is not None
+                            and request.if_modified_since >= last_modified)
+        if not_modified:
+            response = app.response_class('', status=304)
+        else:
+            async with cpu_gate:
+                payload = await run_cpu(stock_data_payload, company, resolution)
+                response = await json_response(payload)
+
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.cache_control.no_cache = True
+        return response
+    except ValueError as e:
+        # Resolution finer than the stored bars
+        return jsonify({'error': str(e)}), 400
+    except Overloaded:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/indicators/<company>', methods=['GET'])
+async def get_indicators(company):
+    """Moving averages, RSI, Bollinger Bands and daily returns per bar"""
+    try:
+        async with cpu_gate:
+            data = await run_cpu(StockPredictor().get_technical_indicators, company)
+            return await json_response({'company': company.upper(), 'data': data})
+    except FileNotFoundError:
+        return jsonify({'error': f'No data for {company}'}), 404
+    except Overloaded:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Prediction routes
+@app.route('/api/predict', methods=['POST'])
+async def predict_stock():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    data = await request.get_json()
+    company = data.get('company')
+    model_type = data.get('model_type', 'LSTM')
+    days_ahead = data.get('days_ahead', 5)
+    resolution = data.get('resolution')
+    user_id = session['user_id']
+
+    if resolution is not None and resolution not in RESOLUTIONS:
+        return jsonify({'error': f'Unknown resolution: {resolution}'}), 400
+
+    if model_type == 'LSTM' and not app.config['LSTM_ENABLED']:
+        return jsonify({'error': 'LSTM predictions are disabled on this server'}), 503
+
+    # Optional percentile bands from simulated paths
+    bands = None
+    if data.get('bands'):
+        try:
+            bands = band_options(data['bands'], model_type)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+    wait = predict_limiter.acquire(user_id)
+    if wait:
+        return retry_later('Too many predictions; please slow down', wait, 429)
+
+    try:
+        async with cpu_gate:
+            result = await run_cpu(answer_prediction, company, model_type, days_ahead,
+                                   resolution, bands)
+
+        # Save prediction to database
+        await db.run(save_prediction, user_id, company, model_type, days_ahead, resolution,
+                     result)
+
+        # Let the user's open streams for this company know the job finished
+        publish_prediction(result, user_id)
+
+        return jsonify(result), 200
+    except Overloaded:
+        raise
+    except Rejected as e:
+        return retry_later(str(e), e.retry_after, 503)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Live updates
+@app.route('/api/stream', methods=['GET'])
+async def stream_events():
+    """Server-Sent Events: new bars, indicator values and finished predictions"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    companies = [c for c in request.args.get('companies', '').split(',') if c.strip()]
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    try:
+        subscription = broadcaster.subscribe([c.strip() for c in companies],
+                                             int(last_event_id) if last_event_id.isdigit() else None,
+                                             session['user_id'], bool(session.get('is_admin')))
+    except Rejected as e:
+        return retry_later(str(e), e.retry_after, 503)
+
+    response = app.response_class(broadcaster.astream(subscription),
+                                  mimetype='text/event-stream')
+    response.timeout = None
+    response.cache_control.no_cache = True
+    # Stop reverse proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/predictions/history', methods=['GET'])
+async def get_prediction_history():
+    """Prediction history, optionally filtered, sorted and paged"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    try:
+        query = history_query(request.args, session['user_id'], session.get('is_admin'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return await json_response(await db.run(fetch_history, query))
+
+# Admin routes
+@app.route('/metrics', methods=['GET'])
+async def get_metrics():
+    """Prometheus text exposition of every process's metrics"""
+    return app.response_class(await run_cpu(metrics.render), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/api/admin/users', methods=['GET'])
+async def get_all_users():
+    if not session.get('is_admin'):
+        return jsonify({'error': 'Admin access required'}), 403
+
+    users = await db.fetchall('SELECT id, username, email, is_admin, created_at FROM users')
+    return await json_response([{
+        'id': user[0],
+        'username': user[1],
+        'email': user[2],
+        'is_admin': user[3],
+        'created_at': user[4]
+    } for user in users])
+
+@app.route('/api/admin/statistics', methods=['GET'])
+async def get_admin_statistics():
+    if not session.get('is_admin'):
+        return jsonify({'error': 'Admin access required'}), 403
+
+    def statistics(conn):
+        return {
+            'total_users': conn.execute('SELECT COUNT(*) FROM users '
+                                        'WHERE is_admin = FALSE').fetchone()[0],
+            'total_predictions': conn.execute('SELECT COUNT(*) FROM predictions').fetchone()[0],
+            'predictions_by_company': dict(conn.execute(
+                'SELECT company, COUNT(*) FROM predictions GROUP BY company').fetchall())
+        }
+
+    return jsonify(await db.run(statistics))
+
+@app.route('/api/admin/ingestion', methods=['GET'])
+async def get_ingestion_statistics():
+    """Throughput and lag of the running ingestion pipeline"""
+    if not session.get('is_admin'):
+        return jsonify({'error': 'Admin access required'}), 403
+
+    if ingestion.pipeline is None:
+        return jsonify({'running': False})
+
+    return jsonify(dict(ingestion.pipeline.stats(), running=True))
+
+@app.route('/api/admin/forecasts', methods=['GET'])
+async def get_forecast_status():
+    """Freshness of the precomputed forecasts and the scheduler state"""
+    if not session.get('is_admin'):
+        return jsonify({'error': 'Admin access required'}), 403
+
+    scheduler = forecast_table.scheduler
+    return jsonify({
+        'entries': await run_cpu(forecasts.status),
+        'scheduler': scheduler.stats() if scheduler is not None else None
+    })
+
+@app.route('/api/admin/forecasts/refresh', methods=['POST'])
+async def refresh_forecasts():
+    """Recompute stale forecasts now instead of at the next check"""
+    if not session.get('is_admin'):
+        return jsonify({'error': 'Admin access required'}), 403
+
+    if forecast_table.scheduler is None:
+        return jsonify({'error': 'Forecast precomputation is not enabled on this server'}), 409
+
+    forecast_table.scheduler.refresh_now()
+    return jsonify({'message': 'Refresh started'}), 202
+
+@app.route('/api/admin/cache-stats', methods=['GET'])
+async def get_cache_statistics():
+    """Hit rate and size of the prediction result cache, and the CPU gate"""
+    if not session.get('is_admin'):
+        return jsonify({'error': 'Admin access required'}), 403
+
+    return jsonify(dict(prediction_cache.stats(), cpu_gate=cpu_gate.stats()))
+
+@app.route('/api/admin/limits', methods=['GET'])
+async def get_limit_statistics():
+    """State of the per-user predict budget, the training slots and password hashing"""
+    if not session.get('is_admin'):
+        return jsonify({'error': 'Admin access required'}), 403
+
+    return jsonify({'predict_rate': predict_limiter.stats(),
+                    'training': training_limiter.stats(),
+                    'auth': auth.stats(),
+                    'streams': broadcaster.stats()})
+
+@app.route('/api/admin/timings', methods=['GET'])
+async def get_timings():
+    """Latency histograms for every route and instrumented stage"""
+    if not session.get('is_admin'):
+        return jsonify({'error': 'Admin access required'}), 403
+
+    return jsonify({
+        'routes': timings.snapshot('route.'),
+        'stages': {name: summary for name, summary in timings.snapshot().items()
+                   if not name.startswith('route.')}
+    })
+
+@app.route('/api/admin/timings/reset', methods=['POST'])
+async def reset_timings():
+    if not session.get('is_admin'):
+        return jsonify({'error': 'Admin access required'}), 403
+
+    timings.reset()
+    return jsonify({'message': 'Timings reset'})
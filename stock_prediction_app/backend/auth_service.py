@@ -0,0 +1,198 @@
+"""
+Password hashing off the request threads.
+
+The key derivation behind a password hash is slow on purpose, so a burst of
+logins run inline would take every request thread and stall unrelated
+routes. AuthService runs it on a small dedicated pool instead: at most
+`threads` hashes at once and at most `max_pending` more waiting; past that
+callers are turned away with rate_limit.Rejected and a retry estimate.
+hash_password and verify_password still block the calling request thread
+while they wait, so a server with a fixed number of request threads also
+calls limit_waiters, which caps the jobs in flight at a share of those
+threads and leaves the rest for other routes.
+(hashlib's scrypt and PBKDF2 release the GIL, so the pool threads do not
+hold up the rest of the process either.)
+
+The method is a werkzeug method string such as 'scrypt:32768:8:1' or
+'pbkdf2:sha256:600000', so algorithm and cost are set together. A stored
+hash made with other parameters is replaced on the next successful login.
+
+Successful checks are remembered for a short TTL, as an HMAC of the stored
+hash and password under a per-process random key (never the password
+itself), so a client that logs in again or re-enters its password soon
+after does not pay for the derivation twice. A new stored hash (password
+change, rehash) no longer matches the remembered entry.
+"""
+
+import hashlib
+import hmac
+import math
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from rate_limit import Rejected
+
+
+class AuthService:
+    """Bounded pool for password hashing, with rehash and a verified cache"""
+
+    def __init__(self, method='scrypt', threads=1, max_pending=64, cache_ttl=300.0,
+                 cache_size=10000, max_waiters=None):
+        self.method = method
+        self.threads = threads
+        self.max_pending = max_pending
+        # Cap on jobs in flight, i.e. request threads blocked on a result
+        self.max_waiters = max_waiters
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        # Canonical form of method, e.g. 'scrypt' -> 'scrypt:32768:8:1'
+        self._params = None
+        # stored hash -> (monotonic expiry, HMAC of stored hash and password)
+        self._verified = OrderedDict()
+        self._secret = secrets.token_bytes(32)
+        self.hashes = 0
+        self.verifications = 0
+        self.cache_hits = 0
+        self.rehashes = 0
+        self.rejected = 0
+        # Moving average of one job's run time, in seconds
+        self.job_seconds = None
+
+    def _pool(self):
+        """This process's executor; a forked child starts its own"""
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.threads,
+                                                thread_name_prefix='auth')
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    def limit_waiters(self, request_threads, share=0.5):
+        """Let jobs in flight hold at most share of request_threads threads"""
+        self.max_waiters = max(1, int(request_threads * share))
+
+    @property
+    def capacity(self):
+        capacity = self.threads + self.max_pending
+        if self.max_waiters is not None:
+            capacity = min(capacity, self.max_waiters)
+        return capacity
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.capacity:
+                self.rejected += 1
+                job = self.job_seconds if self.job_seconds is not None else 0.1
+                retry_after = max(1, math.ceil(job * self._pending / self.threads))
+                raise Rejected('Too many sign-ins in progress; please retry', retry_after)
+            self._pending += 1
+            executor = self._pool()
+        return executor.submit(self._run, fn, *args)
+
+    def _run(self, fn, *args):
+        started = time.monotonic()
+        try:
+            return fn(*args)
+        finally:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self._pending -= 1
+                self.job_seconds = (elapsed if self.job_seconds is None
+                                    else 0.8 * self.job_seconds + 0.2 * elapsed)
+
+    @property
+    def params(self):
+        if self._params is None:
+            # werkzeug fills in default parameters; one throwaway hash shows them
+            self._params = generate_password_hash('', self.method).split('$', 1)[0]
+        return self._params
+
+    def needs_rehash(self, stored_hash):
+        return stored_hash.split('$', 1)[0] != self.params
+
+    def _digest(self, stored_hash, password):
+        message = f'{stored_hash}\0{password}'.encode('utf-8')
+        return hmac.new(self._secret, message, hashlib.sha256).digest()
+
+    def _remember(self, stored_hash, password):
+        if self.cache_ttl <= 0:
+            return
+        entry = (time.monotonic() + self.cache_ttl, self._digest(stored_hash, password))
+        with self._lock:
+            self._verified[stored_hash] = entry
+            self._verified.move_to_end(stored_hash)
+            while len(self._verified) > self.cache_size:
+                self._verified.popitem(last=False)
+
+    def _remembered(self, stored_hash, password):
+        if self.cache_ttl <= 0:
+            return False
+        with self._lock:
+            entry = self._verified.get(stored_hash)
+            if entry is None:
+                return False
+            if entry[0] <= time.monotonic():
+                del self._verified[stored_hash]
+                return False
+        return hmac.compare_digest(entry[1], self._digest(stored_hash, password))
+
+    def _hash_job(self, password):
+        self.hashes += 1
+        return generate_password_hash(password, self.method)
+
+    def _verify_job(self, stored_hash, password):
+        self.verifications += 1
+        if not check_password_hash(stored_hash, password):
+            return False, None
+        new_hash = None
+        if self.needs_rehash(stored_hash):
+            new_hash = generate_password_hash(password, self.method)
+            self.rehashes += 1
+        self._remember(new_hash or stored_hash, password)
+        return True, new_hash
+
+    def submit_hash(self, password):
+        """Future of a new hash for password; may raise Rejected"""
+        return self._submit(self._hash_job, password)
+
+    def submit_verify(self, stored_hash, password):
+        """Future of (ok, new_hash); may raise Rejected
+
+        new_hash is set when the password was right but stored_hash used
+        other parameters, and should replace it.
+        """
+        if not stored_hash or password is None:
+            future = Future()
+            future.set_result((False, None))
+            return future
+        if self._remembered(stored_hash, password) and not self.needs_rehash(stored_hash):
+            self.cache_hits += 1
+            future = Future()
+            future.set_result((True, None))
+            return future
+        return self._submit(self._verify_job, stored_hash, password)
+
+    def hash_password(self, password):
+        return self.submit_hash(password).result()
+
+    def verify_password(self, stored_hash, password):
+        return self.submit_verify(stored_hash, password).result()
+
+    def stats(self):
+        return {'method': self.method, 'threads': self.threads,
+                'max_pending': self.max_pending, 'max_waiters': self.max_waiters,
+                'pending': self._pending,
+                'hashes': self.hashes, 'verifications': self.verifications,
+                'cache_hits': self.cache_hits, 'cached': len(self._verified),
+                'rehashes': self.rehashes, 'rejected': self.rejected,
+                'job_seconds': round(self.job_seconds, 4) if self.job_seconds is not None
+                else None}
@@ -0,0 +1,189 @@
+"""Chunked, compact-dtype loading of OHLCV CSV histories
+
+pd.read_csv on a whole file holds every row as Python strings while it
+infers dtypes, so peak memory grows with file size. These helpers read a
+fixed number of rows at a time with explicit dtypes and convert each chunk
+straight into its destination (packed bar records, the append-only binary
+files, or training windows), so peak memory is set by the chunk size.
+
+Import a large history into the price store's binary file for a company:
+
+    python data_loader.py history.csv TCS --chunksize 200000
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from price_store import BAR_DTYPE, BinaryBarWriter, PriceStore, frame_to_records
+
+DEFAULT_CHUNKSIZE = 100000
+PRICE_COLUMNS = ('Open', 'High', 'Low', 'Close')
+
+
+def csv_dtypes(float32=False, volume_dtype='int64'):
+    """Explicit column dtypes; the Date column is parsed per chunk"""
+    price = 'float32' if float32 else 'float64'
+    dtypes = {column: price for column in PRICE_COLUMNS}
+    dtypes['Volume'] = volume_dtype
+    dtypes['Date'] = 'str'
+    return dtypes
+
+
+def read_chunks(path, chunksize=DEFAULT_CHUNKSIZE, float32=False, volume_dtype='int64',
+                columns=None):
+    """Yield DataFrames of at most chunksize rows with compact dtypes"""
+    usecols = list(columns) if columns else ['Date', *PRICE_COLUMNS, 'Volume']
+    dtypes = {column: dtype for column, dtype in csv_dtypes(float32, volume_dtype).items()
+              if column in usecols}
+    for chunk in pd.read_csv(path, usecols=usecols, dtype=dtypes, chunksize=chunksize):
+        if 'Date' in chunk.columns:
+            chunk['Date'] = pd.to_datetime(chunk['Date'], cache=True)
+        yield chunk
+
+
+def count_rows(path, block_size=1 << 20):
+    """Number of data rows in a CSV, counted without parsing it"""
+    lines = 0
+    last = b'\n'
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            lines += block.count(b'\n')
+            last = block[-1:]
+    if last != b'\n':
+        lines += 1
+    # Minus the header
+    return max(lines - 1, 0)
+
+
+def read_bars(path, chunksize=DEFAULT_CHUNKSIZE):
+    """Load a CSV into BAR_DTYPE records, one chunk at a time
+
+    The output (48 bytes a bar) is allocated once from a quick row count and
+    each parsed chunk is copied into it, so peak memory is the result plus
+    one chunk of parsed text.
+    """
+    buffer = np.empty(count_rows(path), dtype=BAR_DTYPE)
+    size = 0
+    for chunk in read_chunks(path, chunksize):
+        records = frame_to_records(chunk)
+        if size + len(records) > len(buffer):
+            # Only if the count was off (e.g. quoted newlines)
+            grown = np.empty(2 * (size + len(records)), dtype=BAR_DTYPE)
+            grown[:size] = buffer[:size]
+            buffer = grown
+        buffer[size:size + len(records)] = records
+        size += len(records)
+    # Blank lines are skipped by the parser, so the count can be high
+    return buffer[:size]
+
+
+def load_frame(path, float32=False, volume_dtype='int64', chunksize=DEFAULT_CHUNKSIZE):
+    """Load a CSV as a Date/Open/High/Low/Close/Volume DataFrame with compact dtypes
+
+    Each column is allocated once in its final dtype and filled chunk by
+    chunk, so with float32 prices no float64 copy of the file is ever held.
+    """
+    price = np.float32 if float32 else np.float64
+    dtypes = {'Date': 'datetime64[ns]', **{column: price for column in PRICE_COLUMNS},
+              'Volume': volume_dtype}
+    rows = count_rows(path)
+    columns = {column: np.empty(rows, dtype=dtype) for column, dtype in dtypes.items()}
+    size = 0
+    for chunk in read_chunks(path, chunksize, float32, volume_dtype):
+        n = len(chunk)
+        if size + n > len(columns['Date']):
+            # Only if the count was off (e.g. quoted newlines)
+            for column, values in columns.items():
+                grown = np.empty(2 * (size + n), dtype=values.dtype)
+                grown[:size] = values[:size]
+                columns[column] = grown
+        for column, values in columns.items():
+            values[size:size + n] = chunk[column].to_numpy()
+        size += n
+    # Blank lines are skipped by the parser, so the count can be high
+    return pd.DataFrame({column: values[:size] for column, values in columns.items()},
+                        copy=False)
+
+
+def import_csv(path, writer, chunksize=DEFAULT_CHUNKSIZE):
+    """Stream a CSV into an append-only bar file; returns the number of bars
+
+    writer is a BinaryBarWriter or a path for one. The price store sorts and
+    de-duplicates bars when it loads the file.
+    """
+    if not isinstance(writer, BinaryBarWriter):
+        writer = BinaryBarWriter(writer)
+    count = 0
+    for chunk in read_chunks(path, chunksize):
+        records = frame_to_records(chunk)
+        writer.append(records)
+        count += len(records)
+    return count
+
+
+def close_range(path, chunksize=DEFAULT_CHUNKSIZE):
+    """Minimum and maximum close over the whole file, reading only that column"""
+    low, high = np.inf, -np.inf
+    for chunk in read_chunks(path, chunksize, columns=['Close']):
+        closes = chunk['Close'].to_numpy()
+        if len(closes):
+            low = min(low, float(np.nanmin(closes)))
+            high = max(high, float(np.nanmax(closes)))
+    return low, high
+
+
+def iter_training_windows(path, lookback_period, batch_size=32, chunksize=DEFAULT_CHUNKSIZE,
+                          float32=True, scale_range=None):
+    """Yield (X, y) batches of min-max scaled close windows from a CSV
+
+    X has shape (batch, lookback_period, 1) and y the close that follows each
+    window, the same layout as StockPredictor.prepare_data. The last
+    lookback_period closes of each chunk are carried into the next, so
+    windows spanning chunk boundaries are not lost. scale_range is the
+    (min, max) used for scaling; by default it is found with a first pass
+    over the Close column. The generator can be passed to model.fit directly.
+    """
+    dtype = np.float32 if float32 else np.float64
+    low, high = scale_range if scale_range is not None else close_range(path, chunksize)
+    span = (high - low) or 1.0
+
+    carry = np.empty(0, dtype=dtype)
+    for chunk in read_chunks(path, chunksize, float32=float32, columns=['Close']):
+        closes = ((chunk['Close'].to_numpy(dtype=dtype) - low) / span).astype(dtype, copy=False)
+        series = np.concatenate([carry, closes])
+        count = max(len(series) - lookback_period, 0)
+        full = count // batch_size * batch_size
+        if full:
+            # Views into series; only each yielded batch is copied
+            windows = np.lib.stride_tricks.sliding_window_view(series[:-1], lookback_period)
+            targets = series[lookback_period:]
+            for start in range(0, full, batch_size):
+                yield (windows[start:start + batch_size, :, None].copy(),
+                       targets[start:start + batch_size].copy())
+        # Closes still needed by windows that did not fill a batch
+        carry = series[full:]
+
+    if len(carry) > lookback_period:
+        windows = np.lib.stride_tricks.sliding_window_view(carry[:-1], lookback_period)
+        yield windows[:, :, None].copy(), carry[lookback_period:].copy()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import a CSV history into the bar store')
+    parser.add_argument('path', help='CSV with Date, Open, High, Low, Close, Volume columns')
+    parser.add_argument('company')
+    parser.add_argument('--bar-dir', default=None, help='directory of the append-only bar files')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    args = parser.parse_args()
+
+    store = PriceStore(bar_dir=args.bar_dir) if args.bar_dir else PriceStore()
+    count = import_csv(args.path, store.binary_path(args.company), args.chunksize)
+    print(f"Imported {count} bars for {args.company.upper()} into {store.binary_path(args.company)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+import asyncio
+import itertools
+import json
+import queue
+import threading
+from collections import deque
+from datetime import date
+
+from werkzeug.http import http_date
+
+from rate_limit import Rejected
+
+# Seconds between keep-alive comments on an idle stream
+HEARTBEAT_INTERVAL = 15.0
+
+
+class Subscription:
+    """One connected stream client, the user it belongs to and its companies"""
+
+    def __init__(self, companies, max_queue, user_id=None, admin=False):
+        # None means every company
+        self.companies = companies
+        self.user_id = user_id
+        # Admins also get events addressed to other users
+        self.admin = admin
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.closed = False
+        # Set by astream: the event loop to wake when something is queued
+        self._loop = None
+        self._wakeup = None
+
+    def wants(self, company, user_id=None):
+        if user_id is not None and user_id != self.user_id and not self.admin:
+            return False
+        return company is None or self.companies is None or company in self.companies
+
+    def attach(self, loop):
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        return self._wakeup
+
+    def notify(self):
+        """Wake an astream waiting on this subscription, from any thread"""
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            loop.call_soon_threadsafe(self._wakeup.set)
+        except RuntimeError:
+            # The loop has already shut down
+            pass
+
+
+class EventBroadcaster:
+    """Fan-out of Server-Sent Events to every subscribed stream
+
+    Each event is serialised once into its SSE wire format and the same bytes
+    are handed to every matching subscriber. A subscriber whose queue fills
+    up (a stalled client) is disconnected rather than slowing down publishers;
+    its client reconnects and refetches. The last few events are kept so a
+    client that reconnects with Last-Event-ID gets what it missed.
+
+    A threaded server holds a request thread per open stream, so it can set
+    max_subscribers; subscribe() then raises rate_limit.Rejected past it.
+    """
+
+    def __init__(self, max_queue=256, heartbeat=HEARTBEAT_INTERVAL, history=256,
+                 max_subscribers=None):
+        self.max_queue = max_queue
+        self.heartbeat = heartbeat
+        self.max_subscribers = max_subscribers
+        self.rejected = 0
+        self._subscribers = set()
+        self._history = deque(maxlen=history)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def subscribe(self, companies=None, last_event_id=None, user_id=None, admin=False):
+        subscription = Subscription(
+            frozenset(c.upper() for c in companies) if companies else None, self.max_queue,
+            user_id, admin)
+        with self._lock:
+            if self.max_subscribers is not None and len(self._subscribers) >= self.max_subscribers:
+                self.rejected += 1
+                raise Rejected('Too many open streams; please retry', int(self.heartbeat))
+            if last_event_id is not None:
+                missed = [payload for event_id, company, owner, payload in self._history
+                          if event_id > last_event_id and subscription.wants(company, owner)]
+                for payload in missed[-self.max_queue:]:
+                    subscription.queue.put_nowait(payload)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.closed = True
+        with self._lock:
+            self._subscribers.discard(subscription)
+        subscription.notify()
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def stats(self):
+        return {'open': len(self._subscribers), 'limit': self.max_subscribers,
+                'rejected': self.rejected}
+
+    def publish(self, event, data, company=None, user_id=None):
+        """Send an event to every subscriber of company (or to all if None)
+
+        With user_id, only that user's streams and admin streams get the event.
+        """
+        company = company.upper() if company else None
+        with self._lock:
+            event_id = next(self._ids)
+            payload = (f"id: {event_id}\n"
+                       f"event: {event}\n"
+                       f"data: {json.dumps(data, default=str)}\n\n").encode('utf-8')
+            self._history.append((event_id, company, user_id, payload))
+            subscribers = list(self._subscribers)
+
+        for subscription in subscribers:
+            if not subscription.wants(company, user_id):
+                continue
+            try:
+                subscription.queue.put_nowait(payload)
+            except queue.Full:
+                self.unsubscribe(subscription)
+                continue
+            subscription.notify()
+
+    def stream(self, subscription):
+        """Yield encoded events for one subscriber until it disconnects"""
+        try:
+            yield b"retry: 3000\n\n"
+            while not subscription.closed:
+                try:
+                    yield subscription.queue.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    # Comment line keeps proxies and the client from timing out
+                    yield b": keep-alive\n\n"
+        finally:
+            self.unsubscribe(subscription)
+
+    async def astream(self, subscription):
+        """stream() for an event loop: waits for a wakeup instead of blocking a thread"""
+        wakeup = subscription.attach(asyncio.get_running_loop())
+        try:
+            yield b"retry: 3000\n\n"
+            while not subscription.closed:
+                # Publishers set the event after queueing, and the set only
+                # runs on this loop, so clearing before get_nowait loses nothing
+                wakeup.clear()
+                try:
+                    payload = subscription.queue.get_nowait()
+                except queue.Empty:
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), self.heartbeat)
+                    except asyncio.TimeoutError:
+                        yield b": keep-alive\n\n"
+                    continue
+                yield payload
+        finally:
+            self.unsubscribe(subscription)
+
+
+broadcaster = EventBroadcaster()
+
+
+def publish_bar(company, bar, indicators=None):
+    """Push a new price bar and the indicator values it produced
+
+    Dates are sent in the same format /api/stock-data uses, so clients can
+    merge the bar straight into the history they already hold.
+    """
+    bar = {key: http_date(value) if isinstance(value, date) else value
+           for key, value in bar.items()}
+    broadcaster.publish('bar', {
+        'company': company.upper(),
+        'bar': bar,
+        'indicators': indicators or {}
+    }, company)
+
+
+def publish_prediction(result, user_id):
+    """Push a completed prediction job to the user who ran it and to admins"""
+    broadcaster.publish('prediction', {
+        'company': result['company'],
+        'model_used': result['model_used'],
+        'predicted_price': result['predicted_price'],
+        'price_change_percent': result['price_change_percent'],
+        'days_ahead': result['days_ahead']
+    }, result['company'], user_id)
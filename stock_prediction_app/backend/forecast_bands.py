@@ -0,0 +1,184 @@
+"""
+Forecast bands: percentiles over many simulated price paths.
+
+A simulator is a function simulate(rng, size) returning a (size, horizon)
+array of prices, one row per path. Three kinds are used:
+
+- 'gbm': geometric Brownian motion with the drift and volatility of the
+  history's log returns (model-free, so it works with either model);
+- 'bootstrap': the Linear Regression rollout with a resampled training
+  residual added at every step (StockPredictor.rollout_linear_regression);
+- 'mc_dropout': the LSTM rollout for a whole batch of paths in one forward
+  pass per step, with dropout left on (StockPredictor.rollout_lstm_dropout).
+
+percentile_bands runs a simulator chunk_size paths at a time and reduces
+each chunk into a BandAccumulator, so memory stays at one chunk plus a
+fixed-size histogram per step no matter how many paths are asked for.
+"""
+
+import numpy as np
+
+METHODS = ('gbm', 'bootstrap', 'mc_dropout')
+# The model whose fitted state a method needs; gbm needs none
+METHOD_MODELS = {'bootstrap': 'Linear_Regression', 'mc_dropout': 'LSTM'}
+DEFAULT_METHODS = {'Linear_Regression': 'bootstrap', 'LSTM': 'mc_dropout'}
+DEFAULT_PATHS = 2000
+MAX_PATHS = 100000
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+# Paths simulated per chunk; also the largest count with exact percentiles
+CHUNK_SIZE = 4096
+# Long horizons get fewer paths per chunk and fewer histogram bins, so a
+# chunk stays within CHUNK_VALUES values and the histograms within
+# HISTOGRAM_VALUES counts
+CHUNK_VALUES = 2 ** 20
+HISTOGRAM_VALUES = 2 ** 22
+# Seed for the simulations, so the same data gives the same bands (and
+# cached results stay valid)
+BAND_SEED = 42
+
+
+def band_options(raw, model_type):
+    """Validated bands settings from a request's 'bands' field
+
+    raw is true (all defaults) or an object with any of method, paths and
+    percentiles. Raises ValueError for anything else.
+    """
+    if raw is True:
+        raw = {}
+    if not isinstance(raw, dict):
+        raise ValueError('bands must be true or an object')
+
+    method = raw.get('method', DEFAULT_METHODS.get(model_type, 'gbm'))
+    if method not in METHODS:
+        raise ValueError(f"Unknown bands method: {method} (use one of {', '.join(METHODS)})")
+    if METHOD_MODELS.get(method, model_type) != model_type:
+        raise ValueError(f'{method} bands need the {METHOD_MODELS[method]} model')
+
+    try:
+        paths = int(raw.get('paths', DEFAULT_PATHS))
+        percentiles = sorted({float(p) for p in raw.get('percentiles', DEFAULT_PERCENTILES)})
+    except (TypeError, ValueError):
+        raise ValueError('paths must be an integer and percentiles a list of numbers')
+    if not 100 <= paths <= MAX_PATHS:
+        raise ValueError(f'paths must be between 100 and {MAX_PATHS}')
+    if not percentiles or len(percentiles) > 21 or not all(0 <= p <= 100 for p in percentiles):
+        raise ValueError('percentiles must be 1 to 21 numbers between 0 and 100')
+
+    return {'method': method, 'paths': paths, 'percentiles': percentiles}
+
+
+class BandAccumulator:
+    """Per-step percentiles and mean of paths added a chunk at a time
+
+    The first chunk is kept as is, so up to one chunk of paths the
+    percentiles are exact. After that every step gets a fixed-width
+    histogram over the first chunk's range, widened by half of it on each
+    side; values beyond land in the end bins and are bounded by the exact
+    min and max, which are tracked separately.
+    """
+
+    def __init__(self, horizon, bins=4096):
+        self.horizon = horizon
+        self.bins = bins
+        self.n_paths = 0
+        self._first = None
+        self._counts = None
+        self._sum = np.zeros(horizon)
+        self._min = np.full(horizon, np.inf)
+        self._max = np.full(horizon, -np.inf)
+
+    def add(self, paths):
+        paths = np.asarray(paths, dtype=np.float64)
+        self.n_paths += len(paths)
+        self._sum += paths.sum(axis=0)
+        np.minimum(self._min, paths.min(axis=0), out=self._min)
+        np.maximum(self._max, paths.max(axis=0), out=self._max)
+
+        if self._first is None and self._counts is None:
+            self._first = paths
+            return
+        if self._counts is None:
+            low, high = self._first.min(axis=0), self._first.max(axis=0)
+            spread = np.maximum(high - low, np.maximum(np.abs(high), 1.0) * 1e-9)
+            self._low = low - spread / 2
+            self._width = spread * 2 / self.bins
+            self._counts = np.zeros((self.horizon, self.bins), dtype=np.int64)
+            first, self._first = self._first, None
+            self._bin(first)
+        self._bin(paths)
+
+    def _bin(self, paths):
+        index = np.floor((paths - self._low) / self._width).astype(np.int64)
+        np.clip(index, 0, self.bins - 1, out=index)
+        # One bincount for every step: step h's bins sit at h * bins onwards
+        index += np.arange(self.horizon) * self.bins
+        self._counts += np.bincount(index.ravel(), minlength=self.horizon * self.bins).reshape(
+            self.horizon, self.bins)
+
+    @property
+    def exact(self):
+        return self._counts is None
+
+    def percentiles(self, qs):
+        """(len(qs), horizon) array of the qs-th percentiles at each step"""
+        qs = np.asarray(qs, dtype=np.float64)
+        if self._first is not None:
+            return np.percentile(self._first, qs, axis=0)
+
+        out = np.empty((len(qs), self.horizon))
+        cumulative = np.cumsum(self._counts, axis=1)
+        targets = qs / 100 * self.n_paths
+        for step in range(self.horizon):
+            counts = self._counts[step]
+            b = np.minimum(np.searchsorted(cumulative[step], targets), self.bins - 1)
+            # Interpolate linearly within the bin the target count falls in
+            before = cumulative[step][b] - counts[b]
+            fraction = np.clip((targets - before) / np.maximum(counts[b], 1), 0, 1)
+            out[:, step] = self._low[step] + self._width[step] * (b + fraction)
+        return np.clip(out, self._min, self._max)
+
+    def mean(self):
+        return self._sum / self.n_paths
+
+
+def percentile_bands(simulate, n_paths, horizon, percentiles=DEFAULT_PERCENTILES,
+                     chunk_size=CHUNK_SIZE, seed=BAND_SEED):
+    """Simulate n_paths paths in chunks; returns the bands as JSON-ready lists"""
+    rng = np.random.default_rng(seed)
+    chunk_size = max(1, min(chunk_size, CHUNK_VALUES // horizon))
+    accumulator = BandAccumulator(horizon, bins=max(256, min(4096, HISTOGRAM_VALUES // horizon)))
+    done = 0
+    while done < n_paths:
+        size = min(chunk_size, n_paths - done)
+        accumulator.add(simulate(rng, size))
+        done += size
+
+    values = accumulator.percentiles(percentiles)
+    return {
+        'paths': n_paths,
+        'percentiles': {f'p{q:g}': row.tolist() for q, row in zip(percentiles, values)},
+        'mean': accumulator.mean().tolist(),
+        'exact': accumulator.exact
+    }
+
+
+def gbm_simulator(closes, horizon):
+    """simulate(rng, size) for geometric Brownian motion fitted to closes
+
+    Log returns are drawn from a normal with the history's mean and standard
+    deviation (the mean of log returns already includes the -sigma^2/2
+    correction), starting from the last close.
+    """
+    closes = np.asarray(closes, dtype=np.float64)
+    if len(closes) < 3:
+        raise ValueError('Not enough history for GBM bands')
+    log_returns = np.diff(np.log(closes))
+    drift = log_returns.mean()
+    volatility = log_returns.std(ddof=1)
+    start = closes[-1]
+
+    def simulate(rng, size):
+        steps = rng.normal(drift, volatility, (size, horizon))
+        return start * np.exp(np.cumsum(steps, axis=1))
+
+    return simulate
@@ -0,0 +1,304 @@
+"""
+Precomputed forecasts for the standard dashboard requests.
+
+Every company x model is trained once per data version in a worker process
+and rolled out to the longest standard horizon; the shorter horizons are
+prefixes of the same rollout. Results go to a forecasts table in SQLite and
+an in-memory map, so /api/predict can answer those requests without
+training. A result is fresh while the company's data version (the price
+store ETag) is the one it was computed from.
+
+Usage: python forecast_table.py --workers 2   (one bulk refresh, then exit)
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+import metrics
+from price_store import store as price_store
+from training_pool import init_worker
+
+COMPANIES = ['TCS', 'WIPRO', 'INFOSYS']
+MODELS = ['LSTM', 'Linear_Regression']
+# The horizons offered by the frontends
+STANDARD_HORIZONS = (1, 3, 5, 7, 10)
+
+DB_PATH = os.environ.get('STOCK_APP_DB', 'stock_app.db')
+
+FRESH = 'fresh'
+STALE = 'stale'
+MISSING = 'missing'
+
+
+def slice_result(result, days_ahead):
+    """Cut a longer rollout down to days_ahead"""
+    predictions = result['predictions'][:days_ahead]
+    current_price = result['current_price']
+    predicted_price = predictions[-1]
+    return dict(result,
+                predictions=predictions,
+                predicted_price=predicted_price,
+                price_change_percent=(predicted_price - current_price) / current_price * 100,
+                days_ahead=days_ahead)
+
+
+def _forecast_job(company, model_type, horizons):
+    """Train one company/model and return (data_version, {horizon: result})"""
+    from ml_models import StockPredictor
+
+    # Read the version before the data, so a concurrent update marks this stale
+    data_version = price_store.series(company).etag
+    result = StockPredictor().predict(company, model_type, max(horizons))
+    return data_version, {h: slice_result(result, h) for h in horizons}
+
+
+class ForecastTable:
+    """Forecasts table in SQLite fronted by an in-memory map"""
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def ensure_schema(self, conn):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS forecasts (
+                company TEXT NOT NULL,
+                model_used TEXT NOT NULL,
+                days_ahead INTEGER NOT NULL,
+                data_version TEXT NOT NULL,
+                result TEXT NOT NULL,
+                computed_at TIMESTAMP NOT NULL,
+                PRIMARY KEY (company, model_used, days_ahead)
+            )
+        ''')
+
+    def load(self):
+        """Fill the in-memory map from the table"""
+        conn = metrics.connect(self.db_path)
+        try:
+            self.ensure_schema(conn)
+            rows = conn.execute('SELECT company, model_used, days_ahead, data_version, '
+                                'result, computed_at FROM forecasts').fetchall()
+        finally:
+            conn.close()
+
+        with self._lock:
+            for company, model_type, days_ahead, data_version, result, computed_at in rows:
+                self._entries[(company, model_type, days_ahead)] = (
+                    data_version, json.loads(result), computed_at)
+            self._loaded = True
+
+    def store(self, company, model_type, results, data_version):
+        """Save {days_ahead: result} computed from data_version"""
+        company = company.upper()
+        computed_at = datetime.now().isoformat(timespec='seconds')
+        rows = [(company, model_type, days_ahead, data_version, json.dumps(result), computed_at)
+                for days_ahead, result in results.items()]
+
+        conn = metrics.connect(self.db_path)
+        try:
+            self.ensure_schema(conn)
+            conn.executemany('INSERT OR REPLACE INTO forecasts VALUES (?, ?, ?, ?, ?, ?)', rows)
+            conn.commit()
+        finally:
+            conn.close()
+
+        with self._lock:
+            for days_ahead, result in results.items():
+                self._entries[(company, model_type, days_ahead)] = (
+                    data_version, result, computed_at)
+
+    def lookup(self, company, model_type, days_ahead):
+        """Return (result or None, freshness, computed_at)"""
+        if not self._loaded:
+            self.load()
+        company = company.upper()
+        entry = self._entries.get((company, model_type, days_ahead))
+        if entry is None:
+            return None, MISSING, None
+
+        data_version, result, computed_at = entry
+        try:
+            current = price_store.series(company).etag
+        except FileNotFoundError:
+            return None, MISSING, None
+        if data_version != current:
+            return None, STALE, computed_at
+        return result, FRESH, computed_at
+
+    def status(self):
+        """Freshness of every precomputed entry"""
+        if not self._loaded:
+            self.load()
+        with self._lock:
+            entries = list(self._entries.items())
+
+        rows = []
+        for (company, model_type, days_ahead), (data_version, result, computed_at) in sorted(entries):
+            _, freshness, _ = self.lookup(company, model_type, days_ahead)
+            rows.append({'company': company, 'model_used': model_type,
+                         'days_ahead': days_ahead, 'freshness': freshness,
+                         'computed_at': computed_at})
+        return rows
+
+    def stale_jobs(self, companies=None, models=None, horizons=STANDARD_HORIZONS):
+        """(company, model) pairs with any horizon missing or computed from old data"""
+        jobs = []
+        for company in companies or COMPANIES:
+            for model_type in models or MODELS:
+                if any(self.lookup(company, model_type, h)[1] != FRESH for h in horizons):
+                    jobs.append((company, model_type))
+        return jobs
+
+
+class ForecastScheduler:
+    """Keeps the forecast table fresh in the background
+
+    Every check_interval seconds the data version of each company is
+    compared with the table, and stale company/model pairs are recomputed
+    in bulk on a process pool, so training never runs in the web process.
+    """
+
+    def __init__(self, table, workers=2, threads_per_worker=1, check_interval=60.0,
+                 models=None, horizons=STANDARD_HORIZONS):
+        self.table = table
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self.check_interval = check_interval
+        self.models = models or MODELS
+        self.horizons = tuple(horizons)
+        self.runs = 0
+        self.last_run = None
+        self.running = False
+        # Jobs submitted in the current run that have not finished
+        self.pending = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._executor = None
+
+    def _pool(self):
+        if self._executor is None:
+            # spawn: TensorFlow and threads do not survive fork
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_worker,
+                initargs=(self.threads_per_worker,))
+        return self._executor
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name='forecast-scheduler', daemon=True)
+        self._thread.start()
+        return self
+
+    def refresh_now(self):
+        """Check for stale forecasts without waiting for the next interval"""
+        self._wake.set()
+
+    def stop(self, wait=False):
+        """Stop the loop; with wait, also until the worker processes have exited"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Forecast refresh failed: {e}")
+            self._wake.wait(self.check_interval)
+            self._wake.clear()
+
+    def run_once(self):
+        """Recompute every stale company/model pair; returns the number refreshed"""
+        jobs = self.table.stale_jobs(models=self.models, horizons=self.horizons)
+        if not jobs:
+            return 0
+
+        self.running = True
+        self.pending = len(jobs)
+        started = time.perf_counter()
+        try:
+            futures = {
+                self._pool().submit(_forecast_job, company, model_type, self.horizons):
+                    (company, model_type)
+                for company, model_type in jobs
+            }
+            refreshed = 0
+            for future, (company, model_type) in futures.items():
+                try:
+                    data_version, results = future.result()
+                    self.pending -= 1
+                except BrokenProcessPool as e:
+                    # A worker died (e.g. out of memory); start a new pool next time
+                    print(f"Forecast workers crashed: {e}")
+                    self._executor.shutdown(wait=False, cancel_futures=True)
+                    self._executor = None
+                    break
+                except Exception as e:
+                    self.pending -= 1
+                    print(f"Forecast for {company} {model_type} failed: {e}")
+                    continue
+                self.table.store(company, model_type, results, data_version)
+                refreshed += 1
+        finally:
+            self.running = False
+            self.pending = 0
+
+        self.runs += 1
+        self.last_run = {'jobs': len(jobs), 'refreshed': refreshed,
+                         'seconds': round(time.perf_counter() - started, 3),
+                         'finished_at': datetime.now().isoformat(timespec='seconds')}
+        return refreshed
+
+    def stats(self):
+        return {'workers': self.workers, 'check_interval': self.check_interval,
+                'runs': self.runs, 'running': self.running, 'pending': self.pending,
+                'last_run': self.last_run}
+
+
+# Scheduler started by the server, if any
+scheduler = None
+
+
+def start_scheduler(table, **options):
+    """Start the server's background forecast scheduler"""
+    global scheduler
+    scheduler = ForecastScheduler(table, **options).start()
+    return scheduler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute the standard forecasts')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads-per-worker', type=int, default=1)
+    parser.add_argument('--models', nargs='+', default=MODELS, choices=MODELS)
+    args = parser.parse_args()
+
+    table = ForecastTable()
+    scheduler = ForecastScheduler(table, workers=args.workers,
+                                  threads_per_worker=args.threads_per_worker,
+                                  models=args.models)
+    try:
+        scheduler.run_once()
+        print(json.dumps(scheduler.last_run, indent=2))
+    finally:
+        scheduler.stop()
+
+
+if __name__ == '__main__':
+    main()
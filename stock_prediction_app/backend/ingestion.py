@@ -0,0 +1,476 @@
+"""Streaming bar ingestion
+
+Bars arrive from a pluggable source and are applied in micro-batches to the
+price store, the incremental indicators and the append-only binary files,
+then pushed to live streams. Sources:
+
+    replay          the CSVs under data/, streamed at a configurable speed
+    tail:PATH       lines appended to a file
+    socket:PORT     lines sent to a local TCP port
+
+A line is either CSV (company,date,open,high,low,close,volume) or a JSON
+object with company, Date, Open, High, Low, Close and Volume keys.
+
+Replayed bars are history shifted past the last stored bar, so unless
+keep_replay is set they go to a scratch store: a PriceStore over the same
+CSVs whose bar files live in a temporary directory removed at exit. The
+real bar files, /api/stock-data and predictions never see them.
+
+Run standalone to measure throughput, e.g. replaying every CSV as 1000
+symbols as fast as possible:
+
+    python ingestion.py replay --speed 0 --copies 1000
+"""
+import argparse
+import atexit
+import json
+import os
+import queue
+import shutil
+import socketserver
+import tempfile
+import threading
+import time
+
+import pandas as pd
+
+from data_loader import load_frame
+from price_store import DATA_DIR, PriceStore, store as default_store
+
+
+def parse_line(line):
+    """Parse one CSV or JSON line into (company, bar), or None if it is not a bar"""
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        if line.startswith('{'):
+            bar = json.loads(line)
+            company = bar.pop('company', None) or bar.pop('symbol')
+        else:
+            company, date, open_, high, low, close, volume = line.split(',')
+            bar = {'Date': date, 'Open': float(open_), 'High': float(high),
+                   'Low': float(low), 'Close': float(close), 'Volume': int(float(volume))}
+    except (ValueError, KeyError):
+        # Header rows and malformed lines
+        return None
+    return company.strip().upper(), bar
+
+
+class BarSource:
+    """Base class for sources; run() calls emit(company, bar) until stop is set"""
+
+    name = 'source'
+
+    def run(self, emit, stop):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class ReplaySource(BarSource):
+    """Streams the existing CSVs in timestamp order
+
+    speed is a multiple of market time (86400 plays one daily bar per second
+    per company, 0 plays as fast as possible). With copies > 1 every CSV is
+    replayed as that many symbols (TCS_0, TCS_1, ...), for sizing runs. start
+    shifts the replay so its first bar lands on that timestamp.
+    """
+
+    name = 'replay'
+
+    def __init__(self, companies=None, data_dir=DATA_DIR, speed=86400.0, copies=1,
+                 start=None, loop=False):
+        self.companies = companies or ['TCS', 'WIPRO', 'INFOSYS']
+        self.data_dir = data_dir
+        self.speed = speed
+        self.copies = copies
+        self.start = start
+        self.loop = loop
+
+    def _bars(self):
+        frames = []
+        for company in self.companies:
+            df = load_frame(os.path.join(self.data_dir, f'{company.lower()}_stock_data.csv'))
+            df['company'] = company.upper()
+            frames.append(df)
+        df = pd.concat(frames, ignore_index=True)
+        return df.sort_values('Date', kind='stable').reset_index(drop=True)
+
+    def run(self, emit, stop):
+        df = self._bars()
+        shift = pd.Timedelta(0)
+        if self.start is not None:
+            shift = pd.Timestamp(self.start) - df['Date'].iloc[0]
+        span = df['Date'].iloc[-1] - df['Date'].iloc[0] + pd.Timedelta(days=1)
+
+        while not stop.is_set():
+            started = time.monotonic()
+            first = df['Date'].iloc[0]
+            for row in df.itertuples(index=False):
+                if self.speed:
+                    # Wait until this bar is due in replay time
+                    due = started + (row.Date - first).total_seconds() / self.speed
+                    if stop.wait(max(0.0, due - time.monotonic())):
+                        return
+                elif stop.is_set():
+                    return
+                bar = {'Date': row.Date + shift, 'Open': row.Open, 'High': row.High,
+                       'Low': row.Low, 'Close': row.Close, 'Volume': int(row.Volume)}
+                if self.copies == 1:
+                    emit(row.company, bar)
+                else:
+                    for i in range(self.copies):
+                        emit(f'{row.company}_{i}', bar)
+            if not self.loop:
+                return
+            # Play the history again after the end of the last pass
+            shift += span
+
+
+class FileTailSource(BarSource):
+    """Follows a file and emits every complete line appended to it"""
+
+    name = 'tail'
+
+    def __init__(self, path, poll_interval=0.2, from_start=False):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.from_start = from_start
+
+    def run(self, emit, stop):
+        position = None
+        partial = ''
+        while not stop.is_set():
+            try:
+                size = os.path.getsize(self.path)
+            except OSError:
+                stop.wait(self.poll_interval)
+                continue
+
+            if position is None:
+                position = 0 if self.from_start else size
+            if size < position:
+                # Truncated or replaced: start over
+                position, partial = 0, ''
+            if size == position:
+                stop.wait(self.poll_interval)
+                continue
+
+            with open(self.path) as f:
+                f.seek(position)
+                chunk = f.read()
+                position = f.tell()
+            *lines, partial = (partial + chunk).split('\n')
+            for line in lines:
+                parsed = parse_line(line)
+                if parsed is not None:
+                    emit(*parsed)
+
+
+class SocketSource(BarSource):
+    """Accepts newline-delimited bars on a local TCP port"""
+
+    name = 'socket'
+
+    def __init__(self, port=9009, host='127.0.0.1'):
+        self.host = host
+        self.port = port
+        self._server = None
+
+    def run(self, emit, stop):
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for raw in self.rfile:
+                    if stop.is_set():
+                        return
+                    parsed = parse_line(raw.decode('utf-8', 'replace'))
+                    if parsed is not None:
+                        emit(*parsed)
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self._server = socketserver.ThreadingTCPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self._server.serve_forever(poll_interval=0.5)
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+def build_source(spec, **options):
+    """Create a source from a command line spec: replay, tail:PATH or socket:PORT"""
+    kind, _, argument = spec.partition(':')
+    if kind == 'replay':
+        return ReplaySource(**options)
+    if kind == 'tail' and argument:
+        return FileTailSource(argument)
+    if kind == 'socket':
+        return SocketSource(int(argument) if argument else 9009)
+    raise ValueError(f'Unknown ingestion source: {spec}')
+
+
+class StageStats:
+    """Items processed and time spent in one pipeline stage"""
+
+    def __init__(self):
+        self.items = 0
+        self.seconds = 0.0
+
+    def add(self, items, seconds):
+        self.items += items
+        self.seconds += seconds
+
+    def to_dict(self, elapsed):
+        return {
+            'items': self.items,
+            'seconds': round(self.seconds, 6),
+            # Capacity of the stage while busy, and the rate actually achieved
+            'items_per_second': round(self.items / self.seconds, 1) if self.seconds else None,
+            'observed_per_second': round(self.items / elapsed, 1) if elapsed else None
+        }
+
+
+class IngestionPipeline:
+    """Applies bars from sources to the price store in micro-batches
+
+    Sources run on their own threads and put bars on a bounded queue, so a
+    slow store pushes back on them instead of growing memory. One worker
+    drains the queue in batches of up to batch_size bars (or whatever arrived
+    within batch_interval seconds), groups them by company and applies each
+    group with a single store append. Lag is the time from a bar being
+    received to it being applied.
+    """
+
+    STAGES = ('receive', 'binary', 'store', 'indicators', 'publish')
+
+    def __init__(self, sources, store=None, batch_size=1000, batch_interval=0.25,
+                 queue_size=100000, publish=True):
+        self.sources = list(sources)
+        self.store = store if store is not None else default_store
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.publish = publish
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stages = {name: StageStats() for name in self.STAGES}
+        self.batches = 0
+        self.dropped = 0
+        self.lag_total = 0.0
+        self.lag_max = 0.0
+        self.lag_last = 0.0
+        self.started_at = None
+        self._busy = False
+        self._stop = threading.Event()
+        self._threads = []
+
+    def emit(self, company, bar):
+        """Queue one bar; blocks while the queue is full"""
+        started = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                self.queue.put((company, bar, time.monotonic()), timeout=0.5)
+                break
+            except queue.Full:
+                continue
+        self.stages['receive'].add(1, time.perf_counter() - started)
+
+    def start(self):
+        self.started_at = time.monotonic()
+        for source in self.sources:
+            thread = threading.Thread(target=self._run_source, args=(source,),
+                                      name=f'ingest-{source.name}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        worker = threading.Thread(target=self._run_worker, name='ingest-worker', daemon=True)
+        worker.start()
+        self._threads.append(worker)
+        return self
+
+    def _run_source(self, source):
+        try:
+            source.run(self.emit, self._stop)
+        except Exception as e:
+            print(f"Ingestion source {source.name} failed: {e}")
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        for source in self.sources:
+            source.close()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def wait_idle(self, timeout=None):
+        """Block until every source has finished and the queue is drained"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads[:-1]:
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        while not self.queue.empty() or self._busy:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def _next_batch(self):
+        try:
+            batch = [self.queue.get(timeout=self.batch_interval)]
+        except queue.Empty:
+            return []
+        self._busy = True
+        deadline = time.monotonic() + self.batch_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self.queue.get(timeout=remaining) if remaining > 0
+                             else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run_worker(self):
+        while not (self._stop.is_set() and self.queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self.apply_batch(batch)
+            self._busy = False
+
+    def apply_batch(self, batch):
+        """Apply a list of (company, bar, received_at) to the store"""
+        by_company = {}
+        for company, bar, received_at in batch:
+            by_company.setdefault(company, []).append(bar)
+
+        timings = {}
+        applied = {}
+        for company, bars in by_company.items():
+            try:
+                applied[company] = self.store.append(company, bars, timings)
+            except Exception as e:
+                print(f"Ingestion failed for {company}: {e}")
+                applied[company] = []
+            # Stale, duplicate or failed bars
+            self.dropped += len(bars) - len(applied[company])
+
+        count = sum(len(bars) for bars in applied.values())
+        for stage in ('binary', 'store', 'indicators'):
+            self.stages[stage].add(count, timings.get(stage, 0.0))
+
+        now = time.monotonic()
+        oldest = min(received_at for _, _, received_at in batch)
+        self.lag_last = now - oldest
+        self.lag_max = max(self.lag_max, self.lag_last)
+        self.lag_total += sum(now - received_at for _, _, received_at in batch)
+        self.batches += 1
+
+        if self.publish:
+            from events import publish_bar
+
+            started = time.perf_counter()
+            for company, bars in applied.items():
+                for bar, indicators in bars:
+                    publish_bar(company, bar, indicators)
+            self.stages['publish'].add(count, time.perf_counter() - started)
+
+    def stats(self):
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        received = self.stages['receive'].items
+        return {
+            'sources': [source.name for source in self.sources],
+            'uptime_seconds': round(elapsed, 3),
+            'batches': self.batches,
+            'queue_depth': self.queue.qsize(),
+            'dropped': self.dropped,
+            'stages': {name: stats.to_dict(elapsed) for name, stats in self.stages.items()},
+            'lag_seconds': {
+                'last': round(self.lag_last, 6),
+                'max': round(self.lag_max, 6),
+                'mean': round(self.lag_total / received, 6) if received else None
+            }
+        }
+
+
+# Pipeline started by the server, if any
+pipeline = None
+
+
+def replay_start(store, companies=None):
+    """The day after the latest stored bar, so replayed bars count as new"""
+    companies = companies or ReplaySource().companies
+    last = max(store.series(company, create=True).last_time or 0 for company in companies)
+    return pd.Timestamp(last, unit='s') + pd.Timedelta(days=1)
+
+
+def scratch_store():
+    """PriceStore over the usual CSVs with its bar files in a temporary directory"""
+    bar_dir = tempfile.mkdtemp(prefix='stock-app-replay-')
+    atexit.register(shutil.rmtree, bar_dir, True)
+    return PriceStore(bar_dir=bar_dir)
+
+
+def start_ingestion(spec, speed=86400.0, keep_replay=False, **options):
+    """Start the server's ingestion pipeline from a source spec
+
+    A replay runs against a scratch store unless keep_replay is set, in
+    which case its bars are added to the real store and bar files.
+    """
+    global pipeline
+    source_options = {}
+    if spec == 'replay':
+        if not keep_replay:
+            options.setdefault('store', scratch_store())
+        source_options = {'speed': speed,
+                          'start': replay_start(options.get('store', default_store))}
+    pipeline = IngestionPipeline([build_source(spec, **source_options)], **options).start()
+    return pipeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the bar ingestion pipeline')
+    parser.add_argument('source', help='replay, tail:PATH or socket:PORT')
+    parser.add_argument('--speed', type=float, default=86400.0,
+                        help='replay speed as a multiple of market time (0 = unthrottled)')
+    parser.add_argument('--copies', type=int, default=1,
+                        help='replay every CSV as this many symbols')
+    parser.add_argument('--bar-dir', default=None,
+                        help='directory for the append-only bar files')
+    parser.add_argument('--keep-replay', action='store_true',
+                        help='add replayed bars to the real bar files instead of a scratch store')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--batch-interval', type=float, default=0.25)
+    parser.add_argument('--report-every', type=float, default=5.0,
+                        help='seconds between statistics reports')
+    args = parser.parse_args()
+
+    if args.bar_dir:
+        os.makedirs(args.bar_dir, exist_ok=True)
+        store = PriceStore(bar_dir=args.bar_dir)
+    elif args.source == 'replay' and not args.keep_replay:
+        store = scratch_store()
+    else:
+        store = default_store
+
+    options = {}
+    if args.source == 'replay':
+        options = {'speed': args.speed, 'copies': args.copies}
+        if args.copies == 1:
+            options['start'] = replay_start(store)
+    source = build_source(args.source, **options)
+
+    pipeline = IngestionPipeline([source], store=store, batch_size=args.batch_size,
+                                 batch_interval=args.batch_interval, publish=False).start()
+    try:
+        while True:
+            finished = pipeline.wait_idle(timeout=args.report_every)
+            print(json.dumps(pipeline.stats(), indent=2))
+            if finished and args.source == 'replay':
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pipeline.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+"""
+Stage timers, latency histograms and an opt-in per-request profiler.
+
+Code paths are timed with timer('name') blocks; every Flask route is timed
+by the hooks installed with init_app. Durations go into fixed-bucket
+histograms (one bisect and a few additions per sample), so timing is cheap
+enough to leave on under real load. The stages of the current request are
+also returned in a Server-Timing header.
+
+Profiling is off by default. An admin can profile a single request by
+sending X-Profile: 1, or profile a sample of all requests through
+/api/admin/profiling. Recent profiles are kept in memory and can be
+downloaded as .prof files (for pstats or snakeviz) or as text.
+"""
+
+import bisect
+import cProfile
+import io
+import itertools
+import marshal
+import pstats
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import datetime
+
+# Bucket upper bounds in seconds: 0.1 ms doubling up to ~105 s
+BUCKET_BOUNDS = tuple(0.0001 * 2 ** i for i in range(21))
+
+PROFILE_HEADER = 'X-Profile'
+
+_local = threading.local()
+
+
+class Histogram:
+    """Count, sum, extremes and bucketed distribution of durations"""
+
+    def __init__(self, bounds=BUCKET_BOUNDS):
+        self.bounds = bounds
+        # One extra bucket for anything above the last bound
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(self.bounds, seconds)
+        with self._lock:
+            self.buckets[index] += 1
+            self.count += 1
+            self.total += seconds
+            if self.min is None or seconds < self.min:
+                self.min = seconds
+            if self.max is None or seconds > self.max:
+                self.max = seconds
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th percentile, capped at the max"""
+        if not self.count:
+            return None
+        rank = q / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                if index < len(self.bounds):
+                    return min(self.bounds[index], self.max)
+                return self.max
+        return self.max
+
+    def state(self):
+        """(bucket counts, count, total) at one instant"""
+        with self._lock:
+            return list(self.buckets), self.count, self.total
+
+    def summary(self):
+        with self._lock:
+            if not self.count:
+                return {'count': 0}
+            ms = lambda seconds: round(seconds * 1000, 3)
+            return {
+                'count': self.count,
+                'mean_ms': ms(self.total / self.count),
+                'min_ms': ms(self.min),
+                'max_ms': ms(self.max),
+                'p50_ms': ms(self.percentile(50)),
+                'p95_ms': ms(self.percentile(95)),
+                'p99_ms': ms(self.percentile(99)),
+                'total_seconds': round(self.total, 3)
+            }
+
+
+class Timings:
+    """Named histograms, created on first use"""
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name):
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, Histogram())
+        return histogram
+
+    def record(self, name, seconds):
+        self.histogram(name).observe(seconds)
+        # Stages of the request being handled on this thread, if any
+        stages = getattr(_local, 'stages', None)
+        if stages is not None:
+            stages.append((name, seconds))
+
+    def items(self):
+        with self._lock:
+            return list(self._histograms.items())
+
+    def snapshot(self, prefix=''):
+        with self._lock:
+            names = sorted(name for name in self._histograms if name.startswith(prefix))
+        return {name: self._histograms[name].summary() for name in names}
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+timings = Timings()
+
+
+@contextmanager
+def timer(name):
+    """Record how long the block takes under name"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.record(name, time.perf_counter() - start)
+
+
+class ProfileStore:
+    """The most recent request profiles"""
+
+    def __init__(self, limit=20):
+        self.enabled = False
+        self.sample_rate = 1.0
+        self._profiles = OrderedDict()
+        self._limit = limit
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        # cProfile can only be active once per process
+        self._active = threading.Lock()
+
+    def should_profile(self, requested):
+        return requested or (self.enabled and random.random() < self.sample_rate)
+
+    def start(self):
+        """A running profiler, or None if another request is being profiled"""
+        if not self._active.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Some other tool (a debugger, another profiler) is active
+            self._active.release()
+            return None
+        return profiler
+
+    def finish(self, profiler, method, path, seconds):
+        profiler.disable()
+        self._active.release()
+        stats = pstats.Stats(profiler)
+        with self._lock:
+            profile_id = next(self._ids)
+            self._profiles[profile_id] = {
+                'id': profile_id,
+                'method': method,
+                'path': path,
+                'duration_ms': round(seconds * 1000, 3),
+                'captured_at': datetime.now().isoformat(timespec='seconds'),
+                'stats': stats
+            }
+            while len(self._profiles) > self._limit:
+                self._profiles.popitem(last=False)
+        return profile_id
+
+    def list(self):
+        with self._lock:
+            return [{k: v for k, v in entry.items() if k != 'stats'}
+                    for entry in reversed(self._profiles.values())]
+
+    def get(self, profile_id):
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    @staticmethod
+    def dump(entry):
+        """The profile in the binary format read by pstats.Stats(path)"""
+        return marshal.dumps(entry['stats'].stats)
+
+    @staticmethod
+    def text(entry, sort='cumulative', limit=50):
+        out = io.StringIO()
+        # A copy, since sorting reorders the stored stats
+        stats = pstats.Stats(stream=out)
+        stats.add(entry['stats'])
+        stats.sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+
+profiles = ProfileStore()
+
+
+def init_app(app, is_admin):
+    """Time every route and profile requests that ask for it
+
+    is_admin() tells whether the current request may ask for a profile.
+    """
+    from flask import g, request
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+        _local.stages = deque(maxlen=64)
+        g.profiler = None
+        requested = request.headers.get(PROFILE_HEADER) == '1' and is_admin()
+        if profiles.should_profile(requested):
+            g.profiler = profiles.start()
+
+    def route_name():
+        rule = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        return f'route.{request.method} {rule}'
+
+    @app.after_request
+    def record_request_time(response):
+        # Left in g for teardown, which runs after this hook
+        started = g.get('request_started')
+        if started is None:
+            return response
+        seconds = time.perf_counter() - started
+        timings.record(route_name(), seconds)
+        g.request_recorded = True
+
+        stages = _local.stages
+        _local.stages = None
+        response.headers['Server-Timing'] = ', '.join(
+            [f'{name.replace(" ", "_")};dur={duration * 1000:.2f}' for name, duration in stages
+             if not name.startswith('route.')] + [f'total;dur={seconds * 1000:.2f}'])
+
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profile_id = profiles.finish(profiler, request.method, request.path, seconds)
+            response.headers['X-Profile-Id'] = str(profile_id)
+        return response
+
+    @app.teardown_request
+    def finish_request_timer(error):
+        started = g.pop('request_started', None)
+        recorded = g.pop('request_recorded', False)
+        profiler = g.pop('profiler', None)
+        _local.stages = None
+        if started is None:
+            return
+        # after_request is skipped when a view raises; still time the request
+        # and don't leave a profiler running
+        seconds = time.perf_counter() - started
+        if not recorded:
+            timings.record(route_name(), seconds)
+        if profiler is not None:
+            profiles.finish(profiler, request.method, request.path, seconds)
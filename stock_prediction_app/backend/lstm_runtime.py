@@ -0,0 +1,228 @@
+"""
+Lightweight inference runtime for trained Keras sequence models.
+
+Supports the layer types used by StockPredictor's model variants: LSTM, GRU,
+Conv1D, Flatten, Dropout and Dense.
+
+A trained model is exported to a bundle (the layer weights and their
+configuration) that NumpyEngine executes with a pure-NumPy implementation of
+the same forward pass. Rollouts call the model one small batch at a time,
+where this avoids the per-call overhead of Keras' predict.
+"""
+
+import numpy as np
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'sigmoid': _sigmoid,
+    'tanh': np.tanh,
+    'relu': lambda x: np.maximum(x, 0.0)
+}
+
+
+def _activation(name):
+    if name not in ACTIVATIONS:
+        raise ValueError(f"Unsupported activation: {name}")
+    return ACTIVATIONS[name]
+
+
+def _activation_name(value):
+    """Normalise a Keras activation config entry to its name"""
+    if isinstance(value, dict):
+        value = value.get('config', {}).get('name', value.get('class_name'))
+    return str(value)
+
+
+def export_bundle(model, **metadata):
+    """Convert a trained Keras model into a weight bundle dict
+
+    Extra keyword arguments (e.g. lookback_period) are stored alongside the
+    layers as metadata.
+    """
+    layers = []
+    for layer in model.layers:
+        kind = type(layer).__name__
+        config = layer.get_config()
+        weights = [np.asarray(w, dtype=np.float32) for w in layer.get_weights()]
+
+        if kind in ('Dropout', 'InputLayer'):
+            # Dropout is the identity at inference time
+            continue
+        elif kind == 'LSTM':
+            if not config.get('use_bias', True):
+                raise ValueError('LSTM layers without bias are not supported')
+            layers.append({
+                'type': 'LSTM',
+                'units': config['units'],
+                'activation': _activation_name(config['activation']),
+                'recurrent_activation': _activation_name(config['recurrent_activation']),
+                'return_sequences': config['return_sequences'],
+                'weights': weights
+            })
+        elif kind == 'GRU':
+            if not config.get('use_bias', True):
+                raise ValueError('GRU layers without bias are not supported')
+            layers.append({
+                'type': 'GRU',
+                'units': config['units'],
+                'activation': _activation_name(config['activation']),
+                'recurrent_activation': _activation_name(config['recurrent_activation']),
+                'return_sequences': config['return_sequences'],
+                'reset_after': config.get('reset_after', True),
+                'weights': weights
+            })
+        elif kind == 'Conv1D':
+            if config['padding'] not in ('causal', 'valid') or tuple(config['strides']) != (1,):
+                raise ValueError('Only stride-1 causal/valid Conv1D layers are supported')
+            if not config.get('use_bias', True):
+                weights.append(np.zeros(config['filters'], dtype=np.float32))
+            layers.append({
+                'type': 'Conv1D',
+                'padding': config['padding'],
+                'dilation_rate': int(config['dilation_rate'][0]),
+                'activation': _activation_name(config['activation']),
+                'weights': weights
+            })
+        elif kind == 'Flatten':
+            layers.append({'type': 'Flatten', 'weights': []})
+        elif kind == 'Dense':
+            if not config.get('use_bias', True):
+                weights.append(np.zeros(config['units'], dtype=np.float32))
+            layers.append({
+                'type': 'Dense',
+                'activation': _activation_name(config['activation']),
+                'weights': weights
+            })
+        else:
+            raise ValueError(f"Unsupported layer type for export: {kind}")
+
+    return {'layers': layers, 'metadata': metadata}
+
+
+class NumpyEngine:
+    """Pure-NumPy forward pass over an exported bundle"""
+
+    def __init__(self, bundle):
+        self.metadata = bundle.get('metadata', {})
+        self.layers = []
+        for layer in bundle['layers']:
+            forward = getattr(self, f"_{layer['type'].lower()}", None)
+            if forward is None:
+                raise ValueError(f"Unsupported layer type: {layer['type']}")
+            self.layers.append((forward, layer))
+
+    @classmethod
+    def from_keras(cls, model, **metadata):
+        return cls(export_bundle(model, **metadata))
+
+    def predict(self, x):
+        """Run the model on a (batch, timesteps, features) array"""
+        out = np.asarray(x, dtype=np.float32)
+        for forward, layer in self.layers:
+            out = forward(out, layer)
+        return out
+
+    @staticmethod
+    def _lstm(x, layer):
+        kernel, recurrent_kernel, bias = layer['weights']
+        units = layer['units']
+        activation = _activation(layer['activation'])
+        recurrent_activation = _activation(layer['recurrent_activation'])
+
+        batch, timesteps, _ = x.shape
+        h = np.zeros((batch, units), dtype=np.float32)
+        c = np.zeros((batch, units), dtype=np.float32)
+
+        # Input projections for every timestep in one matmul
+        x_proj = x @ kernel + bias
+        outputs = np.empty((batch, timesteps, units), dtype=np.float32) if layer['return_sequences'] else None
+
+        for t in range(timesteps):
+            z = x_proj[:, t, :] + h @ recurrent_kernel
+            i = recurrent_activation(z[:, :units])
+            f = recurrent_activation(z[:, units:2 * units])
+            g = activation(z[:, 2 * units:3 * units])
+            o = recurrent_activation(z[:, 3 * units:])
+            c = f * c + i * g
+            h = o * activation(c)
+            if outputs is not None:
+                outputs[:, t, :] = h
+
+        return outputs if outputs is not None else h
+
+    @staticmethod
+    def _gru(x, layer):
+        kernel, recurrent_kernel, bias = layer['weights']
+        units = layer['units']
+        activation = _activation(layer['activation'])
+        recurrent_activation = _activation(layer['recurrent_activation'])
+
+        # reset_after=True (the Keras default) keeps separate input/recurrent biases
+        if layer['reset_after']:
+            input_bias, recurrent_bias = bias[0], bias[1]
+        else:
+            input_bias, recurrent_bias = bias, None
+
+        batch, timesteps, _ = x.shape
+        h = np.zeros((batch, units), dtype=np.float32)
+        x_proj = x @ kernel + input_bias
+        outputs = np.empty((batch, timesteps, units), dtype=np.float32) if layer['return_sequences'] else None
+
+        for t in range(timesteps):
+            xz = x_proj[:, t, :units]
+            xr = x_proj[:, t, units:2 * units]
+            xh = x_proj[:, t, 2 * units:]
+            if recurrent_bias is not None:
+                h_proj = h @ recurrent_kernel + recurrent_bias
+                z = recurrent_activation(xz + h_proj[:, :units])
+                r = recurrent_activation(xr + h_proj[:, units:2 * units])
+                hh = activation(xh + r * h_proj[:, 2 * units:])
+            else:
+                h_proj = h @ recurrent_kernel[:, :2 * units]
+                z = recurrent_activation(xz + h_proj[:, :units])
+                r = recurrent_activation(xr + h_proj[:, units:])
+                hh = activation(xh + (r * h) @ recurrent_kernel[:, 2 * units:])
+            h = z * h + (1.0 - z) * hh
+            if outputs is not None:
+                outputs[:, t, :] = h
+
+        return outputs if outputs is not None else h
+
+    @staticmethod
+    def _conv1d(x, layer):
+        kernel, bias = layer['weights']
+        kernel_size = kernel.shape[0]
+        dilation = layer['dilation_rate']
+        span = (kernel_size - 1) * dilation
+
+        if layer['padding'] == 'causal':
+            x = np.pad(x, ((0, 0), (span, 0), (0, 0)))
+        timesteps = x.shape[1] - span
+
+        out = np.zeros((x.shape[0], timesteps, kernel.shape[2]), dtype=np.float32)
+        for j in range(kernel_size):
+            offset = j * dilation
+            out += x[:, offset:offset + timesteps, :] @ kernel[j]
+        return _activation(layer['activation'])(out + bias)
+
+    @staticmethod
+    def _flatten(x, layer):
+        return x.reshape(x.shape[0], -1)
+
+    @staticmethod
+    def _dense(x, layer):
+        kernel, bias = layer['weights']
+        return _activation(layer['activation'])(x @ kernel + bias)
+
+
+def check_parity(outputs, reference_outputs, atol=1e-4):
+    """Return True if engine outputs match the Keras reference within atol"""
+    outputs = np.asarray(outputs, dtype=np.float32).reshape(-1)
+    reference_outputs = np.asarray(reference_outputs, dtype=np.float32).reshape(-1)
+    return outputs.shape == reference_outputs.shape and bool(
+        np.allclose(outputs, reference_outputs, atol=atol))
@@ -0,0 +1,425 @@
+"""
+Prometheus text exposition (/metrics) for the backend.
+
+Latency histograms come straight from instrumentation.timings, which the
+request hooks and stage timers already fill, so exporting them adds no
+work to the request path. The only per-request addition is one counter
+increment for the response status. Cache hit counts, queue depths and RSS
+are read from their owners by collectors when /metrics is scraped.
+
+With several worker processes, set STOCK_APP_METRICS_DIR to a directory
+shared by all of them. Each process then writes a snapshot of its own
+counters and histograms there every few seconds, and a scrape of any
+process merges them all. Counters and histograms are summed, including
+those of processes that have exited: a scrape folds the snapshots of
+exited processes into one archive file and deletes them, so the directory
+does not grow with every worker generation. Gauges are reported per live
+process with a pid label.
+"""
+
+import atexit
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # No flock (Windows): snapshots of exited processes are kept and read as is
+    fcntl = None
+
+from instrumentation import BUCKET_BOUNDS, timer, timings
+
+PREFIX = 'stock_app'
+METRICS_DIR = os.environ.get('STOCK_APP_METRICS_DIR')
+FLUSH_INTERVAL = 5.0
+# Counters and histograms of exited processes, and the lock guarding it
+ARCHIVE_FILE = 'archive.json'
+LOCK_FILE = 'metrics.lock'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Timing name prefix -> histogram name, help text and label names
+TIMING_FAMILIES = (
+    ('route.', 'request_duration_seconds', 'Request latency by route', ('method', 'route')),
+    ('training.', 'training_duration_seconds', 'Model training time by model type',
+     ('model_type',)),
+    ('sqlite.', 'sqlite_query_duration_seconds', 'SQLite statement latency by statement type',
+     ('statement',)),
+    ('predictor.', 'predictor_stage_duration_seconds', 'Prediction time by stage', ('stage',)),
+)
+OTHER_TIMINGS = ('stage_duration_seconds', 'Other instrumented stages', ('stage',))
+
+
+class Counters:
+    """Labelled monotonic counters for this process"""
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, labels=(), amount=1):
+        key = (name, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def items(self):
+        with self._lock:
+            return list(self._values.items())
+
+
+counters = Counters()
+
+_descriptions = {}
+_collectors = []
+
+
+def describe(name, kind, help_text):
+    """Set the type (counter or gauge) and help text of a metric"""
+    _descriptions[name] = (kind, help_text)
+
+
+def register_collector(collect):
+    """collect() returns (name, labels, value) samples, read at scrape time"""
+    _collectors.append(collect)
+
+
+describe('requests_total', 'counter', 'Requests by route and status')
+describe('process_resident_memory_bytes', 'gauge', 'Resident set size')
+
+
+def process_rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Peak rather than current; kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+def _timing_family(name):
+    for prefix, family, help_text, label_names in TIMING_FAMILIES:
+        if name.startswith(prefix):
+            rest = name[len(prefix):]
+            values = rest.split(' ', 1) if len(label_names) == 2 else [rest]
+            return family, help_text, tuple(zip(label_names, values))
+    family, help_text, label_names = OTHER_TIMINGS
+    return family, help_text, ((label_names[0], name),)
+
+
+def snapshot():
+    """Everything this process has to report, in a JSON-friendly layout
+
+    {name: {'type', 'help', 'samples': {labels_json: value}}}, where a
+    histogram value is {'buckets', 'count', 'sum'}.
+    """
+    families = {}
+
+    def sample(name, kind, help_text, labels, value):
+        family = families.setdefault(name, {'type': kind, 'help': help_text, 'samples': {}})
+        key = json.dumps(list(labels))
+        if kind == 'histogram':
+            family['samples'][key] = value
+        else:
+            family['samples'][key] = family['samples'].get(key, 0) + value
+
+    for name, histogram in timings.items():
+        family, help_text, labels = _timing_family(name)
+        buckets, count, total = histogram.state()
+        sample(family, 'histogram', help_text, labels,
+               {'buckets': buckets, 'count': count, 'sum': total})
+
+    def described(name):
+        return _descriptions.get(name, ('gauge', name.replace('_', ' ')))
+
+    for (name, labels), value in counters.items():
+        sample(name, *described(name), labels, value)
+
+    for collect in _collectors:
+        try:
+            samples = list(collect())
+        except Exception as e:
+            # A broken collector must not take /metrics down
+            print(f"Metrics collector failed: {e}")
+            continue
+        for name, labels, value in samples:
+            if value is not None:
+                sample(name, *described(name), tuple(labels), value)
+
+    rss = process_rss_bytes()
+    if rss is not None:
+        sample('process_resident_memory_bytes', 'gauge', 'Resident set size', (), rss)
+    return families
+
+
+def _merge(snapshots):
+    """Sum counters and histograms; label gauges with their process"""
+    merged = {}
+    for pid, families in snapshots:
+        for name, family in families.items():
+            target = merged.setdefault(name, {'type': family['type'], 'help': family['help'],
+                                              'samples': {}})
+            for key, value in family['samples'].items():
+                if family['type'] == 'gauge':
+                    if pid is None:
+                        target['samples'][key] = value
+                    else:
+                        labels = json.loads(key) + [['pid', str(pid)]]
+                        target['samples'][json.dumps(labels)] = value
+                elif family['type'] == 'histogram':
+                    current = target['samples'].get(key)
+                    if current is None:
+                        target['samples'][key] = dict(value, buckets=list(value['buckets']))
+                    else:
+                        current['buckets'] = [a + b for a, b in
+                                              zip(current['buckets'], value['buckets'])]
+                        current['count'] += value['count']
+                        current['sum'] += value['sum']
+                else:
+                    target['samples'][key] = target['samples'].get(key, 0) + value
+    return merged
+
+
+class _Exporter:
+    """Writes this process's snapshot to the shared metrics directory"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.pid = os.getpid()
+        # Start time in the name keeps a reused pid from overwriting old counts
+        self.path = os.path.join(directory, f'metrics-{self.pid}-{int(time.time() * 1000)}.json')
+        self._stop = threading.Event()
+
+    def flush(self):
+        """Write the current snapshot and return it"""
+        families = snapshot()
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'pid': self.pid, 'families': families}, f)
+        os.replace(tmp_path, self.path)
+        return families
+
+    def run(self):
+        while not self._stop.wait(FLUSH_INTERVAL):
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Writing metrics failed: {e}")
+
+    def _lock(self, operation):
+        """The directory's lock file, flocked with operation; closing it unlocks"""
+        os.makedirs(self.directory, exist_ok=True)
+        f = open(os.path.join(self.directory, LOCK_FILE), 'a')
+        try:
+            fcntl.flock(f, operation)
+        except OSError:
+            f.close()
+            raise
+        return f
+
+    def _snapshot_files(self):
+        """(path, contents) of every other process's snapshot"""
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            if path == self.path:
+                continue
+            data = _load(path)
+            if data is not None:
+                yield path, data
+
+    def archive_exited(self):
+        """Fold the snapshots of exited processes into the archive and delete them"""
+        if fcntl is None:
+            return
+        try:
+            lock = self._lock(fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            # Another process is archiving right now
+            return
+        with lock:
+            exited = [(path, data) for path, data in self._snapshot_files()
+                      if not _alive(data['pid'])]
+            if not exited:
+                return
+            archive_path = os.path.join(self.directory, ARCHIVE_FILE)
+            archive = _load(archive_path) or {'families': {}}
+            families = _merge([(None, archive['families'])] +
+                              [(None, _without_gauges(data['families'])) for _, data in exited])
+            tmp_path = f'{archive_path}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({'families': families}, f)
+            os.replace(tmp_path, archive_path)
+            for path, _ in exited:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def read_all(self):
+        self.archive_exited()
+        # Shared lock: never see a snapshot both archived and still on disk
+        lock = self._lock(fcntl.LOCK_SH) if fcntl is not None else None
+        try:
+            snapshots = []
+            archive = _load(os.path.join(self.directory, ARCHIVE_FILE))
+            if archive is not None:
+                snapshots.append((None, archive['families']))
+            for path, data in self._snapshot_files():
+                pid = data['pid']
+                families = data['families']
+                if not _alive(pid):
+                    # Its counts still count; its gauges are gone with it
+                    families = _without_gauges(families)
+                snapshots.append((pid, families))
+            return snapshots
+        finally:
+            if lock is not None:
+                lock.close()
+
+
+def _load(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _without_gauges(families):
+    return {name: family for name, family in families.items() if family['type'] != 'gauge'}
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        pass
+    return True
+
+
+_exporter = None
+
+
+def start(directory=None):
+    """Share this process's metrics through directory (default STOCK_APP_METRICS_DIR)
+
+    Safe to call repeatedly; a forked child starts its own exporter.
+    """
+    global _exporter
+    directory = directory or METRICS_DIR
+    if directory is None or (_exporter is not None and _exporter.pid == os.getpid()):
+        return
+    _exporter = _Exporter(directory)
+    threading.Thread(target=_exporter.run, name='metrics-exporter', daemon=True).start()
+    atexit.register(_exporter.flush)
+
+
+def flush():
+    """Write this process's snapshot now, for processes that exit without atexit"""
+    if _exporter is not None and _exporter.pid == os.getpid():
+        _exporter.flush()
+
+
+def collect():
+    """Metric families of this process merged with any other processes"""
+    if _exporter is None:
+        return _merge([(None, snapshot())])
+    # JSON round trip so local samples have the same shape as the files
+    own = json.loads(json.dumps(_exporter.flush()))
+    return _merge([(_exporter.pid, own)] + _exporter.read_all())
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value) if value == value and abs(value) != float('inf') else str(value)
+    return str(value)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for name, family in sorted(collect().items()):
+        full_name = f'{PREFIX}_{name}'
+        lines.append(f'# HELP {full_name} {family["help"]}')
+        lines.append(f'# TYPE {full_name} {family["type"]}')
+        for key, value in sorted(family['samples'].items()):
+            labels = [tuple(pair) for pair in json.loads(key)]
+            if family['type'] != 'histogram':
+                lines.append(f'{full_name}{_format_labels(labels)} {_format_value(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKET_BOUNDS + (float('inf'),), value['buckets']):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                lines.append(f'{full_name}_bucket{_format_labels(labels + [("le", le)])} '
+                             f'{cumulative}')
+            lines.append(f'{full_name}_sum{_format_labels(labels)} {_format_value(value["sum"])}')
+            lines.append(f'{full_name}_count{_format_labels(labels)} {value["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def init_app(app):
+    """Count responses by route and status; start sharing metrics if configured"""
+    from flask import request
+
+    @app.after_request
+    def count_request(response):
+        if METRICS_DIR is not None:
+            start()
+        rule = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        counters.inc('requests_total', (('method', request.method), ('route', rule),
+                                        ('status', str(response.status_code))))
+        return response
+
+
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        with timer(f'sqlite.{_statement(sql)}'):
+            return super().execute(sql, parameters)
+
+    def executemany(self, sql, parameters):
+        with timer(f'sqlite.{_statement(sql)}'):
+            return super().executemany(sql, parameters)
+
+
+class TimedConnection(sqlite3.Connection):
+    """sqlite3 connection whose statements are timed by statement type"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, parameters):
+        return self.cursor().executemany(sql, parameters)
+
+
+def _statement(sql):
+    words = sql.split(None, 1)
+    return words[0].upper() if words else 'EMPTY'
+
+
+def connect(path, **kwargs):
+    """sqlite3.connect with statement timings"""
+    return sqlite3.connect(path, factory=TimedConnection, **kwargs)
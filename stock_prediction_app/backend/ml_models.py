@@ -3,39 +3,81 @@ import numpy as np
 from sklearn.preprocessing import MinMaxScaler
 from sklearn.linear_model import LinearRegression
 from sklearn.metrics import mean_squared_error
-import tensorflow as tf
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import LSTM, Dense, Dropout
+import itertools
+import logging
+import os
+import time
 import warnings
+from model_registry import get_best_config
+from price_store import store as price_store
+from lstm_runtime import NumpyEngine, check_parity
+from instrumentation import timer
+from forecast_bands import percentile_bands, gbm_simulator
 warnings.filterwarnings('ignore')
 
+logger = logging.getLogger(__name__)
+
+# TensorFlow is imported on first LSTM use so that data-only and
+# Linear_Regression code paths don't pay its startup time and memory
+_tf = None
+
+def load_tensorflow():
+    """Import TensorFlow lazily and return the module"""
+    global _tf
+    if _tf is None:
+        import tensorflow as tf
+        _tf = tf
+    return _tf
+
+def load_keras():
+    """Import TensorFlow lazily and return its keras module"""
+    return load_tensorflow().keras
+
+# Seed for weight initialisation, dropout and shuffling, so the same data
+# always trains the same model (and cached results stay valid)
+LSTM_SEED = 42
+
+# Compare the NumPy engine with Keras after every fit (slower; for debugging)
+CHECK_PARITY = os.environ.get('STOCK_APP_CHECK_PARITY') == '1'
+
 class StockPredictor:
-    def __init__(self):
+    def __init__(self, dtype='float64'):
+        # float32 halves the memory of scaled series for large universes;
+        # Keras trains in float32 either way
+        self.dtype = np.dtype(dtype)
         self.scaler = MinMaxScaler()
         self.lstm_model = None
+        self.lstm_engine = None
         self.lr_model = None
+        self.lr_residuals = None
+        self.lookback_period = None
+        self.fit_stats = None
         
-    def load_data(self, company):
+    def load_data(self, company, resolution=None):
         """Load stock data for the specified company"""
-        filename = f'../data/{company.lower()}_stock_data.csv'
-        df = pd.read_csv(filename)
-        df['Date'] = pd.to_datetime(df['Date'])
-        df = df.sort_values('Date')
-        return df
+        # CSV history plus ingested bars, already sorted by date; coarser
+        # resolutions come from the store's precomputed aggregates
+        return price_store.frame(company, resolution)
     
-    def prepare_data(self, df, lookback_period=None):
-        """Prepare data for machine learning models"""
+    def scale_data(self, df, lookback_period=None):
+        """Scale closing prices and choose the lookback window"""
         # Use closing prices for prediction
-        data = df['Close'].values.reshape(-1, 1)
+        data = df['Close'].values.astype(self.dtype, copy=False).reshape(-1, 1)
         
         # Adjust lookback period based on data size
         if lookback_period is None:
             lookback_period = min(10, len(data) // 3)  # Use smaller lookback for small datasets
         
         lookback_period = max(5, min(lookback_period, len(data) - 5))  # Ensure reasonable bounds
+        self.lookback_period = lookback_period
         
         # Scale the data
-        scaled_data = self.scaler.fit_transform(data)
+        return self.scaler.fit_transform(data)
+    
+    def prepare_data(self, df, lookback_period=None):
+        """Prepare data for machine learning models"""
+        scaled_data = self.scale_data(df, lookback_period)
+        lookback_period = self.lookback_period
         
         # Create sequences for LSTM
         X, y = [], []
@@ -50,41 +92,163 @@ class StockPredictor:
         
         return X, y, scaled_data
     
-    def create_lstm_model(self, input_shape):
-        """Create LSTM model for time series prediction"""
-        model = Sequential([
-            LSTM(50, return_sequences=True, input_shape=input_shape),
-            Dropout(0.2),
-            LSTM(50, return_sequences=True),
-            Dropout(0.2),
-            LSTM(50),
-            Dropout(0.2),
-            Dense(1)
-        ])
+    def make_window_dataset(self, scaled_data, start, end, batch_size=32,
+                            shuffle=False, cache=False, seed=LSTM_SEED):
+        """Stream (window, target) batches for samples [start, end) of the series
+
+        Windows are sliced from the 1-D series on the fly, so the
+        (samples, lookback, 1) tensor is never materialised unless cache is set.
+        """
+        tf = load_tensorflow()
+        lookback = self.lookback_period
+        series = tf.constant(np.asarray(scaled_data, dtype=np.float32).reshape(-1))
+        
+        def window(i):
+            return tf.reshape(series[i:i + lookback], (lookback, 1)), series[i + lookback]
+        
+        ds = tf.data.Dataset.range(start, end)
+        ds = ds.map(window, num_parallel_calls=tf.data.AUTOTUNE)
+        if cache:
+            ds = ds.cache()
+        if shuffle:
+            ds = ds.shuffle(end - start, seed=seed, reshuffle_each_iteration=True)
+        return ds.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+    
+    def create_lstm_model(self, input_shape, units=50, variant='stacked_lstm', seed=LSTM_SEED):
+        """Create a sequence model for time series prediction
+
+        variant selects the architecture: 'stacked_lstm' (3 LSTM layers, the
+        default), 'lstm' (single LSTM layer), 'gru' (single GRU layer) or
+        'tcn' (two dilated causal 1-D convolutions). The smaller variants
+        trade a little accuracy for much faster CPU training.
+
+        Every initializer and dropout layer gets its own seed derived from
+        seed, so the same seed builds the same model without touching the
+        process-wide random state that concurrent requests share.
+        """
+        keras = load_keras()
+        Sequential = keras.models.Sequential
+        layers = keras.layers
+        initializers = keras.initializers
+        seeds = itertools.count(seed)
+        
+        def recurrent(cls, **kwargs):
+            return cls(units, kernel_initializer=initializers.GlorotUniform(seed=next(seeds)),
+                       recurrent_initializer=initializers.Orthogonal(seed=next(seeds)),
+                       seed=next(seeds), **kwargs)
+        
+        def conv(dilation_rate):
+            return layers.Conv1D(units, 3, padding='causal', dilation_rate=dilation_rate,
+                                 activation='relu',
+                                 kernel_initializer=initializers.GlorotUniform(seed=next(seeds)))
+        
+        def dropout():
+            return layers.Dropout(0.2, seed=next(seeds))
+        
+        if variant == 'stacked_lstm':
+            body = [
+                recurrent(layers.LSTM, return_sequences=True),
+                dropout(),
+                recurrent(layers.LSTM, return_sequences=True),
+                dropout(),
+                recurrent(layers.LSTM),
+                dropout()
+            ]
+        elif variant == 'lstm':
+            body = [recurrent(layers.LSTM), dropout()]
+        elif variant == 'gru':
+            body = [recurrent(layers.GRU), dropout()]
+        elif variant == 'tcn':
+            body = [
+                conv(1),
+                conv(2),
+                layers.Flatten(),
+                dropout()
+            ]
+        else:
+            raise ValueError(f"Unknown model variant: {variant}")
+        
+        head = layers.Dense(1, kernel_initializer=initializers.GlorotUniform(seed=next(seeds)))
+        model = Sequential([keras.Input(shape=input_shape)] + body + [head])
         
         model.compile(optimizer='adam', loss='mean_squared_error')
         return model
     
-    def train_lstm(self, X, y):
-        """Train LSTM model"""
-        # Split data for training
-        train_size = int(len(X) * 0.8)
-        X_train, X_test = X[:train_size], X[train_size:]
-        y_train, y_test = y[:train_size], y[train_size:]
+    def train_lstm(self, scaled_data, units=50, epochs=20, batch_size=32,
+                   patience=5, cache_limit_mb=256, variant='stacked_lstm', seed=LSTM_SEED):
+        """Train LSTM model on windows streamed from the scaled series"""
+        keras = load_keras()
+        lookback = self.lookback_period
+        
+        # Split samples by time: train / validation (last 10% of train) / test
+        n_samples = len(scaled_data) - lookback
+        train_size = int(n_samples * 0.8)
+        val_start = int(train_size * 0.9)
+        
+        # Cache windows in memory only when they comfortably fit
+        window_mb = n_samples * lookback * 4 / 1e6
+        cache = window_mb <= cache_limit_mb
+        
+        with timer('predictor.windows'):
+            train_ds = self.make_window_dataset(scaled_data, 0, val_start, batch_size,
+                                                shuffle=True, cache=cache, seed=seed)
+            val_ds = None
+            if val_start < train_size:
+                val_ds = self.make_window_dataset(scaled_data, val_start, train_size,
+                                                  batch_size, cache=cache)
+            test_ds = self.make_window_dataset(scaled_data, train_size, n_samples, batch_size)
         
         # Create and train model
-        self.lstm_model = self.create_lstm_model((X.shape[1], 1))
+        self.lstm_model = self.create_lstm_model((lookback, 1), units=units, variant=variant,
+                                                 seed=seed)
         
-        # Train with reduced epochs for faster execution
-        self.lstm_model.fit(X_train, y_train, 
-                           batch_size=32, 
-                           epochs=20, 
-                           verbose=0,
-                           validation_split=0.1)
+        # Stop once validation loss stops improving, halving the LR on plateaus
+        monitor = 'val_loss' if val_ds is not None else 'loss'
+        callbacks = [
+            keras.callbacks.EarlyStopping(monitor=monitor, patience=patience,
+                                          restore_best_weights=True),
+            keras.callbacks.ReduceLROnPlateau(monitor=monitor, factor=0.5,
+                                              patience=max(1, patience // 2),
+                                              min_lr=1e-5)
+        ]
+        
+        start_time = time.perf_counter()
+        with timer('predictor.fit'):
+            history = self.lstm_model.fit(train_ds,
+                                          epochs=epochs,
+                                          verbose=0,
+                                          validation_data=val_ds,
+                                          callbacks=callbacks)
+        self.fit_stats = {
+            'epochs_run': len(history.epoch),
+            'max_epochs': epochs,
+            'fit_seconds': round(time.perf_counter() - start_time, 3),
+            # Error on the validation split, for choosing hyperparameters
+            # without looking at the test split
+            'val_rmse': (float(np.sqrt(self.lstm_model.evaluate(val_ds, verbose=0)))
+                         if val_ds is not None else None)
+        }
         
         # Calculate RMSE
-        predictions = self.lstm_model.predict(X_test, verbose=0)
-        rmse = np.sqrt(mean_squared_error(y_test, predictions))
+        with timer('predictor.evaluate'):
+            y_test = np.asarray(scaled_data[train_size + lookback:, 0])
+            predictions = self.lstm_model.predict(test_ds, verbose=0)
+            rmse = np.sqrt(mean_squared_error(y_test, predictions))
+        
+        # Serve rollouts from the lightweight engine; its parity with Keras
+        # is covered by tests/test_lstm_runtime.py
+        try:
+            engine = NumpyEngine.from_keras(self.lstm_model)
+        except ValueError:
+            engine = None
+        if engine is not None and CHECK_PARITY:
+            n_check = min(len(y_test), 256)
+            X_check = np.lib.stride_tricks.sliding_window_view(
+                scaled_data[train_size:train_size + n_check + lookback - 1, 0], lookback)
+            if not check_parity(engine.predict(X_check[..., np.newaxis]), predictions[:n_check]):
+                logger.warning('NumPy engine disagrees with Keras; serving rollouts from Keras')
+                engine = None
+        self.lstm_engine = engine
         
         return rmse
     
@@ -118,13 +282,20 @@ class StockPredictor:
         predictions = self.lr_model.predict(X_test)
         rmse = np.sqrt(mean_squared_error(y_test, predictions))
         
+        # Errors over the whole history, resampled for bootstrap bands
+        self.lr_residuals = y - self.lr_model.predict(X)
+        
         return rmse, df
     
     def predict_lstm(self, scaled_data, days_ahead=5):
         """Make predictions using LSTM model"""
-        # Use appropriate number of days based on available data
-        lookback_days = min(10, len(scaled_data) // 2)
-        lookback_days = max(5, lookback_days)
+        # Use the window the model was trained on, if known
+        if self.lookback_period is not None:
+            lookback_days = self.lookback_period
+        else:
+            # Use appropriate number of days based on available data
+            lookback_days = min(10, len(scaled_data) // 2)
+            lookback_days = max(5, lookback_days)
         
         last_days = scaled_data[-lookback_days:]
         
@@ -132,7 +303,10 @@ class StockPredictor:
         current_sequence = last_days.reshape(1, lookback_days, 1)
         
         for _ in range(days_ahead):
-            pred = self.lstm_model.predict(current_sequence, verbose=0)
+            if self.lstm_engine is not None:
+                pred = self.lstm_engine.predict(current_sequence)
+            else:
+                pred = self.lstm_model.predict(current_sequence, verbose=0)
             predictions.append(pred[0, 0])
             
             # Update sequence for next prediction
@@ -147,53 +321,131 @@ class StockPredictor:
     
     def predict_linear_regression(self, df, days_ahead=5):
         """Make predictions using Linear Regression model"""
-        last_row = df.iloc[-1].copy()
-        predictions = []
+        return self.rollout_linear_regression(df, days_ahead)[0]
+    
+    def rollout_linear_regression(self, df, days_ahead=5, n_paths=1, rng=None):
+        """Linear Regression rollout for n_paths paths at once
+
+        Each step's features are built from the previous step's close. With
+        rng, every step adds a residual drawn from the fit's residuals (a
+        residual bootstrap), so the paths spread out. Returns an
+        (n_paths, days_ahead) array.
+        """
+        last_row = df.iloc[-1]
+        close = np.full(n_paths, float(last_row['Close']))
+        day = last_row['Day']
+        paths = np.empty((n_paths, days_ahead))
         
         for i in range(days_ahead):
             # Create features for prediction
-            features = [
-                last_row['Day'] + i + 1,
-                last_row['Close'],  # Use previous close as open
-                last_row['Close'] * 1.02,  # Estimate high
-                last_row['Close'] * 0.98,  # Estimate low
-                last_row['Volume'],  # Use average volume
-                last_row['MA_5'],
-                last_row['MA_10'],
-                last_row['Volume_MA']
-            ]
+            features = np.column_stack([
+                np.full(n_paths, day + i + 1),
+                close,  # Use previous close as open
+                close * 1.02,  # Estimate high
+                close * 0.98,  # Estimate low
+                np.full(n_paths, last_row['Volume']),  # Use average volume
+                np.full(n_paths, last_row['MA_5']),
+                np.full(n_paths, last_row['MA_10']),
+                np.full(n_paths, last_row['Volume_MA'])
+            ])
             
-            pred = self.lr_model.predict([features])[0]
-            predictions.append(pred)
+            close = self.lr_model.predict(features)
+            if rng is not None:
+                close = close + rng.choice(self.lr_residuals, n_paths)
+            paths[:, i] = close
             
             # Update for next prediction
-            last_row['Close'] = pred
-            last_row['Day'] += 1
+            day += 1
         
-        return np.array(predictions)
+        return paths
     
-    def predict(self, company, model_type='LSTM', days_ahead=5):
-        """Main prediction function"""
+    def rollout_lstm_dropout(self, scaled_data, days_ahead, n_paths, rng):
+        """LSTM rollout for n_paths paths with dropout left on (MC dropout)
+
+        All paths go through the model as one batch per step, layer by layer,
+        and each draws its own dropout masks from rng (a NumPy Generator), so
+        the paths depend only on rng and not on Keras's random state. Returns
+        an (n_paths, days_ahead) price array.
+        """
+        if self.lstm_model is None:
+            raise ValueError('MC dropout bands need a model trained in this process')
+        Dropout = load_keras().layers.Dropout
+        lookback = self.lookback_period
+        window = np.asarray(scaled_data[-lookback:, 0], dtype=np.float32)
+        batch = np.repeat(window[np.newaxis, :, np.newaxis], n_paths, axis=0)
+        paths = np.empty((n_paths, days_ahead), dtype=np.float32)
+        
+        for i in range(days_ahead):
+            x = batch
+            for layer in self.lstm_model.layers:
+                if isinstance(layer, Dropout):
+                    # Inverted dropout, as Keras applies it in training
+                    x = np.asarray(x)
+                    keep = rng.random(x.shape, dtype=np.float32) >= layer.rate
+                    x = np.where(keep, x / (1.0 - layer.rate), 0.0).astype(np.float32)
+                else:
+                    x = layer(x, training=False)
+            step = np.asarray(x)[:, 0]
+            paths[:, i] = step
+            batch = np.concatenate([batch[:, 1:, :], step[:, np.newaxis, np.newaxis]], axis=1)
+        
+        return self.scaler.inverse_transform(paths.reshape(-1, 1)).reshape(n_paths, days_ahead)
+    
+    def forecast_bands(self, options, df, days_ahead, lr_df=None, scaled_data=None):
+        """Percentile bands for options from forecast_bands.band_options"""
+        method = options['method']
+        if method == 'gbm':
+            simulate = gbm_simulator(df['Close'].values, days_ahead)
+        elif method == 'bootstrap':
+            def simulate(rng, size):
+                return self.rollout_linear_regression(lr_df, days_ahead, size, rng)
+        else:
+            def simulate(rng, size):
+                return self.rollout_lstm_dropout(scaled_data, days_ahead, size, rng)
+        
+        with timer('predictor.bands'):
+            bands = percentile_bands(simulate, options['paths'], days_ahead,
+                                     options['percentiles'])
+        return dict(bands, method=method)
+    
+    def predict(self, company, model_type='LSTM', days_ahead=5, resolution=None, bands=None):
+        """Main prediction function
+
+        With a resolution (minute, hour, day or week) the models are trained
+        on bars of that size and days_ahead counts bars of that size. With
+        bands (see forecast_bands.band_options) the result also carries
+        percentile bands from simulated paths.
+        """
         try:
             # Load data
-            df = self.load_data(company)
+            with timer('predictor.load_data'):
+                df = self.load_data(company, resolution)
             
             if model_type == 'LSTM':
-                # Prepare data for LSTM
-                X, y, scaled_data = self.prepare_data(df)
+                # Use tuned hyperparameters when the registry has them
+                config = get_best_config(company) or {}
                 
-                # Train model
-                rmse = self.train_lstm(X, y)
+                with timer('training.LSTM'):
+                    # Prepare data for LSTM
+                    with timer('predictor.scale'):
+                        scaled_data = self.scale_data(df, config.get('lookback_period'))
+                    
+                    # Train model
+                    rmse = self.train_lstm(scaled_data,
+                                           units=config.get('units', 50),
+                                           epochs=config.get('epochs', 20),
+                                           variant=config.get('variant', 'stacked_lstm'))
                 
                 # Make predictions
-                predictions = self.predict_lstm(scaled_data, days_ahead)
+                with timer('predictor.rollout'):
+                    predictions = self.predict_lstm(scaled_data, days_ahead)
                 
                 # Get current price and calculate change
                 current_price = df['Close'].iloc[-1]
                 predicted_price = predictions[-1]
                 price_change = ((predicted_price - current_price) / current_price) * 100
                 
-                return {
+                result = {
                     'company': company,
                     'model_used': 'LSTM',
                     'current_price': float(current_price),
@@ -201,22 +453,30 @@ class StockPredictor:
                     'price_change_percent': float(price_change),
                     'predictions': predictions.tolist(),
                     'rmse': float(rmse),
-                    'days_ahead': days_ahead
+                    'days_ahead': days_ahead,
+                    'resolution': resolution,
+                    'training': self.fit_stats
                 }
+                if bands:
+                    result['bands'] = self.forecast_bands(bands, df, days_ahead,
+                                                          scaled_data=scaled_data)
+                return result
                 
             elif model_type == 'Linear_Regression':
                 # Train Linear Regression model
-                rmse, processed_df = self.train_linear_regression(df)
+                with timer('training.Linear_Regression'), timer('predictor.fit'):
+                    rmse, processed_df = self.train_linear_regression(df)
                 
                 # Make predictions
-                predictions = self.predict_linear_regression(processed_df, days_ahead)
+                with timer('predictor.rollout'):
+                    predictions = self.predict_linear_regression(processed_df, days_ahead)
                 
                 # Get current price and calculate change
                 current_price = df['Close'].iloc[-1]
                 predicted_price = predictions[-1]
                 price_change = ((predicted_price - current_price) / current_price) * 100
                 
-                return {
+                result = {
                     'company': company,
                     'model_used': 'Linear_Regression',
                     'current_price': float(current_price),
@@ -224,8 +484,13 @@ class StockPredictor:
                     'price_change_percent': float(price_change),
                     'predictions': predictions.tolist(),
                     'rmse': float(rmse),
-                    'days_ahead': days_ahead
+                    'days_ahead': days_ahead,
+                    'resolution': resolution
                 }
+                if bands:
+                    result['bands'] = self.forecast_bands(bands, df, days_ahead,
+                                                          lr_df=processed_df)
+                return result
                 
         except Exception as e:
             raise Exception(f"Prediction failed: {str(e)}")
@@ -0,0 +1,54 @@
+import json
+import os
+import threading
+from datetime import datetime
+
+REGISTRY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_registry.json')
+
+_lock = threading.Lock()
+
+# Lookups that found a tuned config ('hits') or fell back to defaults
+lookups = {'hits': 0, 'misses': 0}
+
+
+def load_registry(path=REGISTRY_PATH):
+    """Load the model registry, returning an empty registry if none exists"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def get_best_config(company, model_type='LSTM', path=REGISTRY_PATH):
+    """Return the best known hyperparameters for a company/model, or None"""
+    entry = load_registry(path).get(company.upper(), {}).get(model_type)
+    config = entry.get('config') if entry is not None else None
+    with _lock:
+        lookups['hits' if config is not None else 'misses'] += 1
+    return config
+
+
+def save_best_config(company, config, score, model_type='LSTM', path=REGISTRY_PATH,
+                     test_score=None):
+    """Record the best hyperparameters for a company/model in the registry
+
+    score is the validation RMSE they were chosen on; test_score, if given,
+    is the winner's RMSE on the held-out test split.
+    """
+    with _lock:
+        registry = load_registry(path)
+        registry.setdefault(company.upper(), {})[model_type] = {
+            'config': config,
+            'rmse': float(score),
+            'test_rmse': float(test_score) if test_score is not None else None,
+            'updated_at': datetime.now().isoformat(timespec='seconds')
+        }
+
+        # Write atomically so readers never see a half-written file
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(registry, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
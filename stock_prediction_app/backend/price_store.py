@@ -0,0 +1,428 @@
+import math
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from resampling import ResolutionPyramid
+
+# Company CSVs; overridable so benchmarks and tests can use their own data.
+# The default is found from this file, so scripts work from any directory
+DATA_DIR = os.environ.get('STOCK_APP_DATA_DIR', os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data'))
+# Append-only bar files live next to the CSVs unless redirected
+BAR_DIR = os.environ.get('STOCK_APP_BAR_DIR', DATA_DIR)
+
+# One bar as stored in memory and in the append-only files; time is
+# seconds since the epoch (UTC)
+BAR_DTYPE = np.dtype([
+    ('time', '<i8'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<i8')
+])
+BAR_FIELDS = (('Open', 'open'), ('High', 'high'), ('Low', 'low'),
+              ('Close', 'close'), ('Volume', 'volume'))
+
+
+def to_epoch_seconds(value):
+    """Convert a date string, datetime or epoch number to epoch seconds"""
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    return int(pd.Timestamp(value).value // 10**9)
+
+
+def to_records(bars):
+    """Convert bar dicts (Date, Open, High, Low, Close, Volume) to BAR_DTYPE"""
+    if isinstance(bars, np.ndarray) and bars.dtype == BAR_DTYPE:
+        return bars
+    records = np.empty(len(bars), dtype=BAR_DTYPE)
+    for i, bar in enumerate(bars):
+        records[i] = (to_epoch_seconds(bar['Date']), bar['Open'], bar['High'],
+                      bar['Low'], bar['Close'], bar['Volume'])
+    return records
+
+
+def frame_to_records(df):
+    """Convert a Date/Open/High/Low/Close/Volume DataFrame to BAR_DTYPE"""
+    records = np.empty(len(df), dtype=BAR_DTYPE)
+    records['time'] = pd.to_datetime(df['Date']).values.astype('datetime64[s]').astype(np.int64)
+    for column, field in BAR_FIELDS:
+        records[field] = df[column].to_numpy()
+    return records
+
+
+def records_to_frame(records):
+    """Convert BAR_DTYPE records to the DataFrame layout of the CSV files"""
+    df = pd.DataFrame({'Date': records['time'].astype('datetime64[s]').astype('datetime64[ns]')})
+    for column, field in BAR_FIELDS:
+        df[column] = records[field]
+    return df
+
+
+def record_to_bar(record):
+    return {
+        'Date': pd.Timestamp(int(record['time']), unit='s'),
+        'Open': float(record['open']),
+        'High': float(record['high']),
+        'Low': float(record['low']),
+        'Close': float(record['close']),
+        'Volume': int(record['volume'])
+    }
+
+
+def dedupe_sorted(records):
+    """Sort by time and keep the last bar seen for each timestamp"""
+    if len(records) < 2:
+        return records
+    records = records[np.argsort(records['time'], kind='stable')]
+    keep = np.append(records['time'][1:] != records['time'][:-1], True)
+    return records[keep]
+
+
+def same_file_version(old, new):
+    """Whether two os.stat results (or None for a missing file) show the same contents"""
+    if old is None or new is None:
+        return old is new
+    return old.st_mtime_ns == new.st_mtime_ns and old.st_size == new.st_size
+
+
+class BinaryBarWriter:
+    """Append-only file of BAR_DTYPE records
+
+    Bars are only ever appended, so writers never rewrite existing data and
+    readers can map the whole file with np.fromfile. A bar that replaces an
+    earlier one (same timestamp) is appended again; readers keep the last.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    @property
+    def size(self):
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def append(self, records):
+        if not len(records):
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'ab') as f:
+            f.write(np.ascontiguousarray(records, dtype=BAR_DTYPE).tobytes())
+
+    def read(self):
+        try:
+            # Ignore a partly written trailing record
+            count = self.size // BAR_DTYPE.itemsize
+            return np.fromfile(self.path, dtype=BAR_DTYPE, count=count)
+        except OSError:
+            return np.empty(0, dtype=BAR_DTYPE)
+
+
+class IncrementalIndicators:
+    """Moving averages, RSI and daily return updated in O(1) per bar
+
+    Keeps a ring buffer of the most recent closes plus running window sums,
+    so a new bar costs a handful of additions instead of recomputing the
+    rolling windows over the whole history. Values match the rolling-mean
+    definitions used by get_technical_indicators.
+    """
+
+    def __init__(self, ma_windows=(5, 10, 20), rsi_window=14):
+        self.ma_windows = tuple(ma_windows)
+        self.rsi_window = rsi_window
+        self.closes = deque(maxlen=max(max(self.ma_windows), rsi_window + 1))
+        self.count = 0
+        self._recompute()
+
+    def _recompute(self):
+        """Rebuild the running sums from the ring buffer"""
+        closes = list(self.closes)
+        self.ma_sums = {w: math.fsum(closes[-w:]) for w in self.ma_windows}
+        deltas = np.diff(closes[-(self.rsi_window + 1):])
+        self.gain_sum = float(deltas[deltas > 0].sum())
+        self.loss_sum = float(-deltas[deltas < 0].sum())
+
+    def prime(self, closes):
+        """Start from the tail of an existing series"""
+        self.closes.clear()
+        self.closes.extend(float(c) for c in closes[-self.closes.maxlen:])
+        self.count = len(closes)
+        self._recompute()
+        return self.values()
+
+    def update(self, close):
+        """Add the close of a new bar and return the indicator values"""
+        close = float(close)
+        closes = self.closes
+        n = len(closes)
+        for w in self.ma_windows:
+            if n >= w:
+                self.ma_sums[w] -= closes[n - w]
+            self.ma_sums[w] += close
+
+        r = self.rsi_window
+        if n >= r + 1:
+            self._remove_delta(closes[n - r] - closes[n - r - 1])
+        if n:
+            self._add_delta(close - closes[n - 1])
+
+        closes.append(close)
+        self.count += 1
+        # Keep floating point drift in the running sums from accumulating
+        if self.count % 4096 == 0:
+            self._recompute()
+        return self.values()
+
+    def replace_last(self, close):
+        """Correct the close of the most recent bar"""
+        self.closes[-1] = float(close)
+        self._recompute()
+        return self.values()
+
+    def _add_delta(self, delta):
+        if delta > 0:
+            self.gain_sum += delta
+        else:
+            self.loss_sum -= delta
+
+    def _remove_delta(self, delta):
+        if delta > 0:
+            self.gain_sum -= delta
+        else:
+            self.loss_sum += delta
+
+    def values(self):
+        closes = self.closes
+        values = {}
+        for w in self.ma_windows:
+            values[f'MA_{w}'] = self.ma_sums[w] / w if self.count >= w else math.nan
+
+        # Same warm-up as the pandas rolling version, which counts the first
+        # (undefined) change as zero
+        if self.count >= self.rsi_window:
+            gain, loss = max(self.gain_sum, 0.0), max(self.loss_sum, 0.0)
+            if loss > 0:
+                values['RSI'] = 100 - 100 / (1 + gain / loss)
+            else:
+                values['RSI'] = 100.0 if gain > 0 else math.nan
+        else:
+            values['RSI'] = math.nan
+
+        values['Daily_Return'] = closes[-1] / closes[-2] - 1 if len(closes) >= 2 else math.nan
+        return values
+
+
+class PriceSeries:
+    """All bars of one company, held in a growable NumPy array"""
+
+    def __init__(self, company, records, writer, csv_stat=None):
+        self.company = company
+        self.writer = writer
+        self._bars = records
+        self.size = len(records)
+        self.version = 0
+        self.csv_stat = csv_stat
+        self.binary_bytes = writer.size
+        self.modified = max(csv_stat.st_mtime if csv_stat else 0.0,
+                            os.path.getmtime(writer.path) if self.binary_bytes else 0.0)
+        self.indicators = IncrementalIndicators()
+        self.indicators.prime(records['close'])
+        # Coarser resolutions, built on first request and then kept current
+        self.pyramid = None
+        self._frames = {}
+
+    @property
+    def bars(self):
+        return self._bars[:self.size]
+
+    @property
+    def last_time(self):
+        return int(self._bars['time'][self.size - 1]) if self.size else None
+
+    @property
+    def etag(self):
+        """Validator that changes whenever the CSV or the appended bars change"""
+        mtime_ns = self.csv_stat.st_mtime_ns if self.csv_stat else 0
+        csv_size = self.csv_stat.st_size if self.csv_stat else 0
+        return f'{mtime_ns:x}-{csv_size:x}-{self.binary_bytes:x}'
+
+    def _reserve(self, extra):
+        needed = self.size + extra
+        if needed > len(self._bars):
+            grown = np.empty(max(needed, 2 * len(self._bars), 64), dtype=BAR_DTYPE)
+            grown[:self.size] = self._bars[:self.size]
+            self._bars = grown
+
+
+class PriceStore:
+    """In-memory price history per company, kept current by ingestion
+
+    Each company is loaded from its CSV plus the append-only binary file of
+    bars ingested since, and loaded again when the CSV's size or mtime
+    changes (one stat per lookup), so edits show up without a restart. New bars are applied to memory, the incremental
+    indicators and the binary file together, and bump the series version so
+    caches keyed on it can tell the data changed.
+    """
+
+    def __init__(self, data_dir=DATA_DIR, bar_dir=BAR_DIR):
+        self.data_dir = data_dir
+        self.bar_dir = bar_dir
+        self._series = {}
+        self._lock = threading.RLock()
+        # Lookups of the per-version DataFrame cache
+        self.frame_hits = 0
+        self.frame_misses = 0
+
+    def csv_path(self, company):
+        return os.path.join(self.data_dir, f'{company.lower()}_stock_data.csv')
+
+    def binary_path(self, company):
+        return os.path.join(self.bar_dir, f'{company.lower()}_bars.bin')
+
+    def _read_csv(self, path):
+        # Chunked with explicit dtypes, so peak memory is bounded by the
+        # chunk size rather than the file size
+        from data_loader import read_bars
+
+        return read_bars(path)
+
+    def series(self, company, create=False):
+        """The series for company, loaded on first use and when its CSV changes
+
+        Raises FileNotFoundError for a company with no data unless create is
+        set, in which case an empty series is started for it.
+        """
+        company = company.upper()
+        csv_path = self.csv_path(company)
+        try:
+            csv_stat = os.stat(csv_path)
+        except OSError:
+            csv_stat = None
+        with self._lock:
+            series = self._series.get(company)
+            if series is not None and same_file_version(series.csv_stat, csv_stat):
+                return series
+
+            writer = BinaryBarWriter(self.binary_path(company))
+            records = np.empty(0, dtype=BAR_DTYPE)
+            if csv_stat is not None:
+                records = self._read_csv(csv_path)
+            if not len(records) and not writer.size and not create:
+                raise FileNotFoundError(f'No data for {company}')
+
+            records = dedupe_sorted(records)
+            appended = writer.read()
+            if len(appended):
+                appended = dedupe_sorted(appended)
+                if len(records):
+                    # Bars re-sent for the last CSV timestamp override it
+                    records = records[records['time'] < appended['time'][0]]
+                records = np.concatenate([records, appended])
+
+            series = PriceSeries(company, records, writer, csv_stat)
+            self._series[company] = series
+            return series
+
+    def version(self, company):
+        return self.series(company).version
+
+    def bars(self, company, resolution=None):
+        """Records for company as stored, or aggregated to resolution
+
+        Raises ValueError for an unknown resolution or one finer than the data.
+        """
+        series = self.series(company)
+        with self._lock:
+            if resolution is None:
+                return series.bars
+            if series.pyramid is None:
+                series.pyramid = ResolutionPyramid(series.bars)
+            return series.pyramid.get(resolution)
+
+    def frame(self, company, resolution=None):
+        """DataFrame of Date/Open/High/Low/Close/Volume sorted by date
+
+        Built once per version and resolution; callers get their own copy.
+        """
+        series = self.series(company)
+        with self._lock:
+            cached = series._frames.get(resolution)
+            if cached is None or cached[0] != series.version:
+                self.frame_misses += 1
+                cached = (series.version, records_to_frame(self.bars(company, resolution)))
+                series._frames[resolution] = cached
+            else:
+                self.frame_hits += 1
+            return cached[1].copy()
+
+    def append(self, company, bars, timings=None):
+        """Apply new bars for one company
+
+        Bars older than the latest stored bar are dropped; a bar with the same
+        timestamp as the latest replaces it. Returns a list of (bar,
+        indicators) for every bar applied. When timings is a dict, the
+        seconds spent in each stage are added to it.
+        """
+        records = dedupe_sorted(to_records(bars))
+        applied = []
+        with self._lock:
+            series = self.series(company, create=True)
+
+            last_time = series.last_time
+            if last_time is not None:
+                records = records[records['time'] >= last_time]
+            if not len(records):
+                return applied
+
+            # Written to disk first, so memory is never ahead of the file
+            started = time.perf_counter()
+            series.writer.append(records)
+            series.binary_bytes += records.nbytes
+            binary_done = time.perf_counter()
+
+            replace_last = last_time is not None and records['time'][0] == last_time
+            if replace_last:
+                series._bars[series.size - 1] = records[0]
+            new = records[1:] if replace_last else records
+            series._reserve(len(new))
+            series._bars[series.size:series.size + len(new)] = new
+            series.size += len(new)
+            if series.pyramid is not None:
+                series.pyramid.update(series.bars)
+            store_done = time.perf_counter()
+
+            for i, record in enumerate(records):
+                if i == 0 and replace_last:
+                    values = series.indicators.replace_last(record['close'])
+                else:
+                    values = series.indicators.update(record['close'])
+                applied.append((record_to_bar(record), values))
+            indicators_done = time.perf_counter()
+
+            series.version += 1
+            series.modified = time.time()
+
+        if timings is not None:
+            timings['binary'] = timings.get('binary', 0.0) + binary_done - started
+            timings['store'] = timings.get('store', 0.0) + store_done - binary_done
+            timings['indicators'] = timings.get('indicators', 0.0) + indicators_done - store_done
+        return applied
+
+    def reload(self, company=None):
+        """Forget loaded series so they are read again from disk"""
+        with self._lock:
+            if company is None:
+                self._series.clear()
+            else:
+                self._series.pop(company.upper(), None)
+
+
+store = PriceStore()
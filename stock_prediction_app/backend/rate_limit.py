@@ -0,0 +1,229 @@
+"""
+Admission control for expensive work.
+
+RateLimiter is a token bucket per key (e.g. per user): each request takes
+tokens, which refill at a fixed rate up to a burst size. A caller that is
+out of tokens is told how long until it may retry. State is a small
+in-memory map; with db_path set it is also written to SQLite now and then,
+so a restart does not hand every user a fresh burst.
+
+ConcurrencyLimiter caps how many holders run at once (e.g. model training).
+Callers over the cap either queue for a while or are rejected at once,
+depending on its policy. Either way they learn when to retry.
+"""
+
+import atexit
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import metrics
+
+QUEUE = 'queue'
+REJECT = 'reject'
+
+
+class Rejected(Exception):
+    """Raised when a ConcurrencyLimiter turns a caller away"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """Token bucket per key: rate tokens per second, up to burst
+
+    A rate of 0 or less disables the limiter.
+    """
+
+    def __init__(self, name, rate, burst, max_keys=100000, db_path=None, flush_interval=30.0):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        # key -> [tokens, monotonic time of the last update], least recent first
+        self._buckets = OrderedDict()
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._loaded = db_path is None
+        self._last_flush = time.monotonic()
+        self.allowed = 0
+        self.limited = 0
+        if db_path is not None:
+            atexit.register(self.flush)
+
+    def acquire(self, key, cost=1.0):
+        """Take cost tokens from key's bucket
+
+        Returns 0.0 when they were taken, otherwise the seconds until the
+        bucket will hold enough (nothing is taken then).
+        """
+        if self.rate <= 0:
+            return 0.0
+        key = str(key)
+        now = time.monotonic()
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                tokens = self.burst
+            else:
+                tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                self._buckets.move_to_end(key)
+
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0.0
+                self.allowed += 1
+            else:
+                wait = (cost - tokens) / self.rate
+                self.limited += 1
+            self._buckets[key] = [tokens, now]
+            if self.db_path is not None:
+                self._dirty.add(key)
+
+            # A forgotten key starts again with a full bucket
+            while len(self._buckets) > self.max_keys:
+                evicted, _ = self._buckets.popitem(last=False)
+                self._dirty.discard(evicted)
+
+            flush_due = (self.db_path is not None
+                         and now - self._last_flush >= self.flush_interval)
+            if flush_due:
+                self._last_flush = now
+        if flush_due:
+            self.flush()
+        return wait
+
+    def _connect(self):
+        conn = metrics.connect(self.db_path)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS rate_limits (
+                limiter TEXT NOT NULL,
+                key TEXT NOT NULL,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL,
+                PRIMARY KEY (limiter, key)
+            )
+        ''')
+        return conn
+
+    def _load(self):
+        """Read saved buckets that are not yet full again; called with the lock held"""
+        self._loaded = True
+        try:
+            conn = self._connect()
+            try:
+                rows = conn.execute('SELECT key, tokens, updated FROM rate_limits '
+                                    'WHERE limiter = ?', (self.name,)).fetchall()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"Loading rate limits failed: {e}")
+            return
+
+        # Saved with wall-clock times; buckets run on the monotonic clock
+        offset = time.monotonic() - time.time()
+        for key, tokens, updated in rows:
+            if tokens + (time.time() - updated) * self.rate < self.burst:
+                self._buckets[key] = [tokens, updated + offset]
+
+    def flush(self):
+        """Write buckets changed since the last flush to SQLite"""
+        if self.db_path is None:
+            return
+        with self._lock:
+            offset = time.time() - time.monotonic()
+            rows = [(self.name, key, self._buckets[key][0], self._buckets[key][1] + offset)
+                    for key in self._dirty if key in self._buckets]
+            self._dirty.clear()
+        if not rows:
+            return
+        with self._flush_lock:
+            try:
+                conn = self._connect()
+                try:
+                    conn.executemany('INSERT OR REPLACE INTO rate_limits VALUES (?, ?, ?, ?)', rows)
+                    conn.commit()
+                finally:
+                    conn.close()
+            except Exception as e:
+                print(f"Saving rate limits failed: {e}")
+
+    def stats(self):
+        return {'rate': self.rate, 'burst': self.burst, 'keys': len(self._buckets),
+                'allowed': self.allowed, 'limited': self.limited}
+
+
+class ConcurrencyLimiter:
+    """At most limit holders at once
+
+    With the queue policy, callers over the limit wait up to max_wait
+    seconds, but no more than max_queue of them at a time. With the reject
+    policy they are turned away at once. Rejected carries a retry estimate
+    from how long holders have recently kept their slot.
+    """
+
+    def __init__(self, name, limit, policy=QUEUE, max_queue=16, max_wait=30.0):
+        if policy not in (QUEUE, REJECT):
+            raise ValueError(f'Unknown policy: {policy}')
+        self.name = name
+        self.limit = limit
+        self.policy = policy
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        # Moving average of how long a slot is held, in seconds
+        self.hold_seconds = None
+        self._condition = threading.Condition()
+
+    def _reject(self):
+        self.rejected += 1
+        hold = self.hold_seconds if self.hold_seconds is not None else 1.0
+        retry_after = max(1, math.ceil(hold * (self.waiting + 1) / self.limit))
+        raise Rejected(f'Too many {self.name} jobs running; please retry', retry_after)
+
+    @contextmanager
+    def slot(self):
+        """Hold one slot for the duration of the block; may raise Rejected"""
+        with self._condition:
+            if self.active >= self.limit:
+                if self.policy == REJECT or self.waiting >= self.max_queue:
+                    self._reject()
+                self.waiting += 1
+                try:
+                    admitted = self._condition.wait_for(lambda: self.active < self.limit,
+                                                        self.max_wait)
+                finally:
+                    self.waiting -= 1
+                if not admitted:
+                    self._reject()
+            self.active += 1
+            self.admitted += 1
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            held = time.monotonic() - started
+            with self._condition:
+                self.active -= 1
+                self.hold_seconds = (held if self.hold_seconds is None
+                                     else 0.8 * self.hold_seconds + 0.2 * held)
+                self._condition.notify()
+
+    def stats(self):
+        return {'limit': self.limit, 'policy': self.policy, 'active': self.active,
+                'waiting': self.waiting, 'admitted': self.admitted, 'rejected': self.rejected,
+                'hold_seconds': round(self.hold_seconds, 3) if self.hold_seconds is not None
+                else None}
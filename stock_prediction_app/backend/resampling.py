@@ -0,0 +1,141 @@
+import numpy as np
+
+# Supported resolutions, finest first, with their bucket length in seconds
+RESOLUTIONS = {
+    'minute': 60,
+    'hour': 3600,
+    'day': 86400,
+    'week': 7 * 86400
+}
+# The epoch fell on a Thursday; shifting by three days puts week buckets on Mondays
+WEEK_OFFSET = 3 * 86400
+
+
+def bucket_starts(times, resolution):
+    """Start of the bucket each timestamp (epoch seconds) falls in"""
+    seconds = RESOLUTIONS[resolution]
+    offset = WEEK_OFFSET if resolution == 'week' else 0
+    return (times + offset) // seconds * seconds - offset
+
+
+def native_resolution(times):
+    """The finest resolution that the spacing of these timestamps supports"""
+    if len(times) < 2:
+        return 'day'
+    spacing = np.median(np.diff(times))
+    for resolution, seconds in RESOLUTIONS.items():
+        if spacing <= seconds:
+            return resolution
+    return 'week'
+
+
+def resample(records, resolution):
+    """Aggregate time-sorted OHLCV records into coarser bars
+
+    Bucket boundaries are found once and every field is reduced with a single
+    vectorised reduceat over them: first open, max high, min low, last close
+    and summed volume. Each output bar is stamped with its bucket start.
+    """
+    if not len(records):
+        return records[:0]
+
+    keys = bucket_starts(records['time'], resolution)
+    starts = np.flatnonzero(np.diff(keys)) + 1
+    starts = np.concatenate(([0], starts))
+    ends = np.append(starts[1:], len(records)) - 1
+
+    bars = np.empty(len(starts), dtype=records.dtype)
+    bars['time'] = keys[starts]
+    bars['open'] = records['open'][starts]
+    bars['high'] = np.maximum.reduceat(records['high'], starts)
+    bars['low'] = np.minimum.reduceat(records['low'], starts)
+    bars['close'] = records['close'][ends]
+    bars['volume'] = np.add.reduceat(records['volume'], starts)
+    return bars
+
+
+class _Level:
+    """Bars of one resolution in a buffer that grows by doubling"""
+
+    def __init__(self, bars):
+        self._buffer = bars
+        self.size = len(bars)
+
+    @property
+    def bars(self):
+        return self._buffer[:self.size]
+
+    def replace_tail(self, keep, bars):
+        """Keep the first keep bars and put bars after them"""
+        needed = keep + len(bars)
+        if needed > len(self._buffer):
+            grown = np.empty(max(needed, 2 * len(self._buffer)), dtype=self._buffer.dtype)
+            grown[:keep] = self._buffer[:keep]
+            self._buffer = grown
+        self._buffer[keep:needed] = bars
+        self.size = needed
+
+
+class ResolutionPyramid:
+    """Cached resolutions built on top of one series of fine bars
+
+    Levels start at the native resolution of the base (so finer bars that
+    arrive later, such as minute bars after a daily history, are folded into
+    it) and each is aggregated from the level below it (minute → hour → day
+    → week). That gives the same bars as aggregating the base directly
+    because every reduction is associative. When bars are appended (or the
+    last one is corrected) only the buckets from the first changed timestamp
+    onwards are recomputed at each level.
+    """
+
+    def __init__(self, base):
+        self.native = native_resolution(base['time'])
+        names = list(RESOLUTIONS)
+        self.resolutions = names[names.index(self.native):]
+        self.levels = {}
+        self.base_size = len(base)
+        finer = base
+        for resolution in self.resolutions:
+            finer = resample(finer, resolution)
+            self.levels[resolution] = _Level(finer)
+
+    def supports(self, resolution):
+        return resolution in self.levels
+
+    def get(self, resolution=None):
+        """Bars at resolution (default: the native resolution)"""
+        if resolution is None:
+            resolution = self.native
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f'Unknown resolution: {resolution}')
+        if resolution not in self.levels:
+            raise ValueError(f'Data for this company is only available at '
+                             f'{self.native} resolution or coarser')
+        return self.levels[resolution].bars
+
+    def update(self, base):
+        """Bring every level up to date with a base series that has grown
+
+        The last bar already seen is reprocessed too, since appends may have
+        replaced it.
+        """
+        if len(base) < self.base_size:
+            # The base shrank; it was reloaded, so start over
+            self.__init__(base)
+            return
+
+        changed_from = self.base_size - 1 if self.base_size else 0
+        if changed_from >= len(base):
+            return
+        from_time = base['time'][changed_from]
+        self.base_size = len(base)
+
+        finer = base
+        for resolution in self.resolutions:
+            start = bucket_starts(np.array([from_time]), resolution)[0]
+            level = self.levels[resolution]
+            keep = np.searchsorted(level.bars['time'], start, side='left')
+            tail = finer[np.searchsorted(finer['time'], start, side='left'):]
+            level.replace_tail(keep, resample(tail, resolution))
+            finer = level.bars
+            from_time = start
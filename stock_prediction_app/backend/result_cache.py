@@ -0,0 +1,144 @@
+"""
+Memoised prediction results.
+
+The same prediction request against the same data gives the same answer
+(LSTM training is seeded), so results are cached under a key that includes
+the company's data version (the price store ETag); new bars change the key
+instead of needing an invalidation. Entries also expire after a TTL and the
+least recently used are evicted beyond max_entries.
+
+Concurrent misses for one key are coalesced: the first caller computes and
+the rest wait for its result, so a burst of identical requests trains once.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+HIT = 'hit'
+MISS = 'miss'
+COALESCED = 'coalesced'
+
+
+class _Flight:
+    """A computation in progress that other callers can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResultCache:
+    """TTL + LRU cache with single-flight computation"""
+
+    def __init__(self, max_entries=256, ttl=600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.errors = 0
+
+    def get(self, key):
+        """Cached value for key, or None"""
+        with self._lock:
+            return self._get(key, time.monotonic())
+
+    def _get(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires <= now:
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._put(key, value)
+
+    def _put(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        """Return (value, status) where status is HIT, MISS or COALESCED
+
+        Errors are not cached; every caller waiting on a failed computation
+        gets the same exception.
+        """
+        with self._lock:
+            value = self._get(key, time.monotonic())
+            if value is not None:
+                self.hits += 1
+                return value, HIT
+
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, COALESCED
+
+        try:
+            flight.value = compute()
+        except Exception as e:
+            flight.error = e
+            with self._lock:
+                self.errors += 1
+            raise
+        else:
+            with self._lock:
+                self._put(key, flight.value)
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.value, MISS
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'in_flight': len(self._flights),
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'errors': self.errors,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                # Coalesced callers were spared a computation too
+                'hit_rate': round((self.hits + self.coalesced) / lookups, 4) if lookups else None
+            }
+
+
+def prediction_key(company, model_type, days_ahead, resolution, data_version, bands=None):
+    if bands:
+        bands = (bands['method'], bands['paths'], tuple(bands['percentiles']))
+    return (company.upper(), model_type, days_ahead, resolution, data_version, bands)
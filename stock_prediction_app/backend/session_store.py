@@ -0,0 +1,447 @@
+"""
+Server-side sessions.
+
+The session cookie carries only a random session id, signed with the app's
+secret key; the session itself (user id, admin flag, cached profile) lives
+in a SessionStore. Every lookup goes through an in-memory LRU first, so an
+authenticated request costs one dict lookup. Behind it sits one of:
+
+- nothing ('memory'): the LRU is the store, for a single process;
+- SQLite ('sqlite'): a sessions table, shared by every worker process and
+  by the Flask and Quart apps;
+- Redis ('redis'): any client with get/set(ex=)/delete, either redis-py
+  from a URL or LocalRedis, an in-process stand-in with the same calls.
+
+With a shared backend, a cached entry is trusted for local_ttl seconds
+before it is read again, so a logout in one process reaches the others
+within that time. Sessions expire ttl seconds after they were last saved,
+and are saved again once they are half way there, so active users stay
+signed in. Expired rows are swept now and then as sessions are saved.
+
+Every backend can also find a user's sessions (a user_id column, a Redis
+set per user, a scan of the LRU), so a password change can sign the user
+out everywhere else.
+"""
+
+import json
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from flask.sessions import SecureCookieSession, SessionInterface
+from itsdangerous import BadSignature, Signer
+
+import metrics
+
+# load() result when only the local cache was consulted and it had nothing
+NOT_CACHED = object()
+
+
+class ServerSession(SecureCookieSession):
+    """Session dict that remembers its id and expiry"""
+
+    def __init__(self, initial=None, sid=None, expires=None):
+        super().__init__(initial)
+        self.sid = sid
+        self.expires = expires
+        # Old id to drop when the session is saved under a fresh one
+        self.replaces = None
+
+    def regenerate(self):
+        """Save under a new id, e.g. at login, so an id seen before is useless"""
+        if self.sid is not None:
+            self.replaces = self.sid
+        self.sid = None
+        self.modified = True
+
+
+class LocalRedis:
+    """In-process stand-in for the few Redis calls SessionStore makes"""
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires <= time.time():
+                del self._values[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        with self._lock:
+            self._values[key] = (value, time.time() + ex if ex else None)
+        return True
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(self._values.pop(key, None) is not None for key in keys)
+
+    def sadd(self, key, *members):
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None or not isinstance(entry[0], set):
+                entry = (set(), None)
+            values = {m.encode('utf-8') if isinstance(m, str) else m for m in members}
+            added = len(values - entry[0])
+            self._values[key] = (entry[0] | values, entry[1])
+            return added
+
+    def smembers(self, key):
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None or (entry[1] is not None and entry[1] <= time.time()):
+                return set()
+            return set(entry[0])
+
+    def srem(self, key, *members):
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                return 0
+            values = {m.encode('utf-8') if isinstance(m, str) else m for m in members}
+            self._values[key] = (entry[0] - values, entry[1])
+            return len(entry[0] & values)
+
+    def expire(self, key, seconds):
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                return False
+            self._values[key] = (entry[0], time.time() + seconds)
+            return True
+
+
+class SQLiteBackend:
+    """Sessions in a SQLite table, visible to every process using the file"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._schema_ready = False
+
+    def _connect(self):
+        conn = metrics.connect(self.db_path)
+        if not self._schema_ready:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS sessions (
+                    sid TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    expires REAL NOT NULL,
+                    user_id INTEGER
+                )
+            ''')
+            # Tables made before sessions could be looked up by user
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(sessions)')]
+            if 'user_id' not in columns:
+                conn.execute('ALTER TABLE sessions ADD COLUMN user_id INTEGER')
+                conn.execute("UPDATE sessions SET user_id = json_extract(data, '$.user_id')")
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (user_id)')
+            conn.commit()
+            self._schema_ready = True
+        return conn
+
+    def get(self, sid):
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT data, expires FROM sessions WHERE sid = ?',
+                               (sid,)).fetchone()
+        finally:
+            conn.close()
+        if row is None or row[1] <= time.time():
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, sid, data, expires):
+        conn = self._connect()
+        try:
+            conn.execute('INSERT OR REPLACE INTO sessions (sid, data, expires, user_id) '
+                         'VALUES (?, ?, ?, ?)',
+                         (sid, json.dumps(data), expires, data.get('user_id')))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def delete(self, sid):
+        conn = self._connect()
+        try:
+            conn.execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def delete_user(self, user_id, keep=None):
+        """Delete user_id's sessions other than keep; returns their ids"""
+        conn = self._connect()
+        try:
+            sids = [row[0] for row in conn.execute(
+                'SELECT sid FROM sessions WHERE user_id = ? AND sid IS NOT ?', (user_id, keep))]
+            conn.executemany('DELETE FROM sessions WHERE sid = ?', [(sid,) for sid in sids])
+            conn.commit()
+        finally:
+            conn.close()
+        return sids
+
+    def sweep(self, now):
+        conn = self._connect()
+        try:
+            conn.execute('DELETE FROM sessions WHERE expires <= ?', (now,))
+            conn.commit()
+        finally:
+            conn.close()
+
+
+class RedisBackend:
+    """Sessions as Redis keys; Redis expires them itself
+
+    Each user also has a set of their session ids, kept alive as long as
+    their newest session, for delete_user.
+    """
+
+    def __init__(self, client, prefix='stock_app:session:'):
+        self.client = client
+        self.prefix = prefix
+
+    def _user_key(self, user_id):
+        return f'{self.prefix}user:{user_id}'
+
+    def get(self, sid):
+        value = self.client.get(self.prefix + sid)
+        if value is None:
+            return None
+        entry = json.loads(value)
+        return entry['data'], entry['expires']
+
+    def set(self, sid, data, expires):
+        ttl = max(1, int(expires - time.time()))
+        self.client.set(self.prefix + sid, json.dumps({'data': data, 'expires': expires}), ex=ttl)
+        if data.get('user_id') is not None:
+            user_key = self._user_key(data['user_id'])
+            self.client.sadd(user_key, sid)
+            self.client.expire(user_key, ttl)
+
+    def delete(self, sid):
+        self.client.delete(self.prefix + sid)
+
+    def delete_user(self, user_id, keep=None):
+        user_key = self._user_key(user_id)
+        sids = [sid.decode('utf-8') if isinstance(sid, bytes) else sid
+                for sid in self.client.smembers(user_key)]
+        sids = [sid for sid in sids if sid != keep]
+        if sids:
+            self.client.delete(*[self.prefix + sid for sid in sids])
+            self.client.srem(user_key, *sids)
+        return sids
+
+    def sweep(self, now):
+        pass
+
+
+class SessionStore:
+    """LRU of sessions in this process, in front of an optional shared backend"""
+
+    def __init__(self, backend=None, ttl=86400.0, local_ttl=5.0, max_local=100000,
+                 sweep_interval=300.0):
+        self.backend = backend
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.max_local = max_local
+        self.sweep_interval = sweep_interval
+        # sid -> (data, expires, monotonic time until which the entry is trusted)
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+
+    def new_sid(self):
+        return secrets.token_urlsafe(32)
+
+    def _cache(self, sid, data, expires):
+        trusted = float('inf') if self.backend is None else time.monotonic() + self.local_ttl
+        with self._lock:
+            self._local[sid] = (data, expires, trusted)
+            self._local.move_to_end(sid)
+            while len(self._local) > self.max_local:
+                self._local.popitem(last=False)
+
+    def load(self, sid, local_only=False):
+        """(data, expires) for sid, or None if it has expired or never existed
+
+        With local_only, returns NOT_CACHED instead of reading the backend.
+        """
+        with self._lock:
+            entry = self._local.get(sid)
+            if entry is not None:
+                data, expires, trusted = entry
+                if expires <= time.time():
+                    del self._local[sid]
+                elif trusted > time.monotonic():
+                    self._local.move_to_end(sid)
+                    self.hits += 1
+                    return data, expires
+            if self.backend is None:
+                self.misses += 1
+                return None
+        if local_only:
+            return NOT_CACHED
+
+        self.misses += 1
+        found = self.backend.get(sid)
+        if found is None:
+            with self._lock:
+                self._local.pop(sid, None)
+            return None
+        self._cache(sid, *found)
+        return found
+
+    def save(self, sid, data, replaces=None):
+        """Store data under sid until ttl from now; returns the expiry"""
+        expires = time.time() + self.ttl
+        if self.backend is not None:
+            self.backend.set(sid, data, expires)
+        self._cache(sid, data, expires)
+        if replaces is not None:
+            self.delete(replaces)
+        self._maybe_sweep()
+        return expires
+
+    def delete(self, sid):
+        with self._lock:
+            self._local.pop(sid, None)
+        if self.backend is not None:
+            self.backend.delete(sid)
+
+    def delete_user(self, user_id, keep=None):
+        """Sign user_id out of every session but keep (e.g. at a password change)
+
+        Other processes drop their cached copies within local_ttl seconds.
+        """
+        with self._lock:
+            sids = [sid for sid, entry in self._local.items()
+                    if entry[0].get('user_id') == user_id and sid != keep]
+            for sid in sids:
+                del self._local[sid]
+        if self.backend is not None:
+            for sid in self.backend.delete_user(user_id, keep):
+                with self._lock:
+                    self._local.pop(sid, None)
+
+    def _maybe_sweep(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_sweep < self.sweep_interval:
+                return
+            self._last_sweep = now
+            wall = time.time()
+            expired = [sid for sid, entry in self._local.items() if entry[1] <= wall]
+            for sid in expired:
+                del self._local[sid]
+        if self.backend is not None:
+            try:
+                self.backend.sweep(wall)
+            except Exception as e:
+                print(f"Sweeping expired sessions failed: {e}")
+
+    def stats(self):
+        return {'backend': type(self.backend).__name__ if self.backend is not None else 'memory',
+                'cached': len(self._local), 'hits': self.hits, 'misses': self.misses,
+                'ttl': self.ttl, 'local_ttl': self.local_ttl}
+
+
+def create_store(kind='sqlite', db_path=None, redis_url=None, **options):
+    """SessionStore with the named backend: memory, sqlite or redis"""
+    if kind == 'memory':
+        return SessionStore(None, **options)
+    if kind == 'sqlite':
+        return SessionStore(SQLiteBackend(db_path), **options)
+    if kind == 'redis':
+        if redis_url:
+            import redis
+            client = redis.Redis.from_url(redis_url)
+        else:
+            client = LocalRedis()
+        return SessionStore(RedisBackend(client), **options)
+    raise ValueError(f'Unknown session store: {kind}')
+
+
+class ServerSessionInterface(SessionInterface):
+    """Flask session interface keeping sessions in a SessionStore
+
+    The cookie helpers only read app.config, so asgi_app reuses this class
+    for Quart and just moves the store calls off the event loop.
+    """
+
+    salt = 'stock-app-session'
+
+    def __init__(self, store):
+        self.store = store
+
+    def read_sid(self, app, request):
+        """The verified session id from the request's cookie, or None"""
+        value = request.cookies.get(self.get_cookie_name(app))
+        if not value or not app.secret_key:
+            return None
+        try:
+            return Signer(app.secret_key, salt=self.salt).unsign(value).decode('utf-8')
+        except BadSignature:
+            return None
+
+    def make_session(self, sid, found):
+        if found is None:
+            return ServerSession()
+        data, expires = found
+        return ServerSession(data, sid=sid, expires=expires)
+
+    def open_session(self, app, request):
+        sid = self.read_sid(app, request)
+        return self.make_session(sid, self.store.load(sid) if sid else None)
+
+    def needs_save(self, session):
+        """Whether save_session would write to or delete from the store"""
+        if not session:
+            return session.sid is not None or session.replaces is not None
+        # Unchanged sessions are saved again half way to expiry
+        return (session.modified or session.expires is None
+                or session.expires - time.time() < self.store.ttl / 2)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+        if not self.needs_save(session):
+            return
+
+        # Emptied (e.g. logout): forget it server-side too
+        if not session:
+            for sid in (session.sid, session.replaces):
+                if sid is not None:
+                    self.store.delete(sid)
+            response.delete_cookie(name, domain=domain, path=path, secure=secure,
+                                   samesite=samesite, httponly=httponly)
+            response.vary.add('Cookie')
+            return
+
+        if session.sid is None:
+            session.sid = self.store.new_sid()
+        session.expires = self.store.save(session.sid, dict(session), session.replaces)
+        session.replaces = None
+        value = Signer(app.secret_key, salt=self.salt).sign(session.sid).decode('utf-8')
+        response.set_cookie(name, value, expires=self.get_expiration_time(app, session),
+                            httponly=httponly, domain=domain, path=path, secure=secure,
+                            samesite=samesite)
+        response.vary.add('Cookie')
@@ -0,0 +1,114 @@
+"""
+Model training outside the request-serving processes.
+
+With processes > 0 (set by serve.py), on-demand predictions are trained in
+a small spawn-context process pool, so a CPU-bound LSTM fit never holds a
+request worker's threads or GIL, and request workers never import
+TensorFlow. With the default of 0 training runs inline, as under the
+development server.
+
+Pool processes read the price data from disk themselves. Each job carries
+the data version the caller saw, and a pool process whose copy is older
+reloads that company first.
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from price_store import store as price_store
+
+_processes = 0
+_threads_per_process = 1
+_executor = None
+_executor_pid = None
+_lock = threading.Lock()
+
+
+def init_worker(threads):
+    """Pin BLAS and TensorFlow thread pools so workers don't oversubscribe cores
+
+    Initializer for every process pool that trains models (this one, the
+    forecast scheduler's and tuning's). TensorFlow reads the variables when
+    it is first imported.
+    """
+    for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS',
+                'TF_NUM_INTRAOP_THREADS'):
+        os.environ[var] = str(threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+    # Training times reach /metrics when metrics are shared between processes
+    import metrics
+    metrics.start()
+
+
+def configure(processes, threads_per_process=1):
+    """Train in this many pool processes per server process (0: inline)"""
+    global _processes, _threads_per_process
+    _processes = processes
+    _threads_per_process = threads_per_process
+
+
+def _pool():
+    global _executor, _executor_pid
+    with _lock:
+        # A pool belongs to the process that created it; forked workers make their own
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ProcessPoolExecutor(
+                max_workers=_processes,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_worker,
+                initargs=(_threads_per_process,))
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _warm_up():
+    # pandas and scikit-learn come with it
+    import ml_models
+
+
+def start():
+    """Start the pool now rather than on the first prediction"""
+    if _processes > 0:
+        _pool().submit(_warm_up)
+
+
+def _predict_job(company, model_type, days_ahead, resolution, data_version, bands):
+    from ml_models import StockPredictor
+
+    if data_version is not None and price_store.series(company).etag != data_version:
+        price_store.reload(company)
+    return StockPredictor().predict(company, model_type, days_ahead, resolution, bands)
+
+
+def predict(company, model_type='LSTM', days_ahead=5, resolution=None, data_version=None,
+            bands=None):
+    """StockPredictor().predict, in the training pool when one is configured"""
+    if _processes <= 0:
+        from ml_models import StockPredictor
+        return StockPredictor().predict(company, model_type, days_ahead, resolution, bands)
+
+    executor = _pool()
+    try:
+        return executor.submit(_predict_job, company, model_type, days_ahead, resolution,
+                               data_version, bands).result()
+    except BrokenProcessPool:
+        # A training process died (e.g. out of memory); the next call starts a new pool
+        global _executor
+        with _lock:
+            if _executor is executor:
+                _executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise Exception('Training process crashed; please retry')
+
+
+def shutdown():
+    """Stop this process's training pool, e.g. before a worker exits"""
+    global _executor
+    with _lock:
+        if _executor is not None and _executor_pid == os.getpid():
+            _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,127 @@
+"""
+Hyperparameter search for the LSTM model.
+
+Searches lookback period, layer size and epochs for each company using a grid
+pruned by successive halving: every (lookback, units) candidate is trained on
+the smallest epoch budget, only the best 1/eta survive to the next budget, and
+so on until the largest budget. Each fit also stops early once validation loss
+stops improving. Candidates are ranked by RMSE on the validation split (the
+last part of the training data), never on the test split, which only gives
+the winner's held-out error. Candidates are evaluated in a process pool and
+the winner per company is written to the model registry.
+
+Usage: python tuning.py --companies TCS WIPRO --workers 4
+"""
+
+import argparse
+import itertools
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from model_registry import save_best_config
+from training_pool import init_worker
+
+COMPANIES = ['TCS', 'WIPRO', 'INFOSYS']
+
+DEFAULT_GRID = {
+    'lookback_period': [5, 10, 20],
+    'units': [32, 50, 64],
+    'epochs': [10, 20, 40]
+}
+
+
+def _evaluate(company, config):
+    """Train one candidate configuration; returns (config, validation RMSE, test RMSE)"""
+    from ml_models import StockPredictor
+
+    predictor = StockPredictor()
+    df = predictor.load_data(company)
+    scaled_data = predictor.scale_data(df, config['lookback_period'])
+    test_rmse = predictor.train_lstm(scaled_data, units=config['units'], epochs=config['epochs'])
+    val_rmse = predictor.fit_stats['val_rmse']
+    if val_rmse is None:
+        raise ValueError(f'Not enough data for a validation split for {company}')
+
+    # scale_data clamps the lookback to the data size, record what was used
+    return (dict(config, lookback_period=predictor.lookback_period), val_rmse,
+            float(test_rmse))
+
+
+def successive_halving(executor, company, grid=None, eta=3):
+    """Search the grid for one company
+
+    Returns (best_config, validation RMSE, test RMSE); candidates are ranked
+    on the validation RMSE alone.
+    """
+    grid = grid or DEFAULT_GRID
+    candidates = [
+        {'lookback_period': lookback, 'units': units}
+        for lookback, units in itertools.product(grid['lookback_period'], grid['units'])
+    ]
+    budgets = sorted(set(grid['epochs']))
+
+    results = []
+    for rung, epochs in enumerate(budgets):
+        futures = [
+            executor.submit(_evaluate, company, dict(candidate, epochs=epochs))
+            for candidate in candidates
+        ]
+        results = sorted((f.result() for f in futures), key=lambda r: r[1])
+
+        # Clamped lookbacks can collapse several candidates into one
+        seen = set()
+        unique = []
+        for result in results:
+            config = result[0]
+            key = (config['lookback_period'], config['units'])
+            if key not in seen:
+                seen.add(key)
+                unique.append(result)
+        results = unique
+
+        if rung < len(budgets) - 1:
+            keep = max(1, math.ceil(len(results) / eta))
+            candidates = [
+                {'lookback_period': c['lookback_period'], 'units': c['units']}
+                for c, _, _ in results[:keep]
+            ]
+
+    return results[0]
+
+
+def tune(companies=None, workers=None, grid=None, eta=3):
+    """Tune every company and write the best configuration to the registry"""
+    companies = companies or COMPANIES
+    workers = workers or os.cpu_count() or 1
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    # Spawn so each worker initialises its own TensorFlow runtime
+    context = multiprocessing.get_context('spawn')
+    best = {}
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=init_worker, initargs=(threads,)) as executor:
+        for company in companies:
+            config, val_rmse, test_rmse = successive_halving(executor, company, grid, eta)
+            save_best_config(company, config, val_rmse, test_score=test_rmse)
+            best[company] = (config, val_rmse, test_rmse)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tune LSTM hyperparameters per company')
+    parser.add_argument('--companies', nargs='+', default=COMPANIES)
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Number of worker processes (default: CPU count)')
+    parser.add_argument('--eta', type=int, default=3,
+                        help='Keep the best 1/eta candidates at each budget')
+    args = parser.parse_args()
+
+    best = tune([c.upper() for c in args.companies], args.workers, eta=args.eta)
+    for company, (config, val_rmse, test_rmse) in best.items():
+        print(f"{company}: {config} (validation RMSE {val_rmse:.4f}, test RMSE {test_rmse:.4f})")
+
+
+if __name__ == '__main__':
+    main()
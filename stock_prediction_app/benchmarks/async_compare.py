@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Compare the Flask app (threaded WSGI server) with its async variant
+(asgi_app on hypercorn) under rising client concurrency.
+
+Each server runs in its own process against its own scratch database.
+Both replay the same seeded request mix from loadtest.py at every level of
+--concurrency, weighted towards the I/O-bound routes by default.
+Throughput, latency percentiles and error rates are printed side by side
+and optionally written as JSON. A 503 from the async app's CPU gate counts
+as an error, since that is how it sheds load.
+
+The clients are threads in this process, so on a small machine they
+compete with the servers for CPU; compare the two servers with each
+other, not with numbers from elsewhere.
+
+Usage: python benchmarks/async_compare.py --concurrency 16 64 128 --duration 20
+"""
+
+import argparse
+import json
+import os
+
+from loadtest import BUNDLED_DATA_DIR, LocalServer, run_load
+
+SERVERS = ('wsgi', 'asgi')
+
+# Mostly SQLite- and data-bound calls, with some predictions for the CPU gate
+IO_MIX = {
+    'stock_data': 30,
+    'history': 30,
+    'companies': 20,
+    'indicators': 10,
+    'predict': 10
+}
+
+
+def compare(concurrency_levels, users, duration, warmup, mix, timeout, seed):
+    """{server: {concurrency: report}} for every server and level"""
+    results = {}
+    for server_kind in SERVERS:
+        server = LocalServer(BUNDLED_DATA_DIR, no_lstm=True, server=server_kind)
+        try:
+            server.wait_ready()
+            print(f"{server_kind} server started at {server.url}")
+            results[server_kind] = {}
+            for concurrency in concurrency_levels:
+                report = run_load(server.url, ['TCS', 'WIPRO', 'INFOSYS'],
+                                  users=max(users, concurrency), concurrency=concurrency,
+                                  duration=duration, warmup=warmup, mix=mix,
+                                  timeout=timeout, seed=seed)
+                results[server_kind][concurrency] = report
+                print(f"  concurrency {concurrency:>4}: {report['throughput_rps']:8.1f} req/s, "
+                      f"error rate {report['error_rate']:.2%}")
+        finally:
+            server.stop()
+    return results
+
+
+def print_comparison(results, concurrency_levels):
+    print(f"\n{'concurrency':>11} {'server':>6} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'errors':>8}")
+    for concurrency in concurrency_levels:
+        for server_kind in SERVERS:
+            report = results[server_kind][concurrency]
+            print(f"{concurrency:>11} {server_kind:>6} {report['throughput_rps']:>9.1f} "
+                  f"{report['p50_ms']:>9.2f} {report['p95_ms']:>9.2f} "
+                  f"{report['p99_ms']:>9.2f} {report['error_rate']:>8.2%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the WSGI and ASGI servers under load')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[16, 64, 128],
+                        help='client threads, one run per level')
+    parser.add_argument('--users', type=int, default=32,
+                        help='synthetic accounts (at least one per client thread)')
+    parser.add_argument('--duration', type=float, default=20.0, help='measured seconds per run')
+    parser.add_argument('--warmup', type=float, default=3.0)
+    parser.add_argument('--mix', type=json.loads, default=None,
+                        help=f'JSON weights per call (default: {json.dumps(IO_MIX)})')
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write the reports as JSON to this file')
+    args = parser.parse_args()
+
+    results = compare(args.concurrency, args.users, args.duration, args.warmup,
+                      args.mix or IO_MIX, args.timeout, args.seed)
+    print_comparison(results, args.concurrency)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'options': vars(args), 'cpu_count': os.cpu_count(), 'results': results},
+                      f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
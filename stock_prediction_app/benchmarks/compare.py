@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Compare two benchmark result files from pipeline.py.
+
+Prints the change of every benchmark present in both runs and flags those
+slower than the threshold. Exits with status 1 when any benchmark regressed,
+so it can gate a CI job.
+
+Usage: python benchmarks/compare.py results/base.json results/new.json --threshold 0.1
+"""
+
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(base, new, stat='median', threshold=0.1):
+    """Rows of (name, base seconds, new seconds, ratio, status)"""
+    rows = []
+    for name in sorted(set(base['results']) | set(new['results'])):
+        old = base['results'].get(name, {})
+        current = new['results'].get(name, {})
+        if stat not in old or stat not in current:
+            rows.append((name, old.get(stat), current.get(stat), None,
+                         current.get('skipped') or old.get('skipped') or 'only in one run'))
+            continue
+        ratio = current[stat] / old[stat] if old[stat] else float('inf')
+        if ratio > 1 + threshold:
+            status = 'REGRESSION'
+        elif ratio < 1 - threshold:
+            status = 'faster'
+        else:
+            status = ''
+        rows.append((name, old[stat], current[stat], ratio, status))
+    return rows
+
+
+def _ms(seconds):
+    return f'{seconds * 1000:.3f}' if seconds is not None else '-'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare two benchmark runs')
+    parser.add_argument('base')
+    parser.add_argument('new')
+    parser.add_argument('--stat', default='median', choices=['min', 'median', 'mean'])
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative slowdown counted as a regression (default: 0.1)')
+    args = parser.parse_args()
+
+    base, new = load(args.base), load(args.new)
+    for label, report in (('base', base), ('new', new)):
+        meta = report['meta']
+        print(f"{label}: {meta.get('commit') or 'unknown'}{' (dirty)' if meta.get('dirty') else ''}"
+              f" at {meta.get('timestamp')} on {meta.get('platform')}")
+    if base['meta'].get('versions') != new['meta'].get('versions'):
+        print("note: library versions differ between the runs")
+
+    rows = compare(base, new, args.stat, args.threshold)
+    width = max((len(row[0]) for row in rows), default=10)
+    print(f"\n{'benchmark':<{width}} {'base ms':>12} {'new ms':>12} {'change':>8}")
+    for name, old, current, ratio, status in rows:
+        change = f'{(ratio - 1) * 100:+.1f}%' if ratio is not None else ''
+        print(f"{name:<{width}} {_ms(old):>12} {_ms(current):>12} {change:>8} {status}")
+
+    for label in sorted(set(base.get('peak_rss_mb', {})) & set(new.get('peak_rss_mb', {}))):
+        print(f"peak RSS {label}: {base['peak_rss_mb'][label]} MB -> {new['peak_rss_mb'][label]} MB")
+
+    regressions = [row[0] for row in rows if row[4] == 'REGRESSION']
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+HTTP load test with synthetic users.
+
+Starts the backend in a separate process (against a scratch SQLite database
+and the bundled or synthetic CSVs) or targets --url. It registers --users
+synthetic accounts, then runs --concurrency threads. Each thread logs in as
+its users and replays a weighted mix of login, stock-data, indicator,
+predict and history calls. Everything runs on localhost, so no network
+access is needed.
+
+Reports throughput, p50/p95/p99 latency per endpoint and error rates, and
+optionally writes them as JSON.
+
+Usage: python benchmarks/loadtest.py --users 50 --concurrency 16 --duration 60
+       python benchmarks/loadtest.py --url http://localhost:5000 --concurrency 32
+"""
+
+import argparse
+import json
+import logging
+import math
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(BENCHMARK_DIR, '..', 'backend')
+BUNDLED_DATA_DIR = os.path.join(BENCHMARK_DIR, '..', 'data')
+sys.path.insert(0, BACKEND_DIR)
+
+from synthetic import SyntheticData
+
+PASSWORD = 'loadtest-password'
+
+# Relative frequency of each call in the replayed traffic
+DEFAULT_MIX = {
+    'stock_data': 35,
+    'indicators': 15,
+    'history': 20,
+    'predict': 10,
+    'companies': 15,
+    'login': 5
+}
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _serve(port, no_lstm, server='wsgi'):
+    """Run the app on a threaded WSGI server, or the async app on an ASGI
+    server; the target of the server process"""
+    import app as app_module
+
+    if no_lstm:
+        app_module.app.config['LSTM_ENABLED'] = False
+    app_module.init_db()
+    if server == 'asgi':
+        import asyncio
+        from hypercorn.asyncio import serve
+        from hypercorn.config import Config
+        import asgi_app
+
+        asgi_app.app.config['LSTM_ENABLED'] = app_module.app.config['LSTM_ENABLED']
+        config = Config()
+        config.bind = [f'127.0.0.1:{port}']
+        config.backlog = 1024
+        # No access log, as for the WSGI server
+        config.accesslog = None
+        asyncio.run(serve(asgi_app.app, config))
+        return
+
+    from werkzeug.serving import make_server
+
+    # A log line per request would slow the server and bury the report
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    make_server('127.0.0.1', port, app_module.app, threaded=True).serve_forever()
+
+
+class LocalServer:
+    """The backend in a spawned process with its own database and bar files"""
+
+    def __init__(self, data_dir, no_lstm=True, server='wsgi'):
+        self.scratch = tempfile.TemporaryDirectory()
+        self.port = _free_port()
+        self.url = f'http://127.0.0.1:{self.port}'
+        environment = {
+            'STOCK_APP_DATA_DIR': os.path.abspath(data_dir),
+            'STOCK_APP_BAR_DIR': os.path.join(self.scratch.name, 'bars'),
+            'STOCK_APP_DB': os.path.join(self.scratch.name, 'loadtest.db'),
+            'TF_CPP_MIN_LOG_LEVEL': '2'
+        }
+        saved = {key: os.environ.get(key) for key in environment}
+        os.environ.update(environment)
+        try:
+            self.process = multiprocessing.get_context('spawn').Process(
+                target=_serve, args=(self.port, no_lstm, server), daemon=True)
+            self.process.start()
+        finally:
+            for key, value in saved.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+
+    def wait_ready(self, timeout=60.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not self.process.is_alive():
+                raise RuntimeError('Backend process exited during startup')
+            try:
+                requests.get(f'{self.url}/api/companies', timeout=1.0)
+                return
+            except requests.ConnectionError:
+                time.sleep(0.2)
+        raise RuntimeError(f'Backend did not start within {timeout:.0f}s')
+
+    def stop(self):
+        self.process.terminate()
+        self.process.join(10)
+        self.scratch.cleanup()
+
+
+class Recorder:
+    """Latencies and errors per endpoint, shared by all threads"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds, status):
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            self.statuses[endpoint][status] += 1
+            if not isinstance(status, int) or status >= 400:
+                self.errors[endpoint] += 1
+
+    def report(self, elapsed):
+        def percentile(ordered, q):
+            # Nearest rank
+            index = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+            return ordered[index]
+
+        endpoints = {}
+        with self._lock:
+            for endpoint, latencies in sorted(self.latencies.items()):
+                ordered = sorted(latencies)
+                count = len(ordered)
+                endpoints[endpoint] = {
+                    'requests': count,
+                    'errors': self.errors[endpoint],
+                    'error_rate': round(self.errors[endpoint] / count, 4),
+                    'throughput_rps': round(count / elapsed, 2),
+                    'p50_ms': round(percentile(ordered, 50) * 1000, 2),
+                    'p95_ms': round(percentile(ordered, 95) * 1000, 2),
+                    'p99_ms': round(percentile(ordered, 99) * 1000, 2),
+                    'max_ms': round(ordered[-1] * 1000, 2),
+                    'statuses': {str(k): v for k, v in self.statuses[endpoint].items()}
+                }
+            overall = sorted(seconds for latencies in self.latencies.values()
+                             for seconds in latencies)
+            errors = sum(self.errors.values())
+        total = len(overall)
+        return {
+            'elapsed_seconds': round(elapsed, 3),
+            'requests': total,
+            'errors': errors,
+            'error_rate': round(errors / total, 4) if total else None,
+            'throughput_rps': round(total / elapsed, 2) if elapsed else None,
+            'p50_ms': round(percentile(overall, 50) * 1000, 2) if total else None,
+            'p95_ms': round(percentile(overall, 95) * 1000, 2) if total else None,
+            'p99_ms': round(percentile(overall, 99) * 1000, 2) if total else None,
+            'endpoints': endpoints
+        }
+
+
+class VirtualUser:
+    """One synthetic account with its own cookie session"""
+
+    def __init__(self, base_url, username, timeout):
+        self.base_url = base_url
+        self.username = username
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def call(self, recorder, endpoint, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, f'{self.base_url}{path}',
+                                            timeout=self.timeout, **kwargs)
+            # Include reading the body in the latency
+            response.content
+            status = response.status_code
+        except requests.RequestException as e:
+            status = type(e).__name__
+        if recorder is not None:
+            recorder.record(endpoint, time.perf_counter() - start, status)
+        return status
+
+    def register(self):
+        return self.call(None, 'register', 'POST', '/api/register',
+                         json={'username': self.username,
+                               'email': f'{self.username}@loadtest.invalid',
+                               'password': PASSWORD})
+
+    def login(self, recorder=None):
+        return self.call(recorder, 'login', 'POST', '/api/login',
+                         json={'username': self.username, 'password': PASSWORD})
+
+
+class Scenario:
+    """Chooses and issues the next call of the traffic mix"""
+
+    def __init__(self, companies, mix, lstm_share=0.0, days_ahead=(1, 3, 5, 7, 10)):
+        self.companies = companies
+        self.actions = list(mix)
+        self.weights = [mix[action] for action in self.actions]
+        self.lstm_share = lstm_share
+        self.days_ahead = days_ahead
+
+    def step(self, user, recorder, rng):
+        action = rng.choices(self.actions, self.weights)[0]
+        company = rng.choice(self.companies)
+        if action == 'stock_data':
+            user.call(recorder, 'stock_data', 'GET', f'/api/stock-data/{company}')
+        elif action == 'indicators':
+            user.call(recorder, 'indicators', 'GET', f'/api/indicators/{company}')
+        elif action == 'history':
+            user.call(recorder, 'history', 'GET', '/api/predictions/history',
+                      params={'limit': 50, 'offset': 0})
+        elif action == 'predict':
+            model_type = 'LSTM' if rng.random() < self.lstm_share else 'Linear_Regression'
+            user.call(recorder, f'predict_{model_type}', 'POST', '/api/predict',
+                      json={'company': company, 'model_type': model_type,
+                            'days_ahead': rng.choice(self.days_ahead)})
+        elif action == 'companies':
+            user.call(recorder, 'companies', 'GET', '/api/companies')
+        elif action == 'login':
+            user.login(recorder)
+
+
+def _run_thread(users, scenario, recorder, deadline, think, seed):
+    rng = random.Random(seed)
+    while time.monotonic() < deadline:
+        scenario.step(rng.choice(users), recorder, rng)
+        if think:
+            time.sleep(rng.expovariate(1 / think))
+
+
+def _parallel(fn, items, concurrency):
+    """fn(item) for every item on up to concurrency threads"""
+    items = list(items)
+    results = [None] * len(items)
+    lock = threading.Lock()
+    position = iter(range(len(items)))
+
+    def worker():
+        while True:
+            with lock:
+                index = next(position, None)
+            if index is None:
+                return
+            results[index] = fn(items[index])
+
+    threads = [threading.Thread(target=worker) for _ in range(min(concurrency, len(items)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def run_load(base_url, companies, users=20, concurrency=8, duration=30.0, warmup=3.0,
+             think=0.0, mix=None, lstm_share=0.0, timeout=120.0, seed=42):
+    """Register users, replay the mix and return the report"""
+    run_id = f'{int(time.time()):x}'
+    virtual_users = [VirtualUser(base_url, f'load_{run_id}_{i}', timeout) for i in range(users)]
+
+    # Accounts are created and logged in before measuring
+    statuses = _parallel(lambda user: (user.register(), user.login()), virtual_users, concurrency)
+    failed = [user.username for user, (_, login) in zip(virtual_users, statuses) if login != 200]
+    if len(failed) == len(virtual_users):
+        raise RuntimeError(f'No synthetic user could log in (e.g. {statuses[0]})')
+
+    # Threads share the users round-robin
+    groups = [virtual_users[i::concurrency] for i in range(concurrency) if virtual_users[i::concurrency]]
+    scenario = Scenario(companies, mix or DEFAULT_MIX, lstm_share)
+
+    if warmup:
+        deadline = time.monotonic() + warmup
+        _parallel(lambda item: _run_thread(item[0], scenario, None, deadline, think, item[1]),
+                  [(group, seed + 1000 + i) for i, group in enumerate(groups)], len(groups))
+
+    recorder = Recorder()
+    started = time.monotonic()
+    deadline = started + duration
+    _parallel(lambda item: _run_thread(item[0], scenario, recorder, deadline, think, item[1]),
+              [(group, seed + i) for i, group in enumerate(groups)], len(groups))
+    report = recorder.report(time.monotonic() - started)
+    report['failed_logins'] = len(failed)
+    return report
+
+
+def print_report(report):
+    print(f"\n{report['requests']} requests in {report['elapsed_seconds']}s: "
+          f"{report['throughput_rps']} req/s, error rate {report['error_rate']:.2%}")
+    print(f"{'endpoint':<24} {'requests':>9} {'errors':>7} {'req/s':>8} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for endpoint, stats in report['endpoints'].items():
+        print(f"{endpoint:<24} {stats['requests']:>9} {stats['errors']:>7} "
+              f"{stats['throughput_rps']:>8} {stats['p50_ms']:>9} {stats['p95_ms']:>9} "
+              f"{stats['p99_ms']:>9} {stats['max_ms']:>9}")
+        unexpected = {k: v for k, v in stats['statuses'].items() if k not in ('200', '201')}
+        if unexpected:
+            print(f"{'':<24} statuses: {unexpected}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the backend with synthetic users')
+    parser.add_argument('--url', help='target a running server instead of starting one')
+    parser.add_argument('--server', choices=['wsgi', 'asgi'], default='wsgi',
+                        help='start the Flask app (wsgi) or the async variant on hypercorn (asgi)')
+    parser.add_argument('--users', type=int, default=20, help='synthetic accounts to register')
+    parser.add_argument('--concurrency', type=int, default=8, help='client threads')
+    parser.add_argument('--duration', type=float, default=30.0, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=3.0, help='unmeasured seconds first')
+    parser.add_argument('--think', type=float, default=0.0,
+                        help='mean pause between a thread\'s calls, in seconds')
+    parser.add_argument('--lstm-share', type=float, default=0.0,
+                        help='fraction of predictions that use LSTM (slow; default 0)')
+    parser.add_argument('--mix', type=json.loads, default=None,
+                        help=f'JSON weights per call (default: {json.dumps(DEFAULT_MIX)})')
+    parser.add_argument('--tickers', type=int, default=0,
+                        help='serve this many synthetic tickers instead of the bundled CSVs')
+    parser.add_argument('--rows', type=int, default=1000, help='bars per synthetic ticker')
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write the report as JSON to this file')
+    args = parser.parse_args()
+
+    if args.tickers:
+        data = SyntheticData(os.path.join(BENCHMARK_DIR, '.data'), seed=args.seed)
+        companies = data.universe(args.tickers, args.rows)
+        data_dir = data.directory
+    else:
+        companies = ['TCS', 'WIPRO', 'INFOSYS']
+        data_dir = BUNDLED_DATA_DIR
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        server = LocalServer(data_dir, no_lstm=args.lstm_share == 0, server=args.server)
+        server.wait_ready()
+        base_url = server.url
+        print(f"Backend started at {base_url}")
+    try:
+        report = run_load(base_url.rstrip('/'), companies, users=args.users,
+                          concurrency=args.concurrency, duration=args.duration,
+                          warmup=args.warmup, think=args.think, mix=args.mix,
+                          lstm_share=args.lstm_share, timeout=args.timeout, seed=args.seed)
+    finally:
+        if server is not None:
+            server.stop()
+
+    print_report(report)
+    if args.output:
+        report['options'] = vars(args)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Benchmark the StockPredictor model variants on CPU.
+
+Each variant/precision pair is trained in its own process so that peak memory
+is measured in isolation. Reports fit time, epochs run, single-window
+inference latency (Keras and the NumPy runtime), parameter count and peak RSS.
+
+Usage: python benchmarks/model_variants.py --rows 5000 --output variants.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+sys.path.insert(0, BACKEND_DIR)
+
+VARIANTS = ['stacked_lstm', 'lstm', 'gru', 'tcn']
+DTYPES = ['float64', 'float32']
+
+
+def _median_latency(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def run_variant(variant, dtype, rows, lookback, units, epochs, seed):
+    """Train one variant and return its measurements"""
+    import numpy as np
+    import pandas as pd
+    from ml_models import StockPredictor
+
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({'Close': 100 + np.cumsum(rng.normal(0, 1, rows))})
+
+    predictor = StockPredictor(dtype=dtype)
+    scaled_data = predictor.scale_data(df, lookback)
+    rmse = predictor.train_lstm(scaled_data, units=units, epochs=epochs, variant=variant,
+                                seed=seed)
+
+    window = scaled_data[-predictor.lookback_period:].reshape(1, -1, 1)
+    keras_latency = _median_latency(lambda: predictor.lstm_model.predict(window, verbose=0), 20)
+    engine_latency = None
+    if predictor.lstm_engine is not None:
+        engine_latency = _median_latency(lambda: predictor.lstm_engine.predict(window), 200)
+
+    return {
+        'variant': variant,
+        'dtype': dtype,
+        'rmse': float(rmse),
+        'params': int(predictor.lstm_model.count_params()),
+        'scaled_bytes': int(scaled_data.nbytes),
+        'epochs_run': predictor.fit_stats['epochs_run'],
+        'fit_seconds': predictor.fit_stats['fit_seconds'],
+        'keras_latency_ms': round(keras_latency * 1000, 3),
+        'engine_latency_ms': round(engine_latency * 1000, 3) if engine_latency else None,
+        # ru_maxrss is reported in kilobytes on Linux
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark model variants')
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--lookback', type=int, default=30)
+    parser.add_argument('--units', type=int, default=50)
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--variants', nargs='+', default=VARIANTS)
+    parser.add_argument('--dtypes', nargs='+', default=DTYPES)
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    args = parser.parse_args()
+
+    # A fresh process per run keeps peak RSS and TF state independent
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for variant in args.variants:
+        for dtype in args.dtypes:
+            with context.Pool(1) as pool:
+                result = pool.apply(run_variant, (variant, dtype, args.rows, args.lookback,
+                                                  args.units, args.epochs, args.seed))
+            results.append(result)
+            print(f"{variant:>13} {dtype}: fit {result['fit_seconds']:.2f}s "
+                  f"({result['epochs_run']} epochs), "
+                  f"keras {result['keras_latency_ms']:.2f}ms, "
+                  f"engine {result['engine_latency_ms']}ms, "
+                  f"{result['params']} params, RSS {result['peak_rss_mb']}MB, "
+                  f"RMSE {result['rmse']:.4f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Benchmark the data and prediction pipeline on synthetic histories.
+
+Times the StockPredictor stages (load_data, prepare_data, train/predict for
+both models, get_technical_indicators) and the main Flask routes through the
+test client. It runs them on synthetic OHLCV series of 1k, 100k and
+(opt-in) 10M rows, plus a universe of thousands of small tickers. Every size
+runs in its own process against its own database, so one run cannot warm
+caches for the next and peak RSS is per size. Data is seeded and kept in
+benchmarks/.data between runs.
+
+Results are written as JSON (timings, peak RSS, git commit, library
+versions); compare two runs with compare.py.
+
+Usage: python benchmarks/pipeline.py --sizes 1k 100k --tickers 2000
+       python benchmarks/compare.py old.json new.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from importlib import metadata
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(BENCHMARK_DIR, '..', 'backend')
+sys.path.insert(0, BACKEND_DIR)
+
+from synthetic import SyntheticData
+
+SIZES = {'1k': 1000, '100k': 100000, '10m': 10000000}
+DEFAULT_SIZES = ['1k', '100k']
+DATA_DIR = os.path.join(BENCHMARK_DIR, '.data')
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, 'results')
+
+# Benchmarks that are skipped above this many rows: LSTM training and the
+# per-row Python paths (windowing, record dicts for JSON) would take hours
+ROW_LIMITS = {
+    'prepare_data': 1000000,
+    'train_lstm': 100000,
+    'predict_lstm': 100000,
+    'get_technical_indicators': 1000000,
+    'route.stock_data': 1000000,
+    'route.predict_linear_regression': 1000000
+}
+
+
+class Runner:
+    """Times callables and collects the results under one prefix"""
+
+    def __init__(self, prefix, rows, repeat, warmup):
+        self.prefix = prefix
+        self.rows = rows
+        self.repeat = repeat
+        self.warmup = warmup
+        self.results = {}
+
+    def skip(self, name, reason):
+        self.results[f'{self.prefix}/{name}'] = {'skipped': reason}
+
+    def run(self, name, fn, setup=None, repeat=None, warmup=None, limit_key=None):
+        limit = ROW_LIMITS.get(limit_key or name)
+        if limit is not None and self.rows > limit:
+            self.skip(name, f'over {limit} rows')
+            return
+        repeat = self.repeat if repeat is None else repeat
+        warmup = self.warmup if warmup is None else warmup
+
+        timings = []
+        for i in range(warmup + repeat):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - start
+            if i >= warmup:
+                timings.append(elapsed)
+
+        self.results[f'{self.prefix}/{name}'] = {
+            'rows': self.rows,
+            'repeat': repeat,
+            'min': min(timings),
+            'median': statistics.median(timings),
+            'mean': statistics.fmean(timings),
+            'stdev': statistics.stdev(timings) if len(timings) > 1 else 0.0
+        }
+        print(f"{self.prefix}/{name:<32} median {statistics.median(timings) * 1000:10.3f} ms")
+
+
+def _flask_client():
+    """The app's test client, logged in, against a fresh database"""
+    import app as app_module
+
+    app_module.init_db()
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 1
+        session['is_admin'] = True
+    return app_module, client
+
+
+def _check(response, status=200):
+    if response.status_code != status:
+        raise RuntimeError(f'{response.request.path} returned {response.status_code}: '
+                           f'{response.get_data(as_text=True)[:200]}')
+
+
+def run_size(label, ticker, rows, options):
+    """Every benchmark for one history size; runs in a fresh process"""
+    from ml_models import StockPredictor
+    from price_store import store
+
+    runner = Runner(label, rows, options['repeat'], options['warmup'])
+    predictor = StockPredictor()
+
+    runner.run('load_data', lambda: predictor.load_data(ticker), setup=store.reload)
+    runner.run('load_data_cached', lambda: predictor.load_data(ticker))
+    df = predictor.load_data(ticker)
+
+    runner.run('prepare_data', lambda: predictor.prepare_data(df))
+    runner.run('train_linear_regression', lambda: predictor.train_linear_regression(df))
+    _, processed = predictor.train_linear_regression(df)
+    runner.run('predict_linear_regression',
+               lambda: predictor.predict_linear_regression(processed, options['days_ahead']))
+    # The feature frame is several times the size of the history
+    del processed
+    runner.run('get_technical_indicators', lambda: predictor.get_technical_indicators(ticker))
+
+    if rows <= ROW_LIMITS['train_lstm']:
+        scaled_data = predictor.scale_data(df, options['lookback'])
+        # One timed fit: training dominates the suite and is seeded
+        runner.run('train_lstm', lambda: predictor.train_lstm(scaled_data, units=options['units'],
+                                                              epochs=options['epochs'],
+                                                              variant=options['variant']),
+                   repeat=1, warmup=0)
+        runner.run('predict_lstm',
+                   lambda: predictor.predict_lstm(scaled_data, options['days_ahead']))
+    else:
+        runner.skip('train_lstm', f"over {ROW_LIMITS['train_lstm']} rows")
+        runner.skip('predict_lstm', f"over {ROW_LIMITS['predict_lstm']} rows")
+
+    app_module, client = _flask_client()
+    runner.run('route.companies', lambda: _check(client.get('/api/companies')))
+    runner.run('route.stock_data', lambda: _check(client.get(f'/api/stock-data/{ticker}')))
+    # The validator the route sends, without building a large response for it
+    etag = f'"{store.series(ticker).etag}"'
+    runner.run('route.stock_data_not_modified',
+               lambda: _check(client.get(f'/api/stock-data/{ticker}',
+                                         headers={'If-None-Match': etag}), 304))
+    # Days ahead outside the precomputed horizons, cache cleared each time
+    body = {'company': ticker, 'model_type': 'Linear_Regression',
+            'days_ahead': options['days_ahead'] + 1}
+    runner.run('route.predict_linear_regression',
+               lambda: _check(client.post('/api/predict', json=body)),
+               setup=app_module.prediction_cache.clear)
+
+    return runner.results, _peak_rss_mb()
+
+
+def run_universe(tickers, rows, options):
+    """Load and serve every ticker of a large universe; runs in a fresh process"""
+    from ml_models import StockPredictor
+    from price_store import store
+
+    runner = Runner(f'universe-{len(tickers)}x{rows}', rows, options['universe_repeat'], 0)
+    predictor = StockPredictor()
+
+    def load_all():
+        for ticker in tickers:
+            predictor.load_data(ticker)
+
+    runner.run('load_data', load_all, setup=store.reload)
+    runner.run('load_data_cached', load_all)
+
+    def fit_all():
+        for ticker in tickers:
+            predictor.train_linear_regression(predictor.load_data(ticker))
+
+    runner.run('train_linear_regression', fit_all)
+
+    _, client = _flask_client()
+
+    def serve_all():
+        for ticker in tickers:
+            _check(client.get(f'/api/stock-data/{ticker}'))
+
+    runner.run('route.stock_data', serve_all)
+    return runner.results, _peak_rss_mb()
+
+
+def _peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _in_process(fn, args, environment):
+    """Run fn in a fresh spawned process with extra environment variables"""
+    saved = {key: os.environ.get(key) for key in environment}
+    os.environ.update(environment)
+    try:
+        with multiprocessing.get_context('spawn').Pool(1) as pool:
+            return pool.apply(fn, args)
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def _git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BENCHMARK_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                    cwd=BENCHMARK_DIR, capture_output=True, text=True,
+                                    check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def _versions():
+    versions = {'python': platform.python_version()}
+    for package in ('numpy', 'pandas', 'scikit-learn', 'flask', 'tensorflow', 'tensorflow-cpu'):
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            pass
+    return versions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the data and prediction pipeline')
+    parser.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES, choices=list(SIZES),
+                        help='history lengths to benchmark (10m needs several GB of RAM)')
+    parser.add_argument('--tickers', type=int, default=2000,
+                        help='tickers in the universe benchmark (0 to skip)')
+    parser.add_argument('--universe-rows', type=int, default=250)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--universe-repeat', type=int, default=3)
+    parser.add_argument('--days-ahead', type=int, default=10)
+    parser.add_argument('--lookback', type=int, default=30)
+    parser.add_argument('--units', type=int, default=32)
+    parser.add_argument('--epochs', type=int, default=2)
+    parser.add_argument('--variant', default='lstm')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data-dir', default=DATA_DIR,
+                        help='where synthetic CSVs are generated and reused')
+    parser.add_argument('--output', help='results file (default: results/<commit>.json)')
+    args = parser.parse_args()
+
+    options = vars(args)
+    data = SyntheticData(args.data_dir, seed=args.seed)
+    results = {}
+    peak_rss = {}
+
+    with tempfile.TemporaryDirectory() as scratch:
+        def environment(name):
+            # Own database and bar directory per run, shared synthetic CSVs
+            return {'STOCK_APP_DATA_DIR': os.path.abspath(args.data_dir),
+                    'STOCK_APP_BAR_DIR': os.path.join(scratch, name),
+                    'STOCK_APP_DB': os.path.join(scratch, f'{name}.db'),
+                    'STOCK_APP_NO_LSTM': '0',
+                    'TF_CPP_MIN_LOG_LEVEL': '2'}
+
+        for label in args.sizes:
+            rows = SIZES[label]
+            print(f"Preparing {label} rows...")
+            ticker = data.ensure(f'SYN{label.upper()}', rows)
+            size_results, peak_rss[label] = _in_process(run_size, (label, ticker, rows, options),
+                                                        environment(label))
+            results.update(size_results)
+
+        if args.tickers:
+            print(f"Preparing {args.tickers} tickers of {args.universe_rows} rows...")
+            tickers = data.universe(args.tickers, args.universe_rows)
+            universe_results, peak_rss['universe'] = _in_process(
+                run_universe, (tickers, args.universe_rows, options), environment('universe'))
+            results.update(universe_results)
+
+    commit, dirty = _git_commit()
+    report = {
+        'meta': {
+            'commit': commit,
+            'dirty': dirty,
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'versions': _versions(),
+            'options': options
+        },
+        'peak_rss_mb': peak_rss,
+        'results': results
+    }
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{(commit or 'unknown')[:10]}"
+                                           f"{'-dirty' if dirty else ''}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
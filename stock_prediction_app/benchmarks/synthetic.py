@@ -0,0 +1,115 @@
+"""
+Synthetic OHLCV histories for benchmarks.
+
+Closes follow a geometric random walk and open/high/low/volume are drawn
+around them, so the series look like the real CSVs to every code path. The
+same seed always gives the same data. Long histories use minute bars,
+since pandas timestamps stop at year 2262.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# Longer histories than this are generated as minute bars
+MAX_DAILY_ROWS = 20000
+CHUNK_ROWS = 1000000
+
+
+def _frequency(rows):
+    return 'D' if rows <= MAX_DAILY_ROWS else 'min'
+
+
+def generate_ohlcv(rows, seed=0, start='2000-01-03', freq=None, price=100.0,
+                   volatility=None, offset=0):
+    """DataFrame with the columns of the company CSVs
+
+    offset is the index of the first row within a longer series, so a
+    history can be generated chunk by chunk; pass the last close as price.
+    """
+    freq = freq or _frequency(rows + offset)
+    if volatility is None:
+        # Per-bar volatility that keeps ten million minute bars in a sane range
+        volatility = 0.01 if freq == 'D' else 0.0005
+    rng = np.random.default_rng([seed, offset])
+    close = price * np.exp(np.cumsum(rng.normal(0, volatility, rows)))
+    previous = np.concatenate(([price], close[:-1]))
+    open_ = previous * (1 + rng.normal(0, volatility / 4, rows))
+    spread = np.abs(rng.normal(0, volatility / 2, (2, rows)))
+    return pd.DataFrame({
+        'Date': pd.date_range(pd.Timestamp(start) + offset * pd.tseries.frequencies.to_offset(freq),
+                              periods=rows, freq=freq),
+        'Open': open_,
+        'High': np.maximum(open_, close) * (1 + spread[0]),
+        'Low': np.minimum(open_, close) * (1 - spread[1]),
+        'Close': close,
+        'Volume': rng.integers(100000, 5000000, rows)
+    })
+
+
+def write_csv(path, rows, seed=0, chunk_rows=CHUNK_ROWS):
+    """Write a rows-long history to path, chunk_rows at a time"""
+    freq = _frequency(rows)
+    tmp_path = f'{path}.tmp'
+    price = 100.0
+    with open(tmp_path, 'w', newline='') as f:
+        for offset in range(0, rows, chunk_rows):
+            chunk = generate_ohlcv(min(chunk_rows, rows - offset), seed, freq=freq,
+                                   price=price, offset=offset)
+            price = float(chunk['Close'].iloc[-1])
+            chunk.to_csv(f, header=offset == 0, index=False, float_format='%.4f',
+                         date_format='%Y-%m-%d %H:%M:%S' if freq == 'min' else '%Y-%m-%d')
+    os.replace(tmp_path, path)
+
+
+class SyntheticData:
+    """A data directory of synthetic company CSVs, generated on first use
+
+    A manifest records the rows and seed behind each file, so later runs
+    reuse files that match and regenerate those that don't.
+    """
+
+    def __init__(self, directory, seed=0):
+        self.directory = directory
+        self.seed = seed
+        self.manifest_path = os.path.join(directory, 'manifest.json')
+        self.manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+
+    def path(self, ticker):
+        return os.path.join(self.directory, f'{ticker.lower()}_stock_data.csv')
+
+    def ensure(self, ticker, rows, seed=None):
+        """Make sure ticker has a rows-long history; returns the ticker"""
+        seed = self.seed if seed is None else seed
+        spec = {'rows': rows, 'seed': seed}
+        if self.manifest.get(ticker) != spec or not os.path.exists(self.path(ticker)):
+            os.makedirs(self.directory, exist_ok=True)
+            write_csv(self.path(ticker), rows, seed)
+            self.manifest[ticker] = spec
+            self._save()
+        return ticker
+
+    def universe(self, count, rows):
+        """count tickers of rows bars each, with different seeds"""
+        tickers = []
+        for i in range(count):
+            ticker = f'UNI{i:05d}'
+            spec = {'rows': rows, 'seed': self.seed + i}
+            if self.manifest.get(ticker) != spec or not os.path.exists(self.path(ticker)):
+                os.makedirs(self.directory, exist_ok=True)
+                write_csv(self.path(ticker), rows, self.seed + i)
+                self.manifest[ticker] = spec
+            tickers.append(ticker)
+        self._save()
+        return tickers
+
+    def _save(self):
+        tmp_path = f'{self.manifest_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
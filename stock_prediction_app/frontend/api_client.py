@@ -0,0 +1,176 @@
+import logging
+import queue
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from response_cache import CachedResponse, ResponseCache
+
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (3.05, 30)
+# Predictions may train a model server-side before answering
+PREDICT_TIMEOUT = (3.05, 300)
+
+logger = logging.getLogger(__name__)
+
+
+class ApiClient:
+    """Pooled, retrying HTTP client that keeps network I/O off the Tk main thread
+
+    All requests share one requests.Session, so connections are kept alive and
+    the login cookie is sent with every later call. Calls made through submit()
+    run on a small thread pool; their callbacks are queued and executed on the
+    Tk main thread by a root.after() polling loop, so widgets are only ever
+    touched from the thread that owns them.
+    """
+
+    def __init__(self, base_url, root, max_workers=4, retries=3, backoff=0.3,
+                 poll_interval=30, cache=None):
+        self.base_url = base_url.rstrip('/')
+        self.cache = cache if cache is not None else ResponseCache()
+        self.root = root
+        self.poll_interval = poll_interval
+
+        # Retry idempotent requests only; a retried POST could repeat a prediction
+        retry = Retry(total=retries, connect=retries, read=retries,
+                      backoff_factor=backoff,
+                      status_forcelist=(502, 503, 504),
+                      allowed_methods=frozenset(['GET', 'HEAD']))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers,
+                              max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix='api-client')
+        self._callbacks = queue.SimpleQueue()
+        self._closed = False
+        self.root.after(self.poll_interval, self._drain_callbacks)
+
+    # Blocking calls, for use from worker threads
+
+    def get(self, path, timeout=DEFAULT_TIMEOUT, **kwargs):
+        return self.session.get(f"{self.base_url}{path}", timeout=timeout, **kwargs)
+
+    def post(self, path, json=None, timeout=DEFAULT_TIMEOUT, **kwargs):
+        return self.session.post(f"{self.base_url}{path}", json=json, timeout=timeout, **kwargs)
+
+    def get_cached(self, path, timeout=DEFAULT_TIMEOUT):
+        """GET through the response cache, revalidating stale entries
+
+        Returns a CachedResponse for 200/304 replies and the raw response
+        for anything else.
+        """
+        url = f"{self.base_url}{path}"
+        entry = self.cache.get(url)
+        if entry is not None and self.cache.is_fresh(entry):
+            self.cache.count('hits')
+            return entry
+
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+
+        response = self.session.get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304 and entry is not None:
+            self.cache.count('revalidated')
+            self.cache.touch(entry)
+            return entry
+        if response.status_code != 200:
+            return response
+
+        self.cache.count('misses')
+        entry = CachedResponse(url, response.text,
+                               etag=response.headers.get('ETag'),
+                               last_modified=response.headers.get('Last-Modified'))
+        self.cache.put(url, entry)
+        return entry
+
+    def cached_entry(self, path):
+        """The cached response for path, if any, without touching the network"""
+        return self.cache.get(f"{self.base_url}{path}")
+
+    # Non-blocking calls, callbacks run on the Tk main thread
+
+    def submit(self, fn, *args, on_success=None, on_error=None, **kwargs):
+        """Run fn(*args, **kwargs) on the pool and report back on the main thread"""
+        future = self.executor.submit(fn, *args, **kwargs)
+        future.add_done_callback(
+            lambda f: self._callbacks.put((f, on_success, on_error)))
+        return future
+
+    def get_async(self, path, on_success=None, on_error=None, **kwargs):
+        return self.submit(self.get, path, on_success=on_success, on_error=on_error, **kwargs)
+
+    def get_cached_async(self, path, on_success=None, on_error=None, **kwargs):
+        return self.submit(self.get_cached, path, on_success=on_success, on_error=on_error, **kwargs)
+
+    def post_async(self, path, json=None, on_success=None, on_error=None, **kwargs):
+        return self.submit(self.post, path, json=json, on_success=on_success,
+                           on_error=on_error, **kwargs)
+
+    def call_soon(self, fn, *args):
+        """Run fn(*args) on the Tk main thread; safe to call from any thread"""
+        future = Future()
+        future.set_result(None)
+        self._callbacks.put((future, lambda result: fn(*args), None))
+
+    def get_many(self, paths, on_complete, cached=False):
+        """Fetch several paths in parallel and call on_complete once with all results
+
+        on_complete receives a dict mapping each path to its response, or to
+        the exception raised while fetching it. With cached=True the paths
+        are fetched through the response cache.
+        """
+        fetch = self.get_cached_async if cached else self.get_async
+        paths = list(paths)
+        results = {}
+        if not paths:
+            self.root.after(0, on_complete, results)
+            return
+
+        def collect(path, outcome):
+            results[path] = outcome
+            if len(results) == len(paths):
+                on_complete(results)
+
+        for path in paths:
+            fetch(path,
+                  on_success=lambda response, p=path: collect(p, response),
+                  on_error=lambda error, p=path: collect(p, error))
+
+    def _drain_callbacks(self):
+        while True:
+            try:
+                future, on_success, on_error = self._callbacks.get_nowait()
+            except queue.Empty:
+                break
+
+            error = future.exception()
+            try:
+                if error is None:
+                    if on_success is not None:
+                        on_success(future.result())
+                elif on_error is not None:
+                    on_error(error)
+            except Exception as e:
+                # Keep the polling loop alive if a callback fails
+                logger.exception('API callback failed: %s', e)
+
+        if not self._closed:
+            self.root.after(self.poll_interval, self._drain_callbacks)
+
+    def clear_session(self):
+        """Forget the login cookie"""
+        self.session.cookies.clear()
+
+    def close(self):
+        self._closed = True
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
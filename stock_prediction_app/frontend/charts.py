@@ -0,0 +1,156 @@
+import tkinter as tk
+from datetime import timedelta
+
+import numpy as np
+import matplotlib.dates as mdates
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+
+def decimate(x, y, max_points):
+    """Reduce a series to at most max_points using per-bucket min/max
+
+    Each bucket contributes its minimum and maximum, so spikes stay visible
+    when thousands of points share one pixel column. NaNs are ignored.
+    """
+    n = len(x)
+    if n <= max_points or max_points < 2:
+        return x, y
+
+    buckets = max_points // 2
+    starts = np.linspace(0, n, buckets + 1).astype(np.int64)[:-1]
+    starts = np.unique(starts)
+    lows = np.fmin.reduceat(y, starts)
+    highs = np.fmax.reduceat(y, starts)
+
+    ends = np.append(starts[1:], n) - 1
+    centres = (x[starts] + x[ends]) / 2
+    return np.repeat(centres, 2), np.column_stack([lows, highs]).ravel()
+
+
+class PredictionChart:
+    """Persistent 2x2 stock chart that is updated in place
+
+    One Figure and one Tk canvas are created for the lifetime of the widget.
+    Each update replaces line data with set_data, decimated to the on-screen
+    width. When the axis limits are unchanged only the data lines are redrawn
+    by blitting over a cached background; otherwise the canvas is redrawn once.
+    The figure is not registered with pyplot, so it is released as soon as the
+    widget is destroyed.
+    """
+
+    def __init__(self, parent):
+        self.figure = Figure(figsize=(12, 8))
+        axes = self.figure.subplots(2, 2)
+        self.ax_price, self.ax_ohlc, self.ax_volume, self.ax_rsi = axes.flat
+
+        # Data lines are animated so they can be blitted over the background
+        self.historical_line, = self.ax_price.plot([], [], label='Historical', color='blue',
+                                                   alpha=0.7, animated=True)
+        self.predicted_line, = self.ax_price.plot([], [], 'ro-', label='Predicted',
+                                                  markersize=6, animated=True)
+        self.high_line, = self.ax_ohlc.plot([], [], label='High', color='green',
+                                            alpha=0.6, animated=True)
+        self.low_line, = self.ax_ohlc.plot([], [], label='Low', color='red',
+                                           alpha=0.6, animated=True)
+        self.close_line, = self.ax_ohlc.plot([], [], label='Close', color='blue',
+                                             linewidth=2, animated=True)
+        self.volume_line, = self.ax_volume.plot([], [], color='orange', alpha=0.7,
+                                                drawstyle='steps-mid', animated=True)
+        self.rsi_line, = self.ax_rsi.plot([], [], color='purple', linewidth=2, animated=True)
+
+        self.ax_price.set_title('Price Prediction')
+        self.ax_price.set_ylabel('Price (₹)')
+        self.ax_price.legend(loc='upper left')
+        self.ax_ohlc.set_title('OHLC Data')
+        self.ax_ohlc.set_ylabel('Price (₹)')
+        self.ax_ohlc.legend(loc='upper left')
+        self.ax_volume.set_title('Trading Volume')
+        self.ax_volume.set_ylabel('Volume')
+        self.ax_rsi.set_title('RSI Indicator')
+        self.ax_rsi.set_ylabel('RSI')
+        self.ax_rsi.axhline(y=70, color='r', linestyle='--', alpha=0.7, label='Overbought')
+        self.ax_rsi.axhline(y=30, color='g', linestyle='--', alpha=0.7, label='Oversold')
+        self.ax_rsi.legend(loc='upper left')
+
+        for ax in axes.flat:
+            ax.grid(True, alpha=0.3)
+            ax.xaxis_date()
+        self.figure.tight_layout(rect=(0, 0, 1, 0.95))
+
+        self.canvas = FigureCanvasTkAgg(self.figure, parent)
+        self.widget = self.canvas.get_tk_widget()
+        self.widget.pack(fill=tk.BOTH, expand=True)
+
+        self._background = None
+        self._limits = None
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+
+    @property
+    def animated_lines(self):
+        return (self.historical_line, self.predicted_line, self.high_line, self.low_line,
+                self.close_line, self.volume_line, self.rsi_line)
+
+    def update(self, df, result):
+        """Show the history in df and the predictions in result"""
+        dates = mdates.date2num(df['Date'].to_numpy())
+
+        # About one point per pixel column of a single subplot
+        width = max(self.widget.winfo_width(), 200)
+        max_points = max(width // 2, 100)
+
+        def series(column):
+            return decimate(dates, df[column].to_numpy(dtype=float), max_points)
+
+        self.historical_line.set_data(*series('Close'))
+        last_date = df['Date'].iloc[-1]
+        pred_dates = [last_date + timedelta(days=i + 1) for i in range(len(result['predictions']))]
+        self.predicted_line.set_data(mdates.date2num(pred_dates), result['predictions'])
+
+        self.high_line.set_data(*series('High'))
+        self.low_line.set_data(*series('Low'))
+        self.close_line.set_data(*series('Close'))
+        self.volume_line.set_data(*series('Volume'))
+
+        if 'RSI' in df.columns:
+            self.rsi_line.set_data(*series('RSI'))
+            self.ax_rsi.set_title('RSI Indicator')
+        else:
+            returns = df['Close'].pct_change().to_numpy(dtype=float)
+            self.rsi_line.set_data(*decimate(dates, returns, max_points))
+            self.ax_rsi.set_title('Daily Returns')
+
+        for ax in (self.ax_price, self.ax_ohlc, self.ax_volume, self.ax_rsi):
+            ax.relim()
+            ax.autoscale_view()
+
+        title = f"{result['company']} - Stock Analysis & Prediction"
+        limits = (title,) + tuple(
+            ax.get_xlim() + ax.get_ylim()
+            for ax in (self.ax_price, self.ax_ohlc, self.ax_volume, self.ax_rsi))
+
+        if limits == self._limits and self._background is not None:
+            self._blit()
+        else:
+            # Axes or title changed: one full redraw, which re-caches the background
+            self.figure.suptitle(title, fontsize=16)
+            self._limits = limits
+            self.canvas.draw()
+
+    def _on_draw(self, event):
+        """Cache the static background after every full draw and overlay the lines"""
+        self._background = self.canvas.copy_from_bbox(self.figure.bbox)
+        for line in self.animated_lines:
+            line.axes.draw_artist(line)
+
+    def _blit(self):
+        self.canvas.restore_region(self._background)
+        for line in self.animated_lines:
+            line.axes.draw_artist(line)
+        self.canvas.blit(self.figure.bbox)
+
+    def destroy(self):
+        """Release the canvas and the figure"""
+        self.widget.destroy()
+        self.figure.clear()
+        self._background = None
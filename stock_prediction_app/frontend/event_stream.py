@@ -0,0 +1,102 @@
+import json
+import threading
+
+import requests
+
+# (connect, read) timeouts; the server sends a keep-alive every 15 seconds
+STREAM_TIMEOUT = (3.05, 60)
+
+
+def iter_lines(raw):
+    """Yield decoded lines from a streaming response as soon as they arrive"""
+    read = getattr(raw, 'read1', None)
+    buffer = b''
+    while True:
+        chunk = read(8192) if read is not None else raw.read(1)
+        if not chunk:
+            break
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            yield line.rstrip(b'\r').decode('utf-8')
+
+
+class EventStream:
+    """Background reader for the backend's Server-Sent Events stream
+
+    Runs on its own thread with its own connection, so it never holds one of
+    the API client's pooled connections. Every event is passed to
+    dispatch(event, data) on the reader thread; callers are expected to hand
+    it over to the Tk main thread. Lost connections are retried, resuming
+    from the last event id seen. The stream needs a login, so cookies is the
+    API client's cookie jar and the stream is started once the user is in.
+    """
+
+    def __init__(self, url, companies, dispatch, cookies=None, reconnect_delay=3.0):
+        self.url = url
+        self.companies = companies
+        self.dispatch = dispatch
+        self.reconnect_delay = reconnect_delay
+        self.last_event_id = None
+        self.session = requests.Session()
+        if cookies is not None:
+            self.session.cookies = cookies
+        self._stop = threading.Event()
+        self._response = None
+        self._thread = threading.Thread(target=self._run, name='event-stream', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        response = self._response
+        if response is not None:
+            # Unblocks the reader thread
+            response.close()
+        self.session.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._read_stream()
+            except Exception:
+                # Dropped connection, bad event, or the response was closed by stop()
+                pass
+            self._stop.wait(self.reconnect_delay)
+
+    def _read_stream(self):
+        headers = {'Accept': 'text/event-stream'}
+        if self.last_event_id is not None:
+            headers['Last-Event-ID'] = self.last_event_id
+
+        with self.session.get(self.url, params={'companies': ','.join(self.companies)},
+                              headers=headers, stream=True,
+                              timeout=STREAM_TIMEOUT) as response:
+            response.raise_for_status()
+            self._response = response
+            try:
+                event, data = 'message', []
+                for line in iter_lines(response.raw):
+                    if self._stop.is_set():
+                        return
+                    if not line:
+                        # A blank line ends the event
+                        if data:
+                            self.dispatch(event, json.loads('\n'.join(data)))
+                        event, data = 'message', []
+                    elif line.startswith(':'):
+                        continue
+                    else:
+                        field, _, value = line.partition(':')
+                        value = value[1:] if value.startswith(' ') else value
+                        if field == 'event':
+                            event = value
+                        elif field == 'data':
+                            data.append(value)
+                        elif field == 'id':
+                            self.last_event_id = value
+                        elif field == 'retry' and value.isdigit():
+                            self.reconnect_delay = int(value) / 1000
+            finally:
+                self._response = None
@@ -1,13 +1,30 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
-import requests
 import json
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+import logging
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-import threading
+import os
+from api_client import ApiClient, PREDICT_TIMEOUT
+from response_cache import ResponseCache
+from charts import PredictionChart
+from paged_table import PagedTable
+from event_stream import EventStream
+
+# History table columns that the server can sort by
+HISTORY_SORT_FIELDS = {
+    'Date': 'prediction_date',
+    'Company': 'company',
+    'Model': 'model_used',
+    'Predicted': 'predicted_price',
+    'Target Date': 'target_date',
+    'RMSE': 'rmse'
+}
+HISTORY_FILTERS = {
+    'company': ('Company', ['TCS', 'WIPRO', 'INFOSYS']),
+    'model_used': ('Model', ['LSTM', 'Linear_Regression'])
+}
 
 class StockPredictionApp:
     def __init__(self):
@@ -19,10 +36,25 @@ class StockPredictionApp:
         # Backend URL
         self.backend_url = "http://localhost:5000"
         
+        # Pooled HTTP client; network calls never block the Tk main thread.
+        # Stock data is cached locally (optionally on disk) and revalidated
+        self.api = ApiClient(self.backend_url, self.root,
+                             cache=ResponseCache(cache_dir=os.environ.get('STOCK_APP_CACHE_DIR')))
+        
         # Session variables
         self.current_user = None
         self.is_admin = False
         
+        # Reused across predictions, created on first use
+        self.prediction_chart = None
+        self.chart_result = None
+        
+        # Labels showing live statistics, updated from pushed bars
+        self.price_labels = {}
+        
+        # Live bars and finished predictions pushed by the backend, started at login
+        self.event_stream = None
+        
         # Style configuration
         self.style = ttk.Style()
         self.style.theme_use('clam')
@@ -69,6 +101,12 @@ class StockPredictionApp:
     
     def clear_main_frame(self):
         """Clear all widgets from main frame"""
+        if self.prediction_chart is not None:
+            self.prediction_chart.destroy()
+            self.prediction_chart = None
+        self.chart_result = None
+        self.price_labels = {}
+        
         for widget in self.main_frame.winfo_children():
             widget.destroy()
     
@@ -105,38 +143,49 @@ class StockPredictionApp:
         stats_frame = ttk.LabelFrame(self.home_frame, text="Market Overview", padding=20)
         stats_frame.pack(pady=20, padx=20, fill=tk.X)
         
-        try:
-            # Try to get stock data for quick overview
-            self.load_market_overview(stats_frame)
-        except:
-            overview_label = tk.Label(stats_frame, text="Connect to backend to view market data",
-                                    font=("Arial", 12), bg='#f0f0f0', fg='#e74c3c')
-            overview_label.pack()
+        # Fetched in the background, filled in when the data arrives
+        self.load_market_overview(stats_frame)
     
     def load_market_overview(self, parent):
         """Load quick market overview"""
         companies = ['TCS', 'WIPRO', 'INFOSYS']
         
-        for i, company in enumerate(companies):
-            try:
-                response = requests.get(f"{self.backend_url}/api/stock-data/{company}")
-                if response.status_code == 200:
-                    data = response.json()
-                    stats = data['statistics']
-                    
-                    company_frame = ttk.Frame(parent)
-                    company_frame.pack(fill=tk.X, pady=5)
-                    
-                    company_label = tk.Label(company_frame, text=f"{company}:", 
-                                           font=("Arial", 12, "bold"), width=10, anchor='w')
-                    company_label.pack(side=tk.LEFT)
-                    
-                    price_label = tk.Label(company_frame, 
-                                         text=f"Latest: ₹{stats['latest_price']:.2f} | Avg: ₹{stats['avg_close']:.2f}",
-                                         font=("Arial", 11), anchor='w')
-                    price_label.pack(side=tk.LEFT, padx=10)
-            except:
-                pass
+        def show(results):
+            if not parent.winfo_exists():
+                return
+            
+            shown = 0
+            for company in companies:
+                response = results[f"/api/stock-data/{company}"]
+                if isinstance(response, Exception) or response.status_code != 200:
+                    continue
+                stats = response.json()['statistics']
+                
+                company_frame = ttk.Frame(parent)
+                company_frame.pack(fill=tk.X, pady=5)
+                
+                company_label = tk.Label(company_frame, text=f"{company}:", 
+                                       font=("Arial", 12, "bold"), width=10, anchor='w')
+                company_label.pack(side=tk.LEFT)
+                
+                def overview_text(stats):
+                    return f"Latest: ₹{stats['latest_price']:.2f} | Avg: ₹{stats['avg_close']:.2f}"
+                
+                price_label = tk.Label(company_frame, 
+                                     text=overview_text(stats),
+                                     font=("Arial", 11), anchor='w')
+                price_label.pack(side=tk.LEFT, padx=10)
+                self.price_labels[company] = (price_label, overview_text)
+                shown += 1
+            
+            if not shown:
+                overview_label = tk.Label(parent, text="Connect to backend to view market data",
+                                        font=("Arial", 12), bg='#f0f0f0', fg='#e74c3c')
+                overview_label.pack()
+        
+        # Fetch all companies in parallel
+        self.api.get_many([f"/api/stock-data/{company}" for company in companies], show,
+                          cached=True)
     
     def create_about_page(self):
         """Create about page"""
@@ -262,21 +311,20 @@ class StockPredictionApp:
             messagebox.showerror("Error", "Please enter both username and password")
             return
         
-        try:
-            response = requests.post(f"{self.backend_url}/api/login", 
-                                   json={"username": username, "password": password})
-            
+        def on_response(response):
             if response.status_code == 200:
                 data = response.json()
                 self.current_user = data['user']
                 self.is_admin = data['user']['is_admin']
                 messagebox.showinfo("Success", "Login successful!")
+                self.start_event_stream()
                 self.create_user_dashboard()
             else:
                 error_msg = response.json().get('error', 'Login failed')
                 messagebox.showerror("Error", error_msg)
-        except requests.exceptions.RequestException:
-            messagebox.showerror("Error", "Cannot connect to server. Please ensure backend is running.")
+        
+        self.api.post_async("/api/login", json={"username": username, "password": password},
+                            on_success=on_response, on_error=self.show_backend_error)
     
     def admin_login(self):
         """Handle admin login"""
@@ -287,21 +335,21 @@ class StockPredictionApp:
             messagebox.showerror("Error", "Please enter both username and password")
             return
         
-        try:
-            response = requests.post(f"{self.backend_url}/api/login", 
-                                   json={"username": username, "password": password, "is_admin": True})
-            
+        def on_response(response):
             if response.status_code == 200:
                 data = response.json()
                 self.current_user = data['user']
                 self.is_admin = True
                 messagebox.showinfo("Success", "Admin login successful!")
+                self.start_event_stream()
                 self.create_admin_dashboard()
             else:
                 error_msg = response.json().get('error', 'Login failed')
                 messagebox.showerror("Error", error_msg)
-        except requests.exceptions.RequestException:
-            messagebox.showerror("Error", "Cannot connect to server. Please ensure backend is running.")
+        
+        self.api.post_async("/api/login",
+                            json={"username": username, "password": password, "is_admin": True},
+                            on_success=on_response, on_error=self.show_backend_error)
     
     def register_user(self):
         """Handle user registration"""
@@ -318,10 +366,7 @@ class StockPredictionApp:
             messagebox.showerror("Error", "Passwords do not match")
             return
         
-        try:
-            response = requests.post(f"{self.backend_url}/api/register", 
-                                   json={"username": username, "email": email, "password": password})
-            
+        def on_response(response):
             if response.status_code == 201:
                 messagebox.showinfo("Success", "Registration successful! You can now login.")
                 # Clear form
@@ -332,8 +377,18 @@ class StockPredictionApp:
             else:
                 error_msg = response.json().get('error', 'Registration failed')
                 messagebox.showerror("Error", error_msg)
-        except requests.exceptions.RequestException:
-            messagebox.showerror("Error", "Cannot connect to server. Please ensure backend is running.")
+        
+        self.api.post_async("/api/register",
+                            json={"username": username, "email": email, "password": password},
+                            on_success=on_response, on_error=self.show_backend_error)
+    
+    def show_backend_error(self, error=None):
+        """Report that the backend could not be reached"""
+        messagebox.showerror("Error", "Cannot connect to server. Please ensure backend is running.")
+    
+    def show_connection_error(self, error=None):
+        """Report a failed request from a logged-in page"""
+        messagebox.showerror("Error", "Cannot connect to server")
     
     def create_user_dashboard(self):
         """Create user dashboard"""
@@ -382,12 +437,8 @@ class StockPredictionApp:
         stats_frame = ttk.LabelFrame(self.dash_home_frame, text="Quick Statistics", padding=20)
         stats_frame.pack(pady=20, padx=20, fill=tk.X)
         
-        try:
-            self.load_dashboard_stats(stats_frame)
-        except:
-            error_label = tk.Label(stats_frame, text="Unable to load statistics", 
-                                 font=("Arial", 12), fg='#e74c3c')
-            error_label.pack()
+        # Fetched in the background, filled in when the data arrives
+        self.load_dashboard_stats(stats_frame)
         
         # Quick actions frame
         actions_frame = ttk.LabelFrame(self.dash_home_frame, text="Quick Actions", padding=20)
@@ -407,29 +458,43 @@ class StockPredictionApp:
         """Load dashboard statistics"""
         companies = ['TCS', 'WIPRO', 'INFOSYS']
         
-        for i, company in enumerate(companies):
-            try:
-                response = requests.get(f"{self.backend_url}/api/stock-data/{company}")
-                if response.status_code == 200:
-                    data = response.json()
-                    stats = data['statistics']
-                    
-                    company_frame = ttk.Frame(parent)
-                    company_frame.pack(fill=tk.X, pady=5)
-                    
-                    company_label = tk.Label(company_frame, text=f"{company}:", 
-                                           font=("Arial", 12, "bold"), width=10, anchor='w')
-                    company_label.pack(side=tk.LEFT)
-                    
-                    details = (f"Current: ₹{stats['latest_price']:.2f} | "
-                             f"Avg: ₹{stats['avg_close']:.2f} | "
-                             f"Volatility: {stats['volatility']:.4f}")
-                    
-                    details_label = tk.Label(company_frame, text=details, 
-                                           font=("Arial", 11), anchor='w')
-                    details_label.pack(side=tk.LEFT, padx=10)
-            except:
-                pass
+        def show(results):
+            if not parent.winfo_exists():
+                return
+            
+            shown = 0
+            for company in companies:
+                response = results[f"/api/stock-data/{company}"]
+                if isinstance(response, Exception) or response.status_code != 200:
+                    continue
+                stats = response.json()['statistics']
+                
+                company_frame = ttk.Frame(parent)
+                company_frame.pack(fill=tk.X, pady=5)
+                
+                company_label = tk.Label(company_frame, text=f"{company}:", 
+                                       font=("Arial", 12, "bold"), width=10, anchor='w')
+                company_label.pack(side=tk.LEFT)
+                
+                def details_text(stats):
+                    return (f"Current: ₹{stats['latest_price']:.2f} | "
+                            f"Avg: ₹{stats['avg_close']:.2f} | "
+                            f"Volatility: {stats['volatility']:.4f}")
+                
+                details_label = tk.Label(company_frame, text=details_text(stats), 
+                                       font=("Arial", 11), anchor='w')
+                details_label.pack(side=tk.LEFT, padx=10)
+                self.price_labels[company] = (details_label, details_text)
+                shown += 1
+            
+            if not shown:
+                error_label = tk.Label(parent, text="Unable to load statistics", 
+                                     font=("Arial", 12), fg='#e74c3c')
+                error_label.pack()
+        
+        # Fetch all companies in parallel
+        self.api.get_many([f"/api/stock-data/{company}" for company in companies], show,
+                          cached=True)
     
     def create_prediction_page(self):
         """Create prediction page with charts"""
@@ -466,7 +531,11 @@ class StockPredictionApp:
         self.results_frame = ttk.LabelFrame(self.prediction_frame, text="Prediction Results", padding=10)
         self.results_frame.pack(fill=tk.BOTH, expand=True, pady=5, padx=10)
         
-        # Chart frame
+        # Summary frame (loading message, results, errors)
+        self.summary_frame = ttk.Frame(self.results_frame)
+        self.summary_frame.pack(fill=tk.X)
+        
+        # Chart frame, holds one persistent chart
         self.chart_frame = ttk.Frame(self.results_frame)
         self.chart_frame.pack(fill=tk.BOTH, expand=True)
     
@@ -477,39 +546,35 @@ class StockPredictionApp:
         days = int(self.days_var.get())
         
         # Show loading message
-        for widget in self.results_frame.winfo_children():
+        for widget in self.summary_frame.winfo_children():
             widget.destroy()
         
-        loading_label = tk.Label(self.results_frame, text="Making prediction... Please wait", 
+        loading_label = tk.Label(self.summary_frame, text="Making prediction... Please wait", 
                                font=("Arial", 14), fg='#3498db')
         loading_label.pack(pady=50)
         
-        # Make prediction in separate thread
-        threading.Thread(target=self._predict_thread, args=(company, model, days)).start()
-    
-    def _predict_thread(self, company, model, days):
-        """Prediction thread"""
-        try:
-            response = requests.post(f"{self.backend_url}/api/predict", 
-                                   json={"company": company, "model_type": model, "days_ahead": days})
-            
+        def on_response(response):
             if response.status_code == 200:
-                result = response.json()
-                self.root.after(0, self.display_prediction_result, result)
+                self.display_prediction_result(response.json())
             else:
                 error_msg = response.json().get('error', 'Prediction failed')
-                self.root.after(0, self.show_prediction_error, error_msg)
-        except requests.exceptions.RequestException:
-            self.root.after(0, self.show_prediction_error, "Cannot connect to server")
+                self.show_prediction_error(error_msg)
+        
+        # Make prediction in the background
+        self.api.post_async("/api/predict",
+                            json={"company": company, "model_type": model, "days_ahead": days},
+                            timeout=PREDICT_TIMEOUT,
+                            on_success=on_response,
+                            on_error=lambda e: self.show_prediction_error("Cannot connect to server"))
     
     def display_prediction_result(self, result):
         """Display prediction results with charts"""
-        # Clear results frame
-        for widget in self.results_frame.winfo_children():
+        # Clear previous summary; the chart is kept and updated in place
+        for widget in self.summary_frame.winfo_children():
             widget.destroy()
         
         # Results summary
-        summary_frame = ttk.Frame(self.results_frame)
+        summary_frame = ttk.Frame(self.summary_frame)
         summary_frame.pack(fill=tk.X, pady=10)
         
         # Current price
@@ -537,140 +602,129 @@ class StockPredictionApp:
                             font=("Arial", 10))
         rmse_label.pack(side=tk.RIGHT, padx=10)
         
+        # Where the answer came from
+        forecast = result.get('forecast')
+        if forecast and forecast['source'] == 'precomputed':
+            source_label = tk.Label(summary_frame, 
+                                  text=f"Precomputed {forecast['computed_at']}", 
+                                  font=("Arial", 10), fg='#7f8c8d')
+            source_label.pack(side=tk.RIGHT, padx=10)
+        
         # Create chart
         self.create_prediction_chart(result)
     
     def create_prediction_chart(self, result):
         """Create prediction chart"""
-        # Get historical data
+        # Get historical data in the background, then draw
+        self.api.get_cached_async(f"/api/stock-data/{result['company']}",
+                                  on_success=lambda response: self._draw_prediction_chart(result, response),
+                                  on_error=lambda e: self._show_chart_error(e))
+    
+    def _show_chart_error(self, error):
+        if not self.summary_frame.winfo_exists():
+            return
+        error_label = tk.Label(self.summary_frame, text=f"Chart error: {str(error)}", 
+                             font=("Arial", 12), fg='#e74c3c')
+        error_label.pack(pady=20)
+    
+    def _draw_prediction_chart(self, result, response):
+        """Draw the prediction chart from a stock-data response"""
+        if not self.results_frame.winfo_exists():
+            return
         try:
-            response = requests.get(f"{self.backend_url}/api/stock-data/{result['company']}")
             if response.status_code == 200:
-                data = response.json()['data']
-                df = pd.DataFrame(data)
-                df['Date'] = pd.to_datetime(df['Date'])
+                # Parsed once per cached response; read-only
+                df = response.dataframe()
                 
-                # Create figure
-                fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(12, 8))
-                fig.suptitle(f"{result['company']} - Stock Analysis & Prediction", fontsize=16)
-                
-                # Historical prices with prediction
-                ax1.plot(df['Date'], df['Close'], label='Historical', color='blue', alpha=0.7)
-                
-                # Add prediction points
-                last_date = df['Date'].iloc[-1]
-                pred_dates = [last_date + timedelta(days=i+1) for i in range(len(result['predictions']))]
-                ax1.plot(pred_dates, result['predictions'], 'ro-', label='Predicted', markersize=6)
-                
-                ax1.set_title('Price Prediction')
-                ax1.set_ylabel('Price (₹)')
-                ax1.legend()
-                ax1.grid(True, alpha=0.3)
-                
-                # Candlestick-style chart (simplified)
-                ax2.plot(df['Date'], df['High'], label='High', color='green', alpha=0.6)
-                ax2.plot(df['Date'], df['Low'], label='Low', color='red', alpha=0.6)
-                ax2.plot(df['Date'], df['Close'], label='Close', color='blue', linewidth=2)
-                ax2.set_title('OHLC Data')
-                ax2.set_ylabel('Price (₹)')
-                ax2.legend()
-                ax2.grid(True, alpha=0.3)
-                
-                # Volume chart
-                ax3.bar(df['Date'], df['Volume'], alpha=0.7, color='orange')
-                ax3.set_title('Trading Volume')
-                ax3.set_ylabel('Volume')
-                ax3.grid(True, alpha=0.3)
-                
-                # RSI if available
-                if 'RSI' in df.columns:
-                    ax4.plot(df['Date'], df['RSI'], color='purple', linewidth=2)
-                    ax4.axhline(y=70, color='r', linestyle='--', alpha=0.7, label='Overbought')
-                    ax4.axhline(y=30, color='g', linestyle='--', alpha=0.7, label='Oversold')
-                    ax4.set_title('RSI Indicator')
-                    ax4.set_ylabel('RSI')
-                    ax4.legend()
-                else:
-                    ax4.plot(df['Date'], df['Close'].pct_change(), color='brown')
-                    ax4.set_title('Daily Returns')
-                    ax4.set_ylabel('Return %')
-                
-                ax4.grid(True, alpha=0.3)
-                
-                plt.tight_layout()
-                
-                # Add chart to frame
-                chart_frame = ttk.Frame(self.results_frame)
-                chart_frame.pack(fill=tk.BOTH, expand=True)
-                
-                canvas = FigureCanvasTkAgg(fig, chart_frame)
-                canvas.draw()
-                canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+                if self.prediction_chart is None:
+                    self.prediction_chart = PredictionChart(self.chart_frame)
+                self.prediction_chart.update(df, result)
+                self.chart_result = result
                 
         except Exception as e:
-            error_label = tk.Label(self.results_frame, text=f"Chart error: {str(e)}", 
-                                 font=("Arial", 12), fg='#e74c3c')
-            error_label.pack(pady=20)
+            self._show_chart_error(e)
+    
+    def handle_server_event(self, event, data):
+        """Apply an event pushed by the backend instead of refetching"""
+        if event == 'bar':
+            self.apply_bar(data)
+        elif event == 'prediction':
+            self.refresh_prediction_tables(data)
+    
+    def apply_bar(self, data):
+        """Merge a new bar into the cached history and the widgets showing it"""
+        company = data['company']
+        entry = self.api.cached_entry(f"/api/stock-data/{company}")
+        if entry is None:
+            # Nothing cached yet; the next fetch includes the bar anyway
+            return
+        entry.append_record(dict(data['bar'], **data['indicators']))
+        
+        label, text = self.price_labels.get(company, (None, None))
+        if label is not None and label.winfo_exists():
+            label.config(text=text(entry.json()['statistics']))
+        
+        if (self.prediction_chart is not None and self.chart_result is not None
+                and self.chart_result['company'] == company):
+            self.prediction_chart.update(entry.dataframe(), self.chart_result)
+    
+    def refresh_prediction_tables(self, data):
+        """Reload the visible history table when a prediction finishes
+
+        The server sends prediction events only to the user who ran them and
+        to admins, so every one that arrives belongs in the table shown.
+        """
+        if self.current_user is None:
+            return
+        if self.is_admin:
+            table = getattr(self, 'results_table', None)
+        else:
+            table = getattr(self, 'history_table', None)
+        
+        # Leave the table alone while the user is scrolled into older pages
+        if table is not None and table.tree.winfo_exists() and table.window_start == 0:
+            table.refresh()
     
     def show_prediction_error(self, error_msg):
         """Show prediction error"""
-        for widget in self.results_frame.winfo_children():
+        for widget in self.summary_frame.winfo_children():
             widget.destroy()
         
-        error_label = tk.Label(self.results_frame, text=f"Error: {error_msg}", 
+        error_label = tk.Label(self.summary_frame, text=f"Error: {error_msg}", 
                              font=("Arial", 14), fg='#e74c3c')
         error_label.pack(pady=50)
     
     def create_history_page(self):
         """Create prediction history page"""
-        # Refresh button
-        refresh_btn = ttk.Button(self.history_frame, text="Refresh", command=self.load_history)
-        refresh_btn.pack(anchor=tk.NE, pady=5, padx=10)
-        
-        # History tree
         columns = ('Date', 'Company', 'Model', 'Predicted', 'Target Date', 'RMSE')
-        self.history_tree = ttk.Treeview(self.history_frame, columns=columns, show='headings', height=20)
-        
-        for col in columns:
-            self.history_tree.heading(col, text=col)
-            self.history_tree.column(col, width=120)
         
-        # Scrollbar
-        scrollbar = ttk.Scrollbar(self.history_frame, orient=tk.VERTICAL, command=self.history_tree.yview)
-        self.history_tree.configure(yscrollcommand=scrollbar.set)
-        
-        self.history_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=10, pady=10)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y, pady=10)
+        def format_row(pred):
+            return (
+                pred['prediction_date'][:10],
+                pred['company'],
+                pred['model_used'],
+                f"₹{pred['predicted_price']:.2f}",
+                pred['target_date'],
+                f"{pred['rmse']:.4f}" if pred['rmse'] else 'N/A'
+            )
+        
+        # Rows are paged in from the server as the table scrolls
+        self.history_table = PagedTable(self.history_frame, columns, HISTORY_SORT_FIELDS,
+                                        self.fetch_history_page, format_row,
+                                        filters=HISTORY_FILTERS)
+        self.history_tree = self.history_table.tree
         
         # Load initial data
         self.load_history()
     
     def load_history(self):
         """Load prediction history"""
-        try:
-            response = requests.get(f"{self.backend_url}/api/predictions/history")
-            if response.status_code == 200:
-                predictions = response.json()
-                
-                # Clear existing data
-                for item in self.history_tree.get_children():
-                    self.history_tree.delete(item)
-                
-                # Add new data
-                for pred in predictions:
-                    values = (
-                        pred['prediction_date'][:10],
-                        pred['company'],
-                        pred['model_used'],
-                        f"₹{pred['predicted_price']:.2f}",
-                        pred['target_date'],
-                        f"{pred['rmse']:.4f}" if pred['rmse'] else 'N/A'
-                    )
-                    self.history_tree.insert('', tk.END, values=values)
-            else:
-                messagebox.showerror("Error", "Failed to load history")
-        except requests.exceptions.RequestException:
-            messagebox.showerror("Error", "Cannot connect to server")
+        self.history_table.refresh()
+    
+    def fetch_history_page(self, params, on_success, on_error):
+        """Request one page of prediction history"""
+        self.api.get_async("/api/predictions/history", params=params,
+                           on_success=on_success, on_error=on_error)
     
     def create_change_password_page(self):
         """Create change password page"""
@@ -710,10 +764,7 @@ class StockPredictionApp:
             messagebox.showerror("Error", "New passwords do not match")
             return
         
-        try:
-            response = requests.post(f"{self.backend_url}/api/change-password", 
-                                   json={"current_password": current, "new_password": new})
-            
+        def on_response(response):
             if response.status_code == 200:
                 messagebox.showinfo("Success", "Password changed successfully!")
                 # Clear form
@@ -723,8 +774,10 @@ class StockPredictionApp:
             else:
                 error_msg = response.json().get('error', 'Password change failed')
                 messagebox.showerror("Error", error_msg)
-        except requests.exceptions.RequestException:
-            messagebox.showerror("Error", "Cannot connect to server")
+        
+        self.api.post_async("/api/change-password",
+                            json={"current_password": current, "new_password": new},
+                            on_success=on_response, on_error=self.show_connection_error)
     
     def create_admin_dashboard(self):
         """Create admin dashboard"""
@@ -773,17 +826,14 @@ class StockPredictionApp:
         stats_frame = ttk.LabelFrame(self.admin_home_frame, text="Overview", padding=20)
         stats_frame.pack(pady=20, padx=20, fill=tk.X)
         
-        try:
-            self.load_admin_stats(stats_frame)
-        except:
-            error_label = tk.Label(stats_frame, text="Unable to load statistics", 
-                                 font=("Arial", 12), fg='#e74c3c')
-            error_label.pack()
+        # Fetched in the background, filled in when the data arrives
+        self.load_admin_stats(stats_frame)
     
     def load_admin_stats(self, parent):
         """Load admin statistics"""
-        try:
-            response = requests.get(f"{self.backend_url}/api/admin/statistics")
+        def on_response(response):
+            if not parent.winfo_exists():
+                return
             if response.status_code == 200:
                 stats = response.json()
                 
@@ -812,10 +862,15 @@ class StockPredictionApp:
                 error_label = tk.Label(parent, text="Failed to load statistics", 
                                      font=("Arial", 12), fg='#e74c3c')
                 error_label.pack()
-        except:
+        
+        def on_error(error):
+            if not parent.winfo_exists():
+                return
             error_label = tk.Label(parent, text="Cannot connect to server", 
                                  font=("Arial", 12), fg='#e74c3c')
             error_label.pack()
+        
+        self.api.get_async("/api/admin/statistics", on_success=on_response, on_error=on_error)
     
     def create_admin_users_page(self):
         """Create admin users management page"""
@@ -843,8 +898,9 @@ class StockPredictionApp:
     
     def load_users(self):
         """Load all users"""
-        try:
-            response = requests.get(f"{self.backend_url}/api/admin/users")
+        def on_response(response):
+            if not self.users_tree.winfo_exists():
+                return
             if response.status_code == 200:
                 users = response.json()
                 
@@ -864,60 +920,38 @@ class StockPredictionApp:
                     self.users_tree.insert('', tk.END, values=values)
             else:
                 messagebox.showerror("Error", "Failed to load users")
-        except requests.exceptions.RequestException:
-            messagebox.showerror("Error", "Cannot connect to server")
+        
+        self.api.get_async("/api/admin/users",
+                           on_success=on_response, on_error=self.show_connection_error)
     
     def create_admin_results_page(self):
         """Create admin results page - same as history but for all users"""
-        # Refresh button
-        refresh_btn = ttk.Button(self.admin_results_frame, text="Refresh", command=self.load_all_results)
-        refresh_btn.pack(anchor=tk.NE, pady=5, padx=10)
-        
-        # Results tree
         columns = ('User', 'Date', 'Company', 'Model', 'Predicted', 'Target Date', 'RMSE')
-        self.results_tree = ttk.Treeview(self.admin_results_frame, columns=columns, show='headings', height=20)
         
-        for col in columns:
-            self.results_tree.heading(col, text=col)
-            self.results_tree.column(col, width=100)
-        
-        # Scrollbar
-        results_scrollbar = ttk.Scrollbar(self.admin_results_frame, orient=tk.VERTICAL, command=self.results_tree.yview)
-        self.results_tree.configure(yscrollcommand=results_scrollbar.set)
-        
-        self.results_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=10, pady=10)
-        results_scrollbar.pack(side=tk.RIGHT, fill=tk.Y, pady=10)
+        def format_row(pred):
+            return (
+                pred.get('username', 'Unknown'),
+                pred['prediction_date'][:10],
+                pred['company'],
+                pred['model_used'],
+                f"₹{pred['predicted_price']:.2f}",
+                pred['target_date'],
+                f"{pred['rmse']:.4f}" if pred['rmse'] else 'N/A'
+            )
+        
+        # Rows are paged in from the server as the table scrolls
+        self.results_table = PagedTable(self.admin_results_frame, columns,
+                                        dict(HISTORY_SORT_FIELDS, User='username'),
+                                        self.fetch_history_page, format_row,
+                                        filters=HISTORY_FILTERS, column_width=100)
+        self.results_tree = self.results_table.tree
         
         # Load initial data
         self.load_all_results()
     
     def load_all_results(self):
         """Load all prediction results"""
-        try:
-            response = requests.get(f"{self.backend_url}/api/predictions/history")
-            if response.status_code == 200:
-                predictions = response.json()
-                
-                # Clear existing data
-                for item in self.results_tree.get_children():
-                    self.results_tree.delete(item)
-                
-                # Add new data
-                for pred in predictions:
-                    values = (
-                        pred.get('username', 'Unknown'),
-                        pred['prediction_date'][:10],
-                        pred['company'],
-                        pred['model_used'],
-                        f"₹{pred['predicted_price']:.2f}",
-                        pred['target_date'],
-                        f"{pred['rmse']:.4f}" if pred['rmse'] else 'N/A'
-                    )
-                    self.results_tree.insert('', tk.END, values=values)
-            else:
-                messagebox.showerror("Error", "Failed to load results")
-        except requests.exceptions.RequestException:
-            messagebox.showerror("Error", "Cannot connect to server")
+        self.results_table.refresh()
     
     def create_admin_change_password_page(self):
         """Create admin change password page"""
@@ -957,10 +991,7 @@ class StockPredictionApp:
             messagebox.showerror("Error", "New passwords do not match")
             return
         
-        try:
-            response = requests.post(f"{self.backend_url}/api/change-password", 
-                                   json={"current_password": current, "new_password": new})
-            
+        def on_response(response):
             if response.status_code == 200:
                 messagebox.showinfo("Success", "Admin password changed successfully!")
                 # Clear form
@@ -970,15 +1001,32 @@ class StockPredictionApp:
             else:
                 error_msg = response.json().get('error', 'Password change failed')
                 messagebox.showerror("Error", error_msg)
-        except requests.exceptions.RequestException:
-            messagebox.showerror("Error", "Cannot connect to server")
+        
+        self.api.post_async("/api/change-password",
+                            json={"current_password": current, "new_password": new},
+                            on_success=on_response, on_error=self.show_connection_error)
+    
+    def start_event_stream(self):
+        """Follow the backend's events with the login cookie; they go to the Tk main thread"""
+        self.stop_event_stream()
+        self.event_stream = EventStream(f"{self.backend_url}/api/stream", ['TCS', 'WIPRO', 'INFOSYS'],
+                                        lambda event, data: self.api.call_soon(self.handle_server_event,
+                                                                               event, data),
+                                        cookies=self.api.session.cookies)
+        self.event_stream.start()
+    
+    def stop_event_stream(self):
+        if self.event_stream is not None:
+            self.event_stream.stop()
+            self.event_stream = None
     
     def logout(self):
         """Logout user"""
-        try:
-            requests.post(f"{self.backend_url}/api/logout")
-        except:
-            pass
+        self.stop_event_stream()
+        # Tell the server in the background, then drop the session cookie
+        self.api.post_async("/api/logout",
+                            on_success=lambda response: self.api.clear_session(),
+                            on_error=lambda e: self.api.clear_session())
         
         self.current_user = None
         self.is_admin = False
@@ -997,8 +1045,14 @@ class StockPredictionApp:
     
     def run(self):
         """Run the application"""
-        self.root.mainloop()
-
+        try:
+            self.root.mainloop()
+        finally:
+            self.stop_event_stream()
+            self.api.close()
+    
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
     app = StockPredictionApp()
     app.run()
\ No newline at end of file
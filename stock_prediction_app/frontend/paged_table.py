@@ -0,0 +1,196 @@
+import tkinter as tk
+from tkinter import ttk
+
+
+class PagedTable:
+    """Treeview that pages rows in from the server as the user scrolls
+
+    Only a sliding window of at most max_rows rows is kept in the tree. When
+    the view nears the bottom the next page is requested and the oldest page
+    is dropped from the top (and vice versa when scrolling up), so memory and
+    redraw cost stay flat however long the history is. Rows are inserted in
+    small batches through after() so the UI stays responsive, and sorting and
+    filtering are done by the server.
+
+    fetch_page(params, on_success, on_error) must request one page with the
+    given query parameters and call back on the Tk main thread with the
+    response. format_row(item) turns one returned item into Treeview values.
+    """
+
+    def __init__(self, parent, columns, sort_fields, fetch_page, format_row,
+                 filters=None, page_size=200, max_rows=1000, batch_size=50,
+                 default_sort='prediction_date', column_width=120):
+        self.columns = columns
+        self.sort_fields = sort_fields
+        self.fetch_page = fetch_page
+        self.format_row = format_row
+        self.page_size = page_size
+        self.max_rows = max(max_rows, 2 * page_size)
+        self.batch_size = batch_size
+        self.sort = default_sort
+        self.order = 'desc'
+
+        # Filter bar
+        self.filter_vars = {}
+        toolbar = ttk.Frame(parent)
+        toolbar.pack(fill=tk.X, padx=10, pady=5)
+        for field, (label, values) in (filters or {}).items():
+            ttk.Label(toolbar, text=f"{label}:").pack(side=tk.LEFT, padx=5)
+            var = tk.StringVar(value='')
+            combo = ttk.Combobox(toolbar, textvariable=var, values=[''] + list(values),
+                                 state="readonly", width=18)
+            combo.pack(side=tk.LEFT, padx=5)
+            combo.bind('<<ComboboxSelected>>', lambda e: self.refresh())
+            self.filter_vars[field] = var
+
+        refresh_btn = ttk.Button(toolbar, text="Refresh", command=self.refresh)
+        refresh_btn.pack(side=tk.RIGHT)
+        self.status_label = ttk.Label(toolbar, text="")
+        self.status_label.pack(side=tk.RIGHT, padx=10)
+
+        # Table
+        table_frame = ttk.Frame(parent)
+        table_frame.pack(fill=tk.BOTH, expand=True)
+        self.tree = ttk.Treeview(table_frame, columns=columns, show='headings', height=20)
+        for col in columns:
+            self.tree.heading(col, text=col, command=lambda c=col: self.sort_by(c))
+            self.tree.column(col, width=column_width)
+
+        self.scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self._on_scroll)
+
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=10, pady=10)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y, pady=10)
+
+        self._reset()
+
+    def _reset(self):
+        # Bumped on every reset so late responses for an old query are ignored
+        self.generation = getattr(self, 'generation', 0) + 1
+        self.window_start = 0
+        self.window_end = 0
+        self.total = None
+        self.loading = False
+        self._pending = []
+        self.tree.delete(*self.tree.get_children())
+
+    def refresh(self):
+        """Reload from the first page with the current sort and filters"""
+        self._reset()
+        self._load(0, append=True)
+
+    def sort_by(self, column):
+        field = self.sort_fields.get(column)
+        if field is None:
+            return
+        if field == self.sort:
+            self.order = 'asc' if self.order == 'desc' else 'desc'
+        else:
+            self.sort, self.order = field, 'desc'
+
+        arrow = ' ▲' if self.order == 'asc' else ' ▼'
+        for col in self.columns:
+            self.tree.heading(col, text=col + (arrow if self.sort_fields.get(col) == field else ''))
+        self.refresh()
+
+    def _params(self, offset):
+        params = {'limit': self.page_size, 'offset': offset,
+                  'sort': self.sort, 'order': self.order}
+        for field, var in self.filter_vars.items():
+            if var.get():
+                params[field] = var.get()
+        return params
+
+    def _load(self, offset, append):
+        self.loading = True
+        generation = self.generation
+        self.status_label.config(text="Loading...")
+
+        def on_success(response):
+            if generation != self.generation or not self.tree.winfo_exists():
+                return
+            if response.status_code != 200:
+                self.loading = False
+                self.status_label.config(text="Failed to load")
+                return
+            page = response.json()
+            self.total = page['total']
+            self._add_page(page['items'], offset, append)
+
+        def on_error(error):
+            if generation == self.generation and self.tree.winfo_exists():
+                self.loading = False
+                self.status_label.config(text="Cannot connect to server")
+
+        self.fetch_page(self._params(offset), on_success, on_error)
+
+    def _add_page(self, items, offset, append):
+        # Remember the top visible row so the view can be kept steady
+        children = self.tree.get_children()
+        anchor = None
+        if children:
+            anchor = children[min(int(self.tree.yview()[0] * len(children)), len(children) - 1)]
+
+        if append:
+            rows = [self.format_row(item) for item in items]
+            self.window_end = offset + len(rows)
+            self._pending = [('end', row) for row in rows]
+        else:
+            # Only the rows above the current window are needed
+            rows = [self.format_row(item) for item in items[:self.window_start - offset]]
+            self.window_start = offset
+            # Prepend in reverse so that index 0 inserts keep the original order
+            self._pending = [(0, row) for row in reversed(rows)]
+        self._insert_batch(self.generation, append, anchor)
+
+    def _insert_batch(self, generation, append, anchor):
+        """Insert queued rows a batch at a time, yielding to the event loop in between"""
+        # A reset since this chain started owns _pending now
+        if generation != self.generation or not self.tree.winfo_exists():
+            return
+        batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+        for index, row in batch:
+            self.tree.insert('', index, values=row)
+
+        if self._pending:
+            self.tree.after(1, self._insert_batch, generation, append, anchor)
+            return
+
+        self._trim(append)
+        if anchor is not None and self.tree.exists(anchor):
+            children = self.tree.get_children()
+            self.tree.yview_moveto(self.tree.index(anchor) / len(children))
+        self.loading = False
+        self._update_status()
+
+    def _trim(self, appended):
+        """Drop rows from the far end of the window beyond max_rows"""
+        children = self.tree.get_children()
+        excess = len(children) - self.max_rows
+        if excess <= 0:
+            return
+
+        if appended:
+            self.tree.delete(*children[:excess])
+            self.window_start += excess
+        else:
+            self.tree.delete(*children[-excess:])
+            self.window_end -= excess
+
+    def _update_status(self):
+        if self.total:
+            self.status_label.config(
+                text=f"Rows {self.window_start + 1}–{self.window_end} of {self.total}")
+        else:
+            self.status_label.config(text="No predictions")
+
+    def _on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if self.loading or self.total is None:
+            return
+
+        first, last = float(first), float(last)
+        if last > 0.9 and self.window_end < self.total:
+            self._load(self.window_end, append=True)
+        elif first < 0.1 and self.window_start > 0:
+            self._load(max(0, self.window_start - self.page_size), append=False)
@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class CachedResponse:
+    """A stored 200 response whose JSON and DataFrame are parsed only once
+
+    The parsed objects are shared between every caller that hits the cache,
+    so treat them as read-only.
+    """
+
+    def __init__(self, url, body, etag=None, last_modified=None, stored_at=None):
+        self.url = url
+        self.status_code = 200
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored_at = stored_at if stored_at is not None else time.time()
+        self._json = None
+        self._dataframe = None
+
+    def json(self):
+        if self._json is None:
+            self._json = json.loads(self.body)
+        return self._json
+
+    def dataframe(self, key='data', date_column='Date'):
+        """Return json()[key] as a DataFrame with its date column parsed"""
+        if self._dataframe is None:
+            import pandas as pd
+
+            df = pd.DataFrame(self.json()[key])
+            if date_column in df.columns:
+                df[date_column] = pd.to_datetime(df[date_column])
+            self._dataframe = df
+        return self._dataframe
+
+    def append_record(self, record, key='data', date_column='Date'):
+        """Apply a pushed row to the parsed JSON and DataFrame in place
+
+        The statistics block is brought up to date as well. The raw body and
+        validators no longer describe the parsed data, so the validators are
+        dropped and the next revalidation fetches the full response.
+        """
+        import pandas as pd
+
+        # Parse before touching the rows so the new one is not counted twice
+        df = self.dataframe(key, date_column)
+        data = self.json()
+        rows = data[key]
+        previous = rows[-1] if rows else None
+        replace = previous is not None and previous.get(date_column) == record.get(date_column)
+        if replace:
+            # Same bar again (e.g. an intraday update)
+            rows[-1] = record
+        else:
+            rows.append(record)
+
+        row = pd.DataFrame([record])
+        if date_column in row.columns:
+            row[date_column] = pd.to_datetime(row[date_column])
+        df = pd.concat([df.iloc[:-1] if replace else df, row], ignore_index=True)
+        self._dataframe = df
+
+        stats = data.get('statistics')
+        if stats is not None and 'Close' in df.columns:
+            stats['latest_price'] = float(df['Close'].iloc[-1])
+            stats['avg_close'] = float(df['Close'].mean())
+            if 'Volume' in df.columns:
+                stats['avg_volume'] = float(df['Volume'].mean())
+            if 'Daily_Return' in df.columns:
+                stats['volatility'] = float(df['Daily_Return'].std())
+
+        self.etag = None
+        self.last_modified = None
+        self.stored_at = time.time()
+
+    def to_dict(self):
+        return {'url': self.url, 'body': self.body, 'etag': self.etag,
+                'last_modified': self.last_modified, 'stored_at': self.stored_at}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['url'], data['body'], data.get('etag'),
+                   data.get('last_modified'), data.get('stored_at'))
+
+
+class ResponseCache:
+    """In-memory LRU of GET responses keyed by URL, with an optional disk store
+
+    Entries younger than max_age seconds are served without touching the
+    network. Older entries are revalidated with If-None-Match /
+    If-Modified-Since, and a 304 reply reuses the stored (already parsed)
+    entry.
+    """
+
+    def __init__(self, max_entries=64, max_age=10.0, cache_dir=None):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.cache_dir = cache_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+                return entry
+
+        entry = self._load(url)
+        if entry is not None:
+            self._remember(url, entry)
+        return entry
+
+    def count(self, outcome):
+        """Bump the hits, revalidated or misses counter; safe from any thread"""
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'revalidated': self.revalidated,
+                    'misses': self.misses, 'entries': len(self._entries)}
+
+    def is_fresh(self, entry):
+        return time.time() - entry.stored_at < self.max_age
+
+    def put(self, url, entry):
+        self._remember(url, entry)
+        self._save(entry)
+
+    def touch(self, entry):
+        """Mark an entry as just revalidated"""
+        entry.stored_at = time.time()
+        self._save(entry)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _remember(self, url, entry):
+        with self._lock:
+            self._entries[url] = entry
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _path(self, url):
+        digest = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f'{digest}.json')
+
+    def _load(self, url):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._path(url)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return CachedResponse.from_dict(data) if data.get('url') == url else None
+
+    def _save(self, entry):
+        if not self.cache_dir:
+            return
+        path = self._path(entry.url)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(entry.to_dict(), f)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
@@ -6,6 +6,7 @@ Run this script to start the Flask backend server
 
 import os
 import sys
+import argparse
 
 # Add backend directory to Python path
 backend_dir = os.path.join(os.path.dirname(__file__), 'backend')
@@ -15,9 +16,29 @@ sys.path.insert(0, backend_dir)
 os.chdir(backend_dir)
 
 # Import and run the Flask app
-from app import app, init_db
+from app import app, init_db, forecasts
+from ingestion import start_ingestion
+from forecast_table import MODELS, start_scheduler
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stock Market Prediction Backend Server')
+    parser.add_argument('--no-lstm', action='store_true',
+                        help='Serve data and Linear_Regression routes only, without loading TensorFlow')
+    parser.add_argument('--ingest', metavar='SOURCE',
+                        help='Ingest live bars from replay, tail:PATH or socket:PORT')
+    parser.add_argument('--replay-speed', type=float, default=86400.0,
+                        help='Replay speed as a multiple of market time (default: one day per second)')
+    parser.add_argument('--keep-replay', action='store_true',
+                        help='Keep replayed bars in the real bar files (by default they go to a scratch store)')
+    parser.add_argument('--precompute', action='store_true',
+                        help='Keep the standard forecasts precomputed in background worker processes')
+    parser.add_argument('--forecast-workers', type=int, default=2,
+                        help='Worker processes for precomputed forecasts (default: 2)')
+    args = parser.parse_args()
+    
+    if args.no_lstm:
+        app.config['LSTM_ENABLED'] = False
+    
     print("🚀 Starting Stock Market Prediction Backend Server...")
     print("📊 Initializing database...")
     
@@ -25,6 +46,15 @@ if __name__ == '__main__':
     init_db()
     
     print("✅ Database initialized successfully!")
+    if args.ingest:
+        start_ingestion(args.ingest, speed=args.replay_speed, keep_replay=args.keep_replay)
+        print(f"📡 Ingesting bars from {args.ingest}")
+    if args.precompute:
+        models = MODELS if app.config['LSTM_ENABLED'] else ['Linear_Regression']
+        start_scheduler(forecasts, workers=args.forecast_workers, models=models)
+        print(f"🗓 Precomputing standard forecasts with {args.forecast_workers} workers")
+    if not app.config['LSTM_ENABLED']:
+        print("🪶 LSTM disabled: serving data and Linear_Regression routes only")
     print("🌐 Server starting on http://localhost:5000")
     print("🔗 Frontend should connect to this URL")
     print("🛑 Press Ctrl+C to stop the server")
@@ -32,7 +62,9 @@ if __name__ == '__main__':
     
     try:
         # Run the Flask app
-        app.run(debug=True, host='0.0.0.0', port=5000)
+        # The reloader would start a second pipeline/scheduler in its watcher process
+        app.run(debug=True, host='0.0.0.0', port=5000,
+                use_reloader=not (args.ingest or args.precompute))
     except KeyboardInterrupt:
         print("\n🛑 Server stopped by user")
     except Exception as e:
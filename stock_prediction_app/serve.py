@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+Stock Market Prediction production server
+
+A prefork master binds the port, loads the price store and the forecast
+table once, and forks worker processes that share those pages copy-on-write.
+Each worker serves requests from a fixed pool of threads. Model training
+runs in a small spawn-context process pool per worker (training_pool), and
+precomputed forecasts in one more forked process, so CPU-bound fits never
+hold request threads. Event streams do hold one each, so they are capped
+at --max-streams per worker.
+
+The master replaces the workers gracefully (new generation first, then the
+old one drains and exits) on SIGHUP, and by itself when price files, the
+model registry or the forecast table change. SIGTERM or Ctrl+C drains and
+stops everything. Unix only; use run_backend.py for development.
+"""
+
+import argparse
+import gc
+import glob
+import logging
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Add backend directory to Python path
+backend_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend')
+sys.path.insert(0, backend_dir)
+
+# Change to backend directory
+os.chdir(backend_dir)
+
+if not hasattr(os, 'fork'):
+    sys.exit("serve.py needs fork(); run run_backend.py on this platform")
+
+# Workers export their metrics here so /metrics covers every process
+OWN_METRICS_DIR = None
+if not os.environ.get('STOCK_APP_METRICS_DIR'):
+    OWN_METRICS_DIR = tempfile.mkdtemp(prefix='stock-app-metrics-')
+    os.environ['STOCK_APP_METRICS_DIR'] = OWN_METRICS_DIR
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler, select_address_family
+
+import app as app_module
+import metrics
+import model_registry
+import training_pool
+from events import broadcaster
+from forecast_table import MODELS, start_scheduler
+from price_store import store as price_store
+
+
+class RequestHandler(WSGIRequestHandler):
+    # One request per connection: an idle keep-alive client would otherwise
+    # hold one of the worker's pool threads
+    protocol_version = 'HTTP/1.0'
+    # Seconds a client may take to send its request
+    timeout = 30
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """werkzeug's WSGI server on an inherited socket, with a fixed thread pool"""
+
+    multithread = True
+
+    def __init__(self, host, port, app, threads, fd):
+        super().__init__(host, port, app, handler=RequestHandler, fd=fd)
+        # Sibling workers accept on the same socket; whoever loses the race
+        # must get EAGAIN instead of blocking in accept()
+        self.socket.setblocking(False)
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='request')
+
+    def process_request(self, request, client_address):
+        request.setblocking(True)
+        self.executor.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def _reset_signals():
+    for signum in (signal.SIGTERM, signal.SIGHUP, signal.SIGCHLD):
+        signal.signal(signum, signal.SIG_DFL)
+    # Ctrl+C reaches the whole process group; the master decides what stops
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def run_worker(listener, options):
+    """Serve requests until SIGTERM, then finish the ones in flight; never returns"""
+    _reset_signals()
+    server = PooledWSGIServer(options.host, options.port, app_module.app, options.threads,
+                              listener.fileno())
+    listener.close()
+    # Logins wait for their hash on a request thread; keep half the pool for
+    # everything else
+    app_module.auth.limit_waiters(options.threads)
+    # Each open /api/stream holds a request thread for as long as it lasts
+    broadcaster.max_subscribers = options.max_streams
+    signal.signal(signal.SIGTERM,
+                  lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    metrics.start()
+    # Pays the training processes' start-up before the first prediction does
+    training_pool.start()
+
+    status = 0
+    try:
+        server.serve_forever()
+        server.executor.shutdown(wait=True)
+    except Exception as e:
+        print(f"❌ Worker {os.getpid()} failed: {e}")
+        status = 1
+    finally:
+        training_pool.shutdown()
+        metrics.flush()
+        sys.stdout.flush()
+        os._exit(status)
+
+
+def run_forecasts(listener, options):
+    """Keep the standard forecasts precomputed until SIGTERM; never returns"""
+    _reset_signals()
+    listener.close()
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    metrics.start()
+
+    models = MODELS if app_module.app.config['LSTM_ENABLED'] else ['Linear_Regression']
+    scheduler = start_scheduler(app_module.forecasts, workers=options.forecast_workers,
+                                models=models)
+    try:
+        while not stop.wait(1.0):
+            pass
+        # os._exit would leave the scheduler's pool processes behind
+        scheduler.stop(wait=True)
+    finally:
+        metrics.flush()
+        sys.stdout.flush()
+        os._exit(0)
+
+
+class Master:
+    """Forks, watches and replaces the worker processes"""
+
+    def __init__(self, listener, options):
+        self.listener = listener
+        self.options = options
+        self.generation = 0
+        # pid -> (generation, time started)
+        self.workers = {}
+        # pid -> kill deadline, for workers told to stop
+        self.retiring = {}
+        self.forecast_pid = None
+        self.sources = None
+        self.reload_requested = False
+        self.stopping = False
+        self.respawn_after = 0.0
+
+    # State shared with the workers
+
+    def preload(self):
+        """Load every company's series and frame, and the forecast table"""
+        started = time.perf_counter()
+        price_store.reload()
+        companies = 0
+        for company in self.companies():
+            try:
+                price_store.frame(company)
+                companies += 1
+            except (FileNotFoundError, ValueError) as e:
+                print(f"⚠️ Skipping {company}: {e}")
+        app_module.forecasts.load()
+        # Preloaded objects are never collected; keep the collector from
+        # writing to (and so copying) their pages in every worker
+        gc.unfreeze()
+        gc.collect()
+        gc.freeze()
+        print(f"📦 Preloaded {companies} companies in {time.perf_counter() - started:.2f}s")
+
+    def companies(self):
+        names = set()
+        for directory, suffix in ((price_store.data_dir, '_stock_data.csv'),
+                                  (price_store.bar_dir, '_bars.bin')):
+            for path in glob.glob(os.path.join(directory, f'*{suffix}')):
+                names.add(os.path.basename(path)[:-len(suffix)].upper())
+        return sorted(names)
+
+    def watched_sources(self):
+        """Fingerprint of the data behind the preloaded state"""
+        files = []
+        for directory, pattern in ((price_store.data_dir, '*_stock_data.csv'),
+                                   (price_store.bar_dir, '*_bars.bin'),
+                                   (os.path.dirname(model_registry.REGISTRY_PATH),
+                                    os.path.basename(model_registry.REGISTRY_PATH))):
+            for path in sorted(glob.glob(os.path.join(directory, pattern))):
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((path, stat.st_mtime_ns, stat.st_size))
+
+        conn = app_module.connect_db()
+        try:
+            app_module.forecasts.ensure_schema(conn)
+            forecasts = conn.execute('SELECT COUNT(*), MAX(computed_at) FROM forecasts').fetchone()
+        finally:
+            conn.close()
+        return files, forecasts
+
+    # Processes
+
+    def fork(self, target):
+        pid = os.fork()
+        if pid == 0:
+            target(self.listener, self.options)
+        return pid
+
+    def spawn_worker(self):
+        pid = self.fork(run_worker)
+        self.workers[pid] = (self.generation, time.monotonic())
+
+    def spawn_generation(self):
+        self.generation += 1
+        for _ in range(self.options.workers):
+            self.spawn_worker()
+
+    def retire(self, pid):
+        if pid in self.retiring:
+            return
+        self.retiring[pid] = time.monotonic() + self.options.graceful_timeout
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+
+            code = os.waitstatus_to_exitcode(status)
+            retired = self.retiring.pop(pid, None) is not None
+            if pid == self.forecast_pid:
+                self.forecast_pid = None
+                if not self.stopping:
+                    print(f"⚠️ Forecast process exited with status {code}; restarting")
+                continue
+            generation, started = self.workers.pop(pid, (None, None))
+            if generation is None or retired or self.stopping:
+                continue
+            print(f"⚠️ Worker {pid} exited with status {code}; starting a new one")
+            if time.monotonic() - started < 1.0:
+                # Dying on startup: don't fork in a tight loop
+                self.respawn_after = time.monotonic() + 1.0
+
+    def maintain(self):
+        """Replace workers of the current generation that died"""
+        if time.monotonic() < self.respawn_after:
+            return
+        current = sum(1 for generation, _ in self.workers.values()
+                      if generation == self.generation)
+        for _ in range(self.options.workers - current):
+            self.spawn_worker()
+        if self.options.precompute and self.forecast_pid is None:
+            self.forecast_pid = self.fork(run_forecasts)
+
+    def kill_overdue(self):
+        now = time.monotonic()
+        for pid, deadline in list(self.retiring.items()):
+            if now > deadline:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+    def reload(self, reason, restart_forecasts=True):
+        """Start a generation on fresh state, then drain the old one"""
+        print(f"🔄 Reloading workers ({reason})")
+        old = [pid for pid, (generation, _) in self.workers.items()
+               if generation == self.generation]
+        try:
+            self.preload()
+        except Exception as e:
+            print(f"❌ Reload failed, keeping the current workers: {e}")
+            return
+        self.sources = self.watched_sources()
+        self.spawn_generation()
+        for pid in old:
+            self.retire(pid)
+        if restart_forecasts and self.forecast_pid is not None:
+            # Its price store is as old as the workers'; maintain() forks a new one
+            self.retire(self.forecast_pid)
+            self.forecast_pid = None
+
+    # Main loop
+
+    def run(self):
+        signal.signal(signal.SIGHUP, self._request_reload)
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+
+        self.preload()
+        self.sources = self.watched_sources()
+        self.spawn_generation()
+        next_check = time.monotonic() + self.options.reload_check
+
+        while not self.stopping:
+            self.reap()
+            if self.reload_requested:
+                self.reload_requested = False
+                self.reload('SIGHUP')
+            elif self.options.reload_check and time.monotonic() >= next_check:
+                next_check = time.monotonic() + self.options.reload_check
+                files, forecasts = self.watched_sources()
+                if files != self.sources[0]:
+                    self.reload('data or models changed')
+                elif forecasts != self.sources[1]:
+                    # New precomputed forecasts; the forecast process is already current
+                    self.reload('forecasts refreshed', restart_forecasts=False)
+            self.kill_overdue()
+            self.maintain()
+            time.sleep(0.2)
+
+        self.shutdown()
+
+    def _request_reload(self, signum, frame):
+        self.reload_requested = True
+
+    def _request_stop(self, signum, frame):
+        self.stopping = True
+
+    def shutdown(self):
+        print("🛑 Stopping workers...")
+        for pid in list(self.workers) + ([self.forecast_pid] if self.forecast_pid else []):
+            self.retire(pid)
+        while self.workers or self.forecast_pid is not None:
+            self.reap()
+            self.kill_overdue()
+            if not self.retiring:
+                break
+            time.sleep(0.1)
+        self.listener.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stock Market Prediction production server')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='request-serving processes (default: one per CPU)')
+    parser.add_argument('--threads', type=int, default=8,
+                        help='request threads per worker (default: 8)')
+    parser.add_argument('--max-streams', type=int, default=None,
+                        help='open /api/stream connections per worker, fewer than --threads; '
+                             'more get a 503 (default: a quarter of --threads)')
+    parser.add_argument('--training-processes', type=int, default=1,
+                        help='on-demand training processes per worker, 0 to train in the '
+                             'request thread (default: 1)')
+    parser.add_argument('--no-lstm', action='store_true',
+                        help='Serve data and Linear_Regression routes only, without loading TensorFlow')
+    parser.add_argument('--precompute', action='store_true',
+                        help='Keep the standard forecasts precomputed in a background process')
+    parser.add_argument('--forecast-workers', type=int, default=2,
+                        help='Worker processes for precomputed forecasts (default: 2)')
+    parser.add_argument('--reload-check', type=float, default=5.0,
+                        help='seconds between checks for changed data and models, 0 to only '
+                             'reload on SIGHUP (default: 5)')
+    parser.add_argument('--graceful-timeout', type=float, default=30.0,
+                        help='seconds a stopping worker may spend finishing requests (default: 30)')
+    parser.add_argument('--access-log', action='store_true', help='log every request')
+    args = parser.parse_args()
+    if args.max_streams is None:
+        args.max_streams = min(max(1, args.threads // 4), args.threads - 1)
+    if not 0 <= args.max_streams < args.threads:
+        parser.error('--max-streams must be at least 0 and less than --threads')
+
+    if args.no_lstm:
+        app_module.app.config['LSTM_ENABLED'] = False
+    if not args.access_log:
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    training_pool.configure(args.training_processes)
+
+    print("🚀 Starting Stock Market Prediction production server...")
+    app_module.init_db()
+    listener = socket.create_server((args.host, args.port),
+                                    family=select_address_family(args.host, args.port),
+                                    backlog=1024)
+    print(f"🌐 Listening on http://{args.host}:{args.port} with {args.workers} workers "
+          f"x {args.threads} threads")
+    if args.precompute:
+        print(f"🗓 Precomputing standard forecasts with {args.forecast_workers} workers")
+    if not app_module.app.config['LSTM_ENABLED']:
+        print("🪶 LSTM disabled: serving data and Linear_Regression routes only")
+    print(f"🔄 Send SIGHUP to {os.getpid()} to reload; Ctrl+C to stop")
+    print("-" * 50)
+
+    try:
+        Master(listener, args).run()
+    finally:
+        if OWN_METRICS_DIR is not None:
+            shutil.rmtree(OWN_METRICS_DIR, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,11 @@
+import os
+import sys
+
+# Backend modules import each other by bare name, as they do when the
+# server runs from backend/; the desktop client's modules do the same from
+# frontend/ (the two share no module names)
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(APP_DIR, 'backend')
+FRONTEND_DIR = os.path.join(APP_DIR, 'frontend')
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, FRONTEND_DIR)
@@ -0,0 +1,30 @@
+"""Importing the app must stay cheap: no TensorFlow until the first LSTM use"""
+
+import json
+import os
+import subprocess
+import sys
+
+from conftest import BACKEND_DIR
+
+# Seconds the import may take; TensorFlow alone costs several
+IMPORT_BUDGET_SECONDS = float(os.environ.get('STOCK_APP_IMPORT_BUDGET', '3.0'))
+
+PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+import app
+print(json.dumps({'seconds': time.perf_counter() - started,
+                  'modules': [name for name in ('tensorflow', 'keras') if name in sys.modules]}))
+'''
+
+
+def test_app_import_skips_tensorflow_and_meets_budget(tmp_path):
+    env = dict(os.environ, STOCK_APP_DB=str(tmp_path / 'import.db'))
+    # A fresh interpreter, so nothing imported by other tests is already loaded
+    output = subprocess.run([sys.executable, '-c', PROBE], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, timeout=120, check=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+
+    assert result['modules'] == []
+    assert result['seconds'] < IMPORT_BUDGET_SECONDS
@@ -0,0 +1,59 @@
+"""Parity of the NumPy inference engine with Keras"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip('tensorflow')
+
+from lstm_runtime import NumpyEngine, check_parity
+from ml_models import StockPredictor
+
+LOOKBACK = 10
+ATOL = 1e-4
+
+
+def build_model(variant, units=8, seed=0):
+    """Small model of a StockPredictor variant with random (non-zero) weights"""
+    model = StockPredictor().create_lstm_model((LOOKBACK, 1), units=units, variant=variant)
+    rng = np.random.default_rng(seed)
+    model.set_weights([rng.normal(0, 0.5, w.shape).astype(np.float32)
+                       for w in model.get_weights()])
+    return model
+
+
+def windows(n=64, seed=1):
+    return np.random.default_rng(seed).random((n, LOOKBACK, 1), dtype=np.float32)
+
+
+@pytest.mark.parametrize('variant', ['stacked_lstm', 'lstm', 'gru', 'tcn'])
+def test_numpy_engine_matches_keras(variant):
+    model = build_model(variant)
+    x = windows()
+    engine = NumpyEngine.from_keras(model, lookback_period=LOOKBACK)
+    expected = model.predict(x, verbose=0)
+    actual = engine.predict(x)
+
+    assert actual.shape == expected.shape
+    np.testing.assert_allclose(actual, expected, atol=ATOL)
+    assert engine.metadata['lookback_period'] == LOOKBACK
+
+
+def test_numpy_engine_rollout_matches_keras():
+    """Feeding predictions back in, as predict_lstm does, does not drift apart"""
+    model = build_model('stacked_lstm')
+    engine = NumpyEngine.from_keras(model)
+
+    keras_window = engine_window = windows(1)
+    for _ in range(10):
+        keras_step = model.predict(keras_window, verbose=0)
+        engine_step = engine.predict(engine_window)
+        np.testing.assert_allclose(engine_step, keras_step, atol=ATOL)
+        keras_window = np.append(keras_window[:, 1:], keras_step.reshape(1, 1, 1), axis=1)
+        engine_window = np.append(engine_window[:, 1:], engine_step.reshape(1, 1, 1), axis=1)
+
+
+def test_check_parity():
+    reference = np.array([[0.5], [0.25]])
+    assert check_parity(reference + 5e-5, reference)
+    assert not check_parity(reference + 1e-3, reference)
+    assert not check_parity(reference[:1], reference)
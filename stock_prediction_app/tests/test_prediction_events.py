@@ -0,0 +1,105 @@
+"""Prediction events reach the right streams and refresh the right tables"""
+
+import io
+import json
+
+import pytest
+
+import events
+from event_stream import iter_lines
+from main import StockPredictionApp
+
+RESULT = {'company': 'TCS', 'model_used': 'LSTM', 'predicted_price': 101.5,
+          'price_change_percent': 1.5, 'days_ahead': 5}
+
+
+class FakeTable:
+    """Just enough of a PagedTable for refresh_prediction_tables"""
+
+    class tree:
+        @staticmethod
+        def winfo_exists():
+            return True
+
+    def __init__(self):
+        self.window_start = 0
+        self.refreshed = 0
+
+    def refresh(self):
+        self.refreshed += 1
+
+
+def client(user_id, is_admin=False):
+    """A logged-in desktop client without its Tk widgets"""
+    app = StockPredictionApp.__new__(StockPredictionApp)
+    app.current_user = {'id': user_id}
+    app.is_admin = is_admin
+    app.history_table = FakeTable()
+    app.results_table = FakeTable()
+    return app
+
+
+def deliver(subscription, app):
+    """Parse the queued SSE payloads as the client does and dispatch them"""
+    payloads = []
+    while not subscription.queue.empty():
+        payloads.append(subscription.queue.get_nowait())
+
+    event, data = 'message', []
+    for line in iter_lines(io.BytesIO(b''.join(payloads))):
+        if not line:
+            if data:
+                app.handle_server_event(event, json.loads('\n'.join(data)))
+            event, data = 'message', []
+        elif line.startswith('event: '):
+            event = line[len('event: '):]
+        elif line.startswith('data: '):
+            data.append(line[len('data: '):])
+    return len(payloads)
+
+
+@pytest.fixture
+def broadcaster(monkeypatch):
+    broadcaster = events.EventBroadcaster()
+    monkeypatch.setattr(events, 'broadcaster', broadcaster)
+    return broadcaster
+
+
+def test_prediction_refreshes_owner_and_admin_tables(broadcaster):
+    owner, other, admin = client(1), client(2), client(3, is_admin=True)
+    streams = {
+        'owner': (broadcaster.subscribe(['TCS'], user_id=1), owner),
+        'other': (broadcaster.subscribe(['TCS'], user_id=2), other),
+        'admin': (broadcaster.subscribe(['TCS'], user_id=3, admin=True), admin)
+    }
+
+    events.publish_prediction(RESULT, 1)
+    delivered = {name: deliver(subscription, app) for name, (subscription, app) in streams.items()}
+
+    assert delivered == {'owner': 1, 'other': 0, 'admin': 1}
+    assert (owner.history_table.refreshed, owner.results_table.refreshed) == (1, 0)
+    assert (other.history_table.refreshed, other.results_table.refreshed) == (0, 0)
+    assert (admin.history_table.refreshed, admin.results_table.refreshed) == (0, 1)
+
+
+def test_replay_keeps_predictions_private(broadcaster):
+    events.publish_prediction(RESULT, 1)
+
+    other = client(2)
+    assert deliver(broadcaster.subscribe(['TCS'], last_event_id=0, user_id=2), other) == 0
+
+    admin = client(3, is_admin=True)
+    assert deliver(broadcaster.subscribe(['TCS'], last_event_id=0, user_id=3, admin=True),
+                   admin) == 1
+    assert admin.results_table.refreshed == 1
+
+
+def test_scrolled_table_is_left_alone(broadcaster):
+    owner = client(1)
+    owner.history_table.window_start = 200
+    subscription = broadcaster.subscribe(['TCS'], user_id=1)
+
+    events.publish_prediction(RESULT, 1)
+    deliver(subscription, owner)
+
+    assert owner.history_table.refreshed == 0